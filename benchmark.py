@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from boundary_store import read_boundaries
+from cache import cache_path
+from publish import json_literals
+
+RESULTS_PATH = "benchmark_results.jsonl"
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+CSV_COLUMNS = [
+    "S/N", "Company Name", "Category", "Commodity", "Office Address", "Contact Person",
+    "Phone number", "Designation", "Email/Website", "Latitude", "Longitude",
+]
+CATEGORIES = ["Contract Farming", "Seeds Company", "Aggregator", "Processors", "Fertilizer Company"]
+COMMODITIES = ["Maize", "Rice", "Ginger", "Cowpea", "Soybean", "Sorghum", "Tomato", "Fertilizer", "Seeds"]
+DESIGNATIONS = ["CEO/MD", "General Manager", "Manager", "Director", "Sales Officer"]
+SYLLABLES = ["ka", "du", "na", "za", "ri", "ba", "gi", "wa", "lo", "mu", "sa", "ye", "ro", "tu", "ha"]
+
+# Generator modes and the largest row count each is run at by default
+# (one folium object per row does not finish at a million rows)
+MODES = {
+    "markers": 100_000,
+    "marker_cluster": 100_000,
+    "columnar": None,
+    "canvas": None,
+    "heatmap": None,
+    "heat_raster": None,
+    "geojson_boundaries": None,
+    "simplified_boundaries": None,
+}
+
+
+def sample_points(n, boundaries="lga_boundaries.geojson", seed=0):
+    """``n`` uniform random points inside the boundary polygons (rejection sampling)."""
+    rng = np.random.default_rng(seed)
+    union = shapely.union_all(read_boundaries(boundaries, columns=[]).geometry.dropna().values)
+    shapely.prepare(union)
+    west, south, east, north = union.bounds
+    fill = union.area / ((east - west) * (north - south))
+
+    lat, lng = np.empty(0), np.empty(0)
+    while len(lat) < n:
+        m = int((n - len(lat)) / fill * 1.2) + 16
+        x, y = rng.uniform(west, east, m), rng.uniform(south, north, m)
+        inside = shapely.contains_xy(union, x, y)
+        lat, lng = np.concatenate([lat, y[inside]]), np.concatenate([lng, x[inside]])
+    return lat[:n], lng[:n]
+
+
+def synthesize(n, boundaries="lga_boundaries.geojson", seed=0):
+    """A stakeholder frame with the real CSV schema and ``n`` rows."""
+    rng = np.random.default_rng(seed)
+    lat, lng = sample_points(n, boundaries, seed)
+
+    def words(count):
+        parts = rng.choice(SYLLABLES, size=(n, count))
+        return pd.Series(["".join(row) for row in parts]).str.title()
+
+    first, second = words(3), words(2)
+    commodity = pd.Series(rng.choice(COMMODITIES, n))
+    pair = rng.random(n) < 0.4
+    commodity[pair] = commodity[pair] + " & " + pd.Series(rng.choice(COMMODITIES, n))[pair]
+
+    return pd.DataFrame({
+        "S/N": np.arange(1, n + 1),
+        "Company Name": first + " " + second + " Ltd",
+        "Category": rng.choice(CATEGORIES, n),
+        "Commodity": commodity,
+        "Office Address": "No " + pd.Series(rng.integers(1, 200, n)).astype(str) + " " + second + " Road, Kaduna",
+        "Contact Person": words(2) + " " + words(3),
+        "Phone number": "080" + pd.Series(rng.integers(10_000_000, 99_999_999, n)).astype(str),
+        "Designation": rng.choice(DESIGNATIONS, n),
+        "Email/Website": first.str.lower() + "@example.com",
+        "Latitude": lat.round(8),
+        "Longitude": lng.round(8),
+    }, columns=CSV_COLUMNS)
+
+
+def synthetic_csv(n, boundaries="lga_boundaries.geojson", seed=0):
+    """Path of a cached synthetic CSV with ``n`` rows."""
+    path = cache_path("bench", f"stakeholders-{n}-{seed}", "csv")
+    if not os.path.exists(path):
+        synthesize(n, boundaries, seed).to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+def build(mode, df, out_html):
+    """Build one page in ``mode`` the way the map scripts do."""
+    import folium
+    from folium.plugins import HeatMap, MarkerCluster
+
+    from boundaries import load_boundaries
+    from canvas_layer import add_canvas_markers
+    from heat_raster import add_heat_raster
+    from marker_layer import add_columnar_markers
+
+    m = folium.Map(location=[df["Latitude"].mean(), df["Longitude"].mean()], zoom_start=8)
+    if mode in ("markers", "marker_cluster"):
+        target = MarkerCluster().add_to(m) if mode == "marker_cluster" else m
+        for lat, lng, name, category in zip(df["Latitude"], df["Longitude"], df["Company Name"], df["Category"]):
+            folium.Marker(
+                location=[lat, lng],
+                popup=folium.Popup(f"<b>Company:</b> {name}<br><b>Category:</b> {category}", max_width=300),
+                tooltip=name,
+            ).add_to(target)
+    elif mode == "columnar":
+        add_columnar_markers(m, df, target=MarkerCluster().add_to(m))
+    elif mode == "canvas":
+        add_canvas_markers(m, df)
+    elif mode == "heatmap":
+        HeatMap(df[["Latitude", "Longitude"]].values.tolist(), radius=10).add_to(m)
+    elif mode == "heat_raster":
+        add_heat_raster(m, df, radius=10)
+    elif mode == "geojson_boundaries":
+        with open("lga_boundaries.geojson", encoding="utf-8") as f:
+            folium.GeoJson(json.load(f), name="LGA Boundaries").add_to(m)
+    elif mode == "simplified_boundaries":
+        folium.GeoJson(load_boundaries("lga_boundaries.geojson", properties=["lganame", "lgacode"]),
+                       name="LGA Boundaries").add_to(m)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    m.save(out_html)
+
+
+def run_case(mode, csv_path, out_html):
+    """Measure one build in this (fresh) process; returns the metrics dict.
+
+    The clock covers the map build only: the CSV is loaded and the map
+    modules are imported first. Peak RSS is for the whole process. Run it
+    through ``run_suite`` so every stage cache starts empty.
+    """
+    import folium.plugins  # noqa: F401
+    import boundaries, canvas_layer, heat_raster, marker_layer  # noqa: F401,E401
+    from loader import load_stakeholders
+
+    df = load_stakeholders(csv_path, use_cache=False)
+    start = time.perf_counter()
+    build(mode, df, out_html)
+    elapsed = time.perf_counter() - start
+
+    with open(out_html, encoding="utf-8") as f:
+        page = f.read()
+    spans = json_literals(page)
+    parse_start = time.perf_counter()
+    for begin, end in spans:
+        json.loads(page[begin:end])
+    parse = time.perf_counter() - parse_start
+
+    metrics = {
+        "build_s": round(elapsed, 4),
+        "html_bytes": len(page.encode("utf-8")),
+        "json_bytes": sum(end - begin for begin, end in spans),
+        "json_parse_ms": round(parse * 1000, 2),
+    }
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        metrics["peak_rss_mb"] = round((peak if sys.platform == "darwin" else peak * 1024) / 1e6, 1)
+    except ImportError:
+        pass
+    return metrics
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes=DEFAULT_SIZES, modes=None, results_path=RESULTS_PATH, all_sizes=False, timeout=3600):
+    """Run every (mode, size) case in its own process and append the results.
+
+    Each case gets an empty STAKEHOLDERS_CACHE_DIR, so the stage caches
+    (boundaries, heat rasters, markers, ...) are built, not hit, and runs
+    from different revisions stay comparable.
+    """
+    modes = modes or list(MODES)
+    out_dir = os.path.dirname(cache_path("bench", "page", "html"))
+    run = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(),
+           "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+           "cases": []}
+    for n in sizes:
+        csv_path = synthetic_csv(n)
+        for mode in modes:
+            case = {"mode": mode, "rows": n}
+            limit = MODES.get(mode)
+            if limit is not None and n > limit and not all_sizes:
+                case["skipped"] = f"over {limit:,} rows"
+            else:
+                out_html = os.path.join(out_dir, f"{mode}-{n}.html")
+                with tempfile.TemporaryDirectory(prefix="bench-cache-") as cache_dir:
+                    proc = subprocess.run([sys.executable, __file__, "_case", mode, csv_path, out_html],
+                                          capture_output=True, text=True, timeout=timeout,
+                                          env={**os.environ, "STAKEHOLDERS_CACHE_DIR": cache_dir})
+                if proc.returncode:
+                    case["error"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+                else:
+                    case.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+            run["cases"].append(case)
+            print(format_case(case), flush=True)
+
+    with open(results_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def format_case(case):
+    label = f"{case['mode']:<22}{case['rows']:>10,}"
+    if "skipped" in case or "error" in case:
+        return f"{label}  {case.get('skipped') or 'error: ' + case['error']}"
+    return (f"{label}{case['build_s']:>10.2f} s{case.get('peak_rss_mb', 0):>9.0f} MB"
+            f"{case['html_bytes'] / 1e6:>10.2f} MB html{case['json_parse_ms']:>10.1f} ms parse")
+
+
+def compare(results_path=RESULTS_PATH):
+    """Print the last run against the one before it (ratios of the key metrics)."""
+    with open(results_path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if len(runs) < 2:
+        print("Need at least two runs to compare")
+        return
+    before, after = runs[-2], runs[-1]
+    previous = {(c["mode"], c["rows"]): c for c in before["cases"] if "build_s" in c}
+    print(f"{before['revision']} ({before['time']}) -> {after['revision']} ({after['time']})")
+    for case in after["cases"]:
+        old = previous.get((case["mode"], case["rows"]))
+        if old is None or "build_s" not in case:
+            continue
+        ratios = "  ".join(f"{key} x{case[key] / old[key]:.2f}" if old.get(key) else f"{key} n/a"
+                           for key in ("build_s", "peak_rss_mb", "html_bytes", "json_parse_ms"))
+        print(f"{case['mode']:<22}{case['rows']:>10,}  {ratios}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_case":
+        print(json.dumps(run_case(*sys.argv[2:5])))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Benchmark map generation on synthetic stakeholder data.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated row counts")
+    parser.add_argument("--modes", help=f"comma-separated subset of: {', '.join(MODES)}")
+    parser.add_argument("--all-sizes", action="store_true", help="do not skip per-row folium modes at large sizes")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--compare", action="store_true", help="compare the last two stored runs and exit")
+    parser.add_argument("--synthesize", type=int, metavar="N", help="only write a synthetic CSV with N rows")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.results)
+    elif args.synthesize:
+        print(synthetic_csv(args.synthesize))
+    else:
+        run_suite([int(size) for size in args.sizes.split(",")],
+                  args.modes.split(",") if args.modes else None, args.results, args.all_sizes)
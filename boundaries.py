@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from cache import cache_path, file_hash, options_key, stats, write_atomic
+
+# Defaults tuned for LGA boundaries in CRS84 degrees (~55 m tolerance, ~1 m grid)
+DEFAULT_TOLERANCE = 0.0005
+DEFAULT_QUANTIZATION = 1e5
+
+
+def _polygons(geometry):
+    # Normalize Polygon / MultiPolygon coordinates to a list of polygons
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def _douglas_peucker(points, tolerance):
+    # Boolean mask of vertices to keep; endpoints are always kept
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, b = points[i], points[j]
+        seg = points[i + 1:j]
+        dx, dy = b - a
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(dx * (seg[:, 1] - a[1]) - dy * (seg[:, 0] - a[0])) / norm
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            keep[i + 1 + k] = True
+            stack.append((i, i + 1 + k))
+            stack.append((i + 1 + k, j))
+    return keep
+
+
+def build_topology(geojson, tolerance=DEFAULT_TOLERANCE, quantization=DEFAULT_QUANTIZATION,
+                   properties=None, object_name="boundaries"):
+    """Quantize, split rings into shared arcs and simplify each arc once.
+
+    Shared LGA edges become a single arc, so neighbouring polygons stay
+    consistent after simplification. Returns a TopoJSON topology.
+    """
+    features = geojson["features"]
+
+    # Collect rings as float arrays (closing vertex dropped)
+    rings = []
+    layout = []
+    for feature in features:
+        polygons = []
+        for polygon in _polygons(feature.get("geometry")):
+            ring_ids = []
+            for ring in polygon:
+                coords = np.asarray(ring, dtype=float)[:, :2]
+                if len(coords) > 1 and (coords[0] == coords[-1]).all():
+                    coords = coords[:-1]
+                ring_ids.append(len(rings))
+                rings.append(coords)
+            polygons.append(ring_ids)
+        layout.append(polygons)
+
+    if not rings:
+        raise ValueError("No polygon geometry found")
+
+    # Quantize every coordinate onto a shared integer grid
+    all_coords = np.concatenate(rings)
+    x0, y0 = all_coords.min(axis=0)
+    x1, y1 = all_coords.max(axis=0)
+    n = int(quantization)
+    kx = (x1 - x0) / (n - 1) or 1.0
+    ky = (y1 - y0) / (n - 1) or 1.0
+
+    quantized = []
+    for coords in rings:
+        q = np.empty(coords.shape, dtype=np.int64)
+        q[:, 0] = np.round((coords[:, 0] - x0) / kx)
+        q[:, 1] = np.round((coords[:, 1] - y0) / ky)
+        # Drop consecutive duplicates created by quantization
+        if len(q) > 1:
+            moved = np.any(q != np.roll(q, 1, axis=0), axis=1)
+            moved[0] = True
+            q = q[moved]
+        quantized.append(q)
+
+    # Junctions: vertices that have more than two distinct neighbours overall
+    keys = [q[:, 0] * n + q[:, 1] for q in quantized]
+    points = np.concatenate(keys)
+    prev_pts = np.concatenate([np.roll(k, 1) for k in keys])
+    next_pts = np.concatenate([np.roll(k, -1) for k in keys])
+    pairs = np.unique(
+        np.stack([np.concatenate([points, points]), np.concatenate([prev_pts, next_pts])], axis=1),
+        axis=0,
+    )
+    candidates, neighbour_counts = np.unique(pairs[:, 0], return_counts=True)
+    junctions = candidates[neighbour_counts > 2]
+
+    # Cut rings at junctions and deduplicate arcs (in either direction)
+    arcs = []
+    arc_index = {}
+
+    def register(arc_keys, arc_q):
+        forward = arc_keys.tobytes()
+        if forward in arc_index:
+            return arc_index[forward]
+        backward = arc_keys[::-1].tobytes()
+        if backward in arc_index:
+            return ~arc_index[backward]
+        arc_index[forward] = len(arcs)
+        arcs.append(arc_q)
+        return len(arcs) - 1
+
+    ring_arcs = []
+    for q, k in zip(quantized, keys):
+        cut = np.flatnonzero(np.isin(k, junctions))
+        if len(cut) == 0:
+            # Isolated ring: start at its smallest vertex so duplicates match
+            start = int(np.argmin(k))
+            q = np.roll(q, -start, axis=0)
+            k = np.roll(k, -start)
+            ring_arcs.append([register(np.append(k, k[0]), np.vstack([q, q[:1]]))])
+            continue
+        q = np.roll(q, -cut[0], axis=0)
+        k = np.roll(k, -cut[0])
+        cut = np.append(cut - cut[0], len(k))
+        q = np.vstack([q, q[:1]])
+        k = np.append(k, k[0])
+        ring_arcs.append([register(k[a:b + 1], q[a:b + 1]) for a, b in zip(cut[:-1], cut[1:])])
+
+    # Simplify each (shared) arc exactly once, in degree space
+    scale = np.array([kx, ky])
+    simplified = []
+    for arc in arcs:
+        if tolerance > 0 and len(arc) > 2:
+            keep = _douglas_peucker(arc * scale, tolerance)
+            closed = (arc[0] == arc[-1]).all()
+            if closed and keep.sum() < 4:
+                keep[:] = True
+            arc = arc[keep]
+        simplified.append(arc)
+
+    # Rings that collapse below a triangle are dropped
+    def ring_ok(arc_ids):
+        count = sum(len(simplified[a if a >= 0 else ~a]) - 1 for a in arc_ids)
+        return count >= 3
+
+    geometries = []
+    for feature, polygons in zip(features, layout):
+        polys = []
+        for ring_ids in polygons:
+            exterior, holes = ring_ids[0], ring_ids[1:]
+            if not ring_ok(ring_arcs[exterior]):
+                continue
+            polys.append([ring_arcs[exterior]] + [ring_arcs[h] for h in holes if ring_ok(ring_arcs[h])])
+        props = feature.get("properties") or {}
+        if properties is not None:
+            props = {key: props.get(key) for key in properties}
+        geometry = {"properties": props}
+        if "id" in feature:
+            geometry["id"] = feature["id"]
+        if len(polys) == 1:
+            geometry.update(type="Polygon", arcs=polys[0])
+        elif polys:
+            geometry.update(type="MultiPolygon", arcs=polys)
+        else:
+            geometry["type"] = None
+        geometries.append(geometry)
+
+    # Delta-encode arcs as in the TopoJSON spec
+    encoded = []
+    for arc in simplified:
+        delta = np.vstack([arc[:1], np.diff(arc, axis=0)])
+        encoded.append(delta.tolist())
+
+    return {
+        "type": "Topology",
+        "bbox": [float(x0), float(y0), float(x1), float(y1)],
+        "transform": {"scale": [float(kx), float(ky)], "translate": [float(x0), float(y0)]},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded,
+    }
+
+
+def topology_to_geojson(topology, object_name=None, precision=None):
+    """Reassemble a topology built by ``build_topology`` into GeoJSON.
+
+    By default coordinates are rounded to the decimals the quantization grid
+    can actually resolve.
+    """
+    if object_name is None:
+        object_name = next(iter(topology["objects"]))
+    scale = np.array(topology["transform"]["scale"])
+    if precision is None:
+        precision = max(0, int(np.ceil(-np.log10(scale.min()))))
+    translate = np.array(topology["transform"]["translate"])
+    arcs = [np.cumsum(np.asarray(arc, dtype=np.int64), axis=0) for arc in topology["arcs"]]
+
+    def ring(arc_ids):
+        parts = []
+        for a in arc_ids:
+            arc = arcs[a] if a >= 0 else arcs[~a][::-1]
+            parts.append(arc if not parts else arc[1:])
+        coords = np.concatenate(parts) * scale + translate
+        return np.round(coords, precision).tolist()
+
+    features = []
+    for geometry in topology["objects"][object_name]["geometries"]:
+        if geometry["type"] == "Polygon":
+            shape = {"type": "Polygon", "coordinates": [ring(r) for r in geometry["arcs"]]}
+        elif geometry["type"] == "MultiPolygon":
+            shape = {"type": "MultiPolygon",
+                     "coordinates": [[ring(r) for r in polygon] for polygon in geometry["arcs"]]}
+        else:
+            shape = None
+        feature = {"type": "Feature", "properties": geometry.get("properties", {}), "geometry": shape}
+        if "id" in geometry:
+            feature["id"] = geometry["id"]
+        features.append(feature)
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def load_boundaries(path, tolerance=DEFAULT_TOLERANCE, quantization=DEFAULT_QUANTIZATION,
+                    fmt="geojson", properties=None):
+    """Simplified boundaries as GeoJSON or TopoJSON, cached on disk.
+
+    The cache key is the source file hash plus every option, so editing the
+    GeoJSON or changing the tolerance produces a fresh artifact.
+    """
+    if fmt not in ("geojson", "topojson"):
+        raise ValueError(f"Unknown boundary format: {fmt}")
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = options_key(tolerance=tolerance, quantization=quantization, fmt=fmt, properties=properties)
+    target = cache_path("boundaries", f"{stem}-{file_hash(path)[:16]}-{key}", fmt)
+
+    if os.path.exists(target):
+        stats["boundaries:hit"] += 1
+        with open(target, encoding="utf-8") as f:
+            return json.load(f)
+
+    stats["boundaries:miss"] += 1
+    with open(path, encoding="utf-8") as f:
+        source = json.load(f)
+
+    result = build_topology(source, tolerance, quantization, properties, object_name=stem)
+    if fmt == "geojson":
+        result = topology_to_geojson(result)
+
+    write_atomic(target, json.dumps(result, separators=(",", ":")))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simplify and quantize boundary GeoJSON files.")
+    parser.add_argument("paths", nargs="+", help="GeoJSON boundary files")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="simplification tolerance in degrees")
+    parser.add_argument("--quantization", type=float, default=DEFAULT_QUANTIZATION, help="grid size per axis")
+    parser.add_argument("--format", choices=["geojson", "topojson"], default="geojson")
+    parser.add_argument("--properties", nargs="*", help="properties to keep (default: all)")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        data = load_boundaries(path, args.tolerance, args.quantization, args.format, args.properties)
+        size = len(json.dumps(data, separators=(",", ":")))
+        print(f"{path}: {os.path.getsize(path):,} -> {size:,} bytes ({args.format})")
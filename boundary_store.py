@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+from cache import cache_path, file_hash, options_key, stats
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # without pyarrow every load parses the GeoJSON again
+    pa = None
+
+# Bump when the stored layout or attribute casting changes
+STORE_VERSION = 1
+CRS = "EPSG:4326"
+BBOX_FIELDS = ["xmin", "ymin", "xmax", "ymax"]
+
+
+def precast(properties):
+    """Attribute table with JSON-safe columns.
+
+    Datetimes (e.g. the LGA ``timestamp`` field once a GeoJSON reader has
+    parsed it) become ISO strings and mixed-type columns become text, so
+    the table can go straight into folium or Arrow.
+    """
+    properties = properties.copy()
+    for col in properties.columns:
+        values = properties[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            properties[col] = values.dt.strftime("%Y-%m-%dT%H:%M:%S").where(values.notna(), None)
+        elif values.dtype == object and values.map(type).nunique() > 1:
+            properties[col] = values.where(values.isna(), values.astype(str))
+    return properties
+
+
+def _store_file(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = options_key(version=STORE_VERSION)
+    return cache_path("boundary_store", f"{stem}-{file_hash(path)[:16]}-{key}", "arrow")
+
+
+def build_store(path, target):
+    """Convert a GeoJSON file into the Arrow boundary store at ``target``.
+
+    Columns are the precast properties, ``geometry`` as WKB and ``bbox``
+    as an {xmin, ymin, xmax, ymax} struct per feature (the spatial index
+    input); the overall bounds and CRS go in the schema metadata.
+    """
+    with open(path, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    geometries = np.array([shape(f["geometry"]) if f.get("geometry") else None for f in features], dtype=object)
+    bounds = shapely.bounds(geometries)
+    properties = precast(pd.DataFrame([f.get("properties") or {} for f in features], index=range(len(features))))
+
+    table = pa.Table.from_pandas(properties, preserve_index=False)
+    table = table.append_column("geometry", pa.array(shapely.to_wkb(geometries), type=pa.binary()))
+    table = table.append_column("bbox", pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i]) for i in range(4)], names=BBOX_FIELDS))
+    total = [float(np.nanmin(bounds[:, 0])), float(np.nanmin(bounds[:, 1])),
+             float(np.nanmax(bounds[:, 2])), float(np.nanmax(bounds[:, 3]))] if len(features) else None
+    meta = {"version": STORE_VERSION, "source": os.path.basename(path), "crs": CRS, "bounds": total,
+            "count": len(features)}
+    table = table.replace_schema_metadata({b"boundary_store": json.dumps(meta).encode("utf-8")})
+
+    tmp_path = f"{target}.tmp{os.getpid()}"
+    with pa.ipc.new_file(tmp_path, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, target)
+
+
+class BoundaryStore:
+    """Memory-mapped boundary table; geometries are decoded only when asked for."""
+
+    def __init__(self, table):
+        self.table = table
+        self.meta = json.loads(table.schema.metadata[b"boundary_store"])
+        self.bounds = self.meta["bounds"]
+        self._tree = None
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def property_names(self):
+        return [name for name in self.table.column_names if name not in ("geometry", "bbox")]
+
+    def bboxes(self):
+        """(n, 4) array of feature bounds, read without decoding any geometry."""
+        bbox = self.table.column("bbox").combine_chunks()
+        return np.column_stack([bbox.field(name).to_numpy(zero_copy_only=False) for name in BBOX_FIELDS])
+
+    def geometries(self, rows=None):
+        column = self.table.column("geometry")
+        if rows is not None:
+            column = column.take(pa.array(rows, type=pa.int64()))
+        return shapely.from_wkb(np.asarray(column.to_numpy(zero_copy_only=False), dtype=object))
+
+    def query(self, bbox):
+        """Row numbers of features whose bounds intersect ``bbox`` (west, south, east, north)."""
+        if self._tree is None:
+            boxes = self.bboxes()
+            valid = ~np.isnan(boxes).any(axis=1)
+            self._rows = np.flatnonzero(valid)
+            self._tree = shapely.STRtree(shapely.box(*boxes[valid].T))
+        return np.sort(self._rows[self._tree.query(shapely.box(*bbox))])
+
+    def frame(self, columns=None, rows=None):
+        """GeoDataFrame of the boundaries (all properties unless ``columns`` is given)."""
+        names = self.property_names if columns is None else [col for col in columns if col in self.property_names]
+        table = self.table.select(names)
+        if rows is not None:
+            table = table.take(pa.array(rows, type=pa.int64()))
+        properties = table.to_pandas()
+        return gpd.GeoDataFrame(properties, geometry=self.geometries(rows), crs=self.meta["crs"])
+
+
+def open_store(path):
+    """The boundary store for a GeoJSON file, converting it on first use."""
+    if pa is None:
+        raise ImportError("pyarrow is required for the boundary store")
+    target = _store_file(path)
+    if os.path.exists(target):
+        stats["boundary_store:hit"] += 1
+    else:
+        stats["boundary_store:miss"] += 1
+        build_store(path, target)
+    return BoundaryStore(pa.ipc.open_file(pa.memory_map(target, "r")).read_all())
+
+
+def read_boundaries(path, columns=None):
+    """Boundaries as a GeoDataFrame with precast attributes (drop-in for ``gpd.read_file``).
+
+    Served from the Arrow store when pyarrow is installed; otherwise the
+    GeoJSON is parsed and cast on every call.
+    """
+    if pa is None:
+        frame = gpd.read_file(path)
+        frame = gpd.GeoDataFrame(precast(frame.drop(columns="geometry")), geometry=frame.geometry, crs=frame.crs)
+        return frame if columns is None else frame[[col for col in columns if col in frame.columns] + ["geometry"]]
+    return open_store(path).frame(columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert boundary GeoJSON files into the binary store.")
+    parser.add_argument("paths", nargs="*", default=["kaduna.geojson", "lga_boundaries.geojson"])
+    args = parser.parse_args()
+
+    for path in args.paths:
+        start = time.perf_counter()
+        gpd.read_file(path)
+        parse = time.perf_counter() - start
+        for attempt in ("first", "cached"):
+            start = time.perf_counter()
+            frame = read_boundaries(path)
+            elapsed = time.perf_counter() - start
+            print(f"{path}: {attempt} load {elapsed * 1000:.1f} ms ({len(frame)} features; "
+                  f"gpd.read_file {parse * 1000:.1f} ms)")
+        print(f"  bounds {open_store(path).bounds}")
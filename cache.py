@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from collections import Counter
+
+import pandas as pd
+
+# Root for all generated, re-creatable artifacts (safe to delete at any time)
+CACHE_DIR = os.environ.get("STAKEHOLDERS_CACHE_DIR", ".cache")
+
+# Hits and misses per artifact kind for the current run, e.g. stats["markers:hit"]
+stats = Counter()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def options_key(**options):
+    """Stable short key for a set of JSON-serializable options."""
+    encoded = json.dumps(options, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def row_hashes(df, columns=None):
+    """One 64-bit content hash per row (index ignored)."""
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def frame_hash(df, columns=None):
+    """Short content hash of a frame's rows and column names, in order."""
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    digest = hashlib.sha256(json.dumps([str(col) for col in df.columns]).encode("utf-8"))
+    digest.update(row_hashes(df).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(kind, name, ext):
+    """Path of a cache artifact, creating its directory if needed."""
+    directory = os.path.join(CACHE_DIR, kind)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}.{ext}")
+
+
+def write_atomic(path, data):
+    # Write to a temporary file first so readers never see a partial artifact
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def cached_text(kind, key, build):
+    """Text artifact ``kind/key`` from the cache, calling ``build()`` on a miss."""
+    path = cache_path(kind, key, "txt")
+    if os.path.exists(path):
+        stats[f"{kind}:hit"] += 1
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    stats[f"{kind}:miss"] += 1
+    text = build()
+    write_atomic(path, text.encode("utf-8"))
+    return text
+
+
+def stats_summary():
+    """One line such as ``markers: 1 hit, heatmap: 4 misses`` for build logs."""
+    kinds = sorted({key.split(":")[0] for key in stats})
+    parts = []
+    for kind in kinds:
+        hits, misses = stats[f"{kind}:hit"], stats[f"{kind}:miss"]
+        parts.append(f"{kind}: {hits} hit{'s' * (hits != 1)}, {misses} miss{'es' * (misses != 1)}")
+    return "; ".join(parts) or "nothing cached"
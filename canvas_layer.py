@@ -0,0 +1,313 @@
+import json
+
+import folium
+from jinja2 import Template
+
+from cache import cached_text, frame_hash, options_key
+from marker_layer import DETAILS_LOADER_JS, POPUP_FIELDS, dump_payload, to_columnar, write_detail_shards
+
+# Above this many rows "auto" marker mode draws points on a canvas instead of
+# creating one DOM marker per row
+CANVAS_THRESHOLD = 5000
+
+CATEGORY_COLORS = {
+    "Contract Farming": "#1b9e77",
+    "Seeds Company": "#66a61e",
+    "Aggregator": "#d95f02",
+    "Processors": "#7570b3",
+    "Fertilizer Company": "#e7298a",
+}
+# Colors for categories not listed above, assigned in sorted order
+PALETTE = ["#e6ab02", "#a6761d", "#1f78b4", "#b2df8a", "#fb9a99", "#cab2d6", "#666666"]
+
+
+def resolve_marker_mode(mode, rows, fallback, threshold=CANVAS_THRESHOLD):
+    """The marker mode to build: ``"auto"`` means canvas above ``threshold`` rows, else ``fallback``."""
+    if mode != "auto":
+        return mode
+    return "canvas" if rows > threshold else fallback
+
+
+def category_colors(categories, colors=None):
+    """A color per category: ``colors`` first, then CATEGORY_COLORS, then the palette."""
+    known = dict(CATEGORY_COLORS, **(colors or {}))
+    extra = sorted(set(map(str, categories)) - set(known))
+    known.update({category: PALETTE[i % len(PALETTE)] for i, category in enumerate(extra)})
+    return known
+
+
+class CanvasMarkers(folium.map.Layer):
+    """All stakeholders drawn as circles on one canvas, colored by category.
+
+    Points are projected and drawn in one pass per redraw (one path per
+    color), so the cost does not grow with DOM nodes. Clicks and hovers are
+    hit-tested against a screen-space grid built during the draw.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var data = {{ this.payload }};
+            var fields = {{ this.fields }};
+            var colors = {{ this.colors }};
+            var options = {{ this.options }};
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            {%- if this.details %}
+            var details = {{ this.details }};
+            {{ this.details_loader }}
+            var shards = detailLoader.shards;
+            function shardUrl(i) { return details.url + details.files[Math.floor(i / details.shardSize)]; }
+            function loadDetails(i, done) { detailLoader.load(shardUrl(i), details.format, done); }
+            {%- endif %}
+
+            function value(col, i) {
+                var column = data.cols[col];
+                if (!column) {
+                    {%- if this.details %}
+                    var shard = shards[shardUrl(i)];
+                    return shard && shard.cols[col] ? shard.cols[col][i - shard.start] : "";
+                    {%- else %}
+                    return "";
+                    {%- endif %}
+                }
+                var dict = data.dicts[col];
+                return dict ? dict[column[i]] : column[i];
+            }
+            function popupHtml(i) {
+                {%- if this.details %}
+                var loaded = shards[shardUrl(i)];
+                var html = fields.filter(function(f) {
+                    return loaded || f[1] in data.cols;
+                }).map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(value(f[1], i));
+                }).join("<br>");
+                return loaded === undefined ? html + "<br><i>Loading details...</i>" : html;
+                {%- else %}
+                return fields.map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(value(f[1], i));
+                }).join("<br>");
+                {%- endif %}
+            }
+
+            // Web Mercator in the unit square, computed once; a redraw only
+            // scales and offsets these
+            var mx = new Float64Array(data.n), my = new Float64Array(data.n);
+            for (var i = 0; i < data.n; i++) {
+                var lat = Math.max(-85.0511, Math.min(85.0511, data.lat[i])) * Math.PI / 180;
+                mx[i] = data.lng[i] / 360 + 0.5;
+                my[i] = 0.5 - Math.log(Math.tan(Math.PI / 4 + lat / 2)) / (2 * Math.PI);
+            }
+            var colorOf = new Array(data.n);
+            for (var i = 0; i < data.n; i++) {
+                colorOf[i] = colors[value(options.categoryColumn, i)] || options.defaultColor;
+            }
+
+            var CanvasPoints = L.Layer.extend({
+                onAdd: function(map) {
+                    this._canvas = L.DomUtil.create("canvas", "leaflet-zoom-hide");
+                    this._canvas.style.pointerEvents = "none";
+                    map.getPanes().overlayPane.appendChild(this._canvas);
+                    map.on("moveend resize", this._redraw, this);
+                    map.on("click", this._click, this);
+                    map.on("mousemove", this._hover, this);
+                    this._redraw();
+                },
+                onRemove: function(map) {
+                    L.DomUtil.remove(this._canvas);
+                    map.off("moveend resize", this._redraw, this);
+                    map.off("click", this._click, this);
+                    map.off("mousemove", this._hover, this);
+                    map.closeTooltip(tooltip);
+                    this._grid = null;
+                },
+                _redraw: function() {
+                    var size = map.getSize(), ratio = window.devicePixelRatio || 1;
+                    // Draw a margin around the view so panning does not show blank edges
+                    var pad = size.multiplyBy(options.padding).round();
+                    var full = size.add(pad.multiplyBy(2));
+                    var canvas = this._canvas;
+                    L.DomUtil.setPosition(canvas, map.containerPointToLayerPoint(pad.multiplyBy(-1)));
+                    canvas.width = full.x * ratio;
+                    canvas.height = full.y * ratio;
+                    canvas.style.width = full.x + "px";
+                    canvas.style.height = full.y + "px";
+
+                    var ctx = canvas.getContext("2d");
+                    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+                    var scale = 256 * Math.pow(2, map.getZoom());
+                    var origin = map.project(map.containerPointToLatLng([0, 0]));
+                    var r = options.radius, cell = options.cellSize;
+                    var batches = {}, grid = {};
+                    for (var i = 0; i < data.n; i++) {
+                        var x = mx[i] * scale - origin.x, y = my[i] * scale - origin.y;
+                        if (x < -pad.x - r || y < -pad.y - r || x > size.x + pad.x + r || y > size.y + pad.y + r) {
+                            continue;
+                        }
+                        (batches[colorOf[i]] = batches[colorOf[i]] || []).push(x + pad.x, y + pad.y);
+                        var key = Math.floor(x / cell) * 65536 + Math.floor(y / cell);
+                        (grid[key] = grid[key] || []).push(i, x, y);
+                    }
+                    ctx.lineWidth = 1;
+                    ctx.strokeStyle = options.strokeColor;
+                    ctx.globalAlpha = options.opacity;
+                    Object.keys(batches).forEach(function(color) {
+                        var points = batches[color];
+                        ctx.fillStyle = color;
+                        ctx.beginPath();
+                        for (var j = 0; j < points.length; j += 2) {
+                            ctx.moveTo(points[j] + r, points[j + 1]);
+                            ctx.arc(points[j], points[j + 1], r, 0, 2 * Math.PI);
+                        }
+                        ctx.fill();
+                        ctx.stroke();
+                    });
+                    this._grid = grid;
+                },
+                // Index of the point under a container point, or -1
+                hit: function(point) {
+                    if (!this._grid) { return -1; }
+                    var cell = options.cellSize, reach = options.radius + 3;
+                    var best = -1, bestDistance = reach * reach;
+                    var gx = Math.floor(point.x / cell), gy = Math.floor(point.y / cell);
+                    for (var dx = -1; dx <= 1; dx++) {
+                        for (var dy = -1; dy <= 1; dy++) {
+                            var entries = this._grid[(gx + dx) * 65536 + gy + dy];
+                            if (!entries) { continue; }
+                            for (var j = 0; j < entries.length; j += 3) {
+                                var ex = entries[j + 1] - point.x, ey = entries[j + 2] - point.y;
+                                // Later points are drawn on top, so ties go to them
+                                if (ex * ex + ey * ey <= bestDistance) {
+                                    bestDistance = ex * ex + ey * ey;
+                                    best = entries[j];
+                                }
+                            }
+                        }
+                    }
+                    return best;
+                },
+                _click: function(e) {
+                    var i = this.hit(e.containerPoint);
+                    if (i < 0) { return; }
+                    openPopup(i);
+                },
+                _hover: function(e) {
+                    var i = this.hit(e.containerPoint);
+                    map.getContainer().style.cursor = i < 0 ? "" : "pointer";
+                    if (i < 0) {
+                        map.closeTooltip(tooltip);
+                        return;
+                    }
+                    tooltip.setLatLng([data.lat[i], data.lng[i]]).setContent(escapeHtml(value(options.nameColumn, i)));
+                    map.openTooltip(tooltip);
+                }
+            });
+
+            var tooltip = L.tooltip({direction: "top", offset: [0, -options.radius]});
+            function openPopup(i) {
+                var popup = L.popup({maxWidth: options.maxWidth})
+                    .setLatLng([data.lat[i], data.lng[i]])
+                    .setContent(popupHtml(i))
+                    .openOn(map);
+                {%- if this.details %}
+                if (shards[shardUrl(i)] === undefined) {
+                    loadDetails(i, function() { popup.setContent(popupHtml(i)); });
+                }
+                {%- endif %}
+                return popup;
+            }
+
+            var layer = new CanvasPoints();
+            layer.openPopup = openPopup;
+            // Same shape as ColumnarMarkers.records() for the inline search
+            layer.records = function() {
+                var out = new Array(data.n);
+                for (var i = 0; i < data.n; i++) {
+                    out[i] = {
+                        name: value(options.nameColumn, i),
+                        lat: data.lat[i],
+                        lng: data.lng[i],
+                        popup: popupHtml(i),
+                        marker: null
+                    };
+                }
+                return out;
+            };
+            {%- if this.legend %}
+            var legend = L.control({position: "bottomright"});
+            legend.onAdd = function() {
+                var div = L.DomUtil.create("div");
+                div.style.cssText = "background:white;padding:6px 8px;font:12px sans-serif;border-radius:4px;";
+                div.innerHTML = {{ this.legend }}.map(function(entry) {
+                    return '<div><span style="display:inline-block;width:10px;height:10px;border-radius:50%;' +
+                           'margin-right:6px;background:' + entry[1] + '"></span>' + escapeHtml(entry[0]) + '</div>';
+                }).join("");
+                return div;
+            };
+            layer.on("add", function() { legend.addTo(map); });
+            layer.on("remove", function() { legend.remove(); });
+            {%- endif %}
+            {%- if this.show %}
+            layer.addTo(map);
+            {%- endif %}
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, df, name="Stakeholders", fields=None, colors=None,
+                 category_column="Category", name_column="Company Name",
+                 radius=5, opacity=0.85, stroke_color="#ffffff", default_color="#3388ff",
+                 max_width=300, details=None, legend=True, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "CanvasMarkers"
+        df = df[df["Latitude"].notna() & df["Longitude"].notna()]
+        if fields is None:
+            fields = [(label, col) for label, col in POPUP_FIELDS if col in df.columns]
+
+        columns = [col for _, col in fields]
+        if details is not None:
+            columns = [col for col in columns if col not in details["columns"]]
+        for col in (category_column, name_column):
+            if col in df.columns and col not in columns:
+                columns.append(col)
+
+        key = frame_hash(df, ["Latitude", "Longitude"] + columns) + "-" + options_key(columns=columns)
+        self.payload = cached_text("markers", key, lambda: dump_payload(to_columnar(df, columns)))
+        self.fields = json.dumps(fields)
+        categories = df[category_column].astype(str).str.strip().unique() if category_column in df.columns else []
+        palette = category_colors(categories, colors)
+        self.colors = dump_payload(palette)
+        self.options = json.dumps({
+            "categoryColumn": category_column,
+            "nameColumn": name_column,
+            "radius": radius,
+            "opacity": opacity,
+            "strokeColor": stroke_color,
+            "defaultColor": default_color,
+            "maxWidth": max_width,
+            "cellSize": max(2 * radius + 6, 16),
+            "padding": 0.25,
+        })
+        self.details = json.dumps(details) if details is not None else None
+        self.details_loader = DETAILS_LOADER_JS
+        self.legend = dump_payload([[c, palette[c]] for c in sorted(categories)]) if legend else None
+
+
+def add_canvas_markers(m, df, details_dir=None, details_format="js", **kwargs):
+    """Add all stakeholders as one canvas layer; returns the layer element.
+
+    ``details_dir`` works as in ``add_columnar_markers``: contact details go
+    to sidecar shards and are loaded when a popup opens.
+    """
+    if details_dir is not None:
+        valid = df[df["Latitude"].notna() & df["Longitude"].notna()]
+        kwargs["details"] = write_detail_shards(valid, details_dir, fmt=details_format)
+    layer = CanvasMarkers(df, **kwargs)
+    layer.add_to(m)
+    return layer
@@ -0,0 +1,296 @@
+import json
+import math
+
+import folium
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+from cache import cached_text, frame_hash, options_key
+from marker_layer import DEFAULT_ICON, POPUP_FIELDS, dump_payload, to_columnar
+
+
+def mercator_xy(lat, lng):
+    """Project coordinates to Web Mercator in the unit square [0, 1]."""
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511))
+    x = np.asarray(lng, dtype=float) / 360.0 + 0.5
+    y = 0.5 - np.arcsinh(np.tan(lat)) / (2 * math.pi)
+    return x, y
+
+
+def build_clusters(lat, lng, categories=None, min_zoom=0, max_zoom=16, radius=60, extent=256):
+    """Supercluster-style hierarchy computed bottom-up on a grid per zoom.
+
+    Every zoom clusters the clusters of the zoom below it, so levels nest.
+    Returns one dict per zoom with weighted centroids, counts, per-category
+    breakdowns, the point id of single-point clusters and the zoom at which
+    each cluster splits.
+    """
+    x, y = mercator_xy(lat, lng)
+    n = len(x)
+    if categories is None:
+        cat_codes, cat_names = np.zeros(n, dtype=np.int64), np.array(["All"])
+    else:
+        cat_codes, cat_names = pd.factorize(pd.Series(categories).fillna("").astype(str))
+    n_cats = len(cat_names)
+
+    # Leaf level: every point is its own cluster
+    cx, cy = x, y
+    counts = np.ones(n, dtype=np.int64)
+    breakdown = np.zeros((n, n_cats), dtype=np.int64)
+    breakdown[np.arange(n), cat_codes] = 1
+    point_ids = np.arange(n)
+
+    levels = {}
+    parents = {}
+    for z in range(max_zoom, min_zoom - 1, -1):
+        cell = radius / (extent * 2 ** z)
+        gx = np.floor(cx / cell).astype(np.int64)
+        gy = np.floor(cy / cell).astype(np.int64)
+        _, parent, sizes = np.unique(gx * (2 ** 31) + gy, return_inverse=True, return_counts=True)
+        parent = parent.ravel()
+        m = len(sizes)
+
+        new_counts = np.bincount(parent, weights=counts, minlength=m).astype(np.int64)
+        cx = np.bincount(parent, weights=cx * counts, minlength=m) / new_counts
+        cy = np.bincount(parent, weights=cy * counts, minlength=m) / new_counts
+        new_breakdown = np.empty((m, n_cats), dtype=np.int64)
+        for c in range(n_cats):
+            new_breakdown[:, c] = np.bincount(parent, weights=breakdown[:, c], minlength=m)
+
+        # A merged cluster no longer maps to a single point
+        single = np.full(m, -1, dtype=np.int64)
+        single[parent] = point_ids
+        single[sizes > 1] = -1
+
+        parents[z] = parent
+        counts, breakdown, point_ids = new_counts, new_breakdown, single
+        levels[z] = {"x": cx, "y": cy, "count": counts, "breakdown": breakdown, "point": point_ids,
+                     "children": sizes}
+
+    # Expansion zoom: first deeper zoom where the cluster actually splits
+    for z in range(max_zoom, min_zoom - 1, -1):
+        level = levels[z]
+        expand = np.full(len(level["count"]), z + 1, dtype=np.int64)
+        if z < max_zoom:
+            child_expand = levels[z + 1]["expand"]
+            only_child = np.full(len(expand), -1, dtype=np.int64)
+            only_child[parents[z]] = np.arange(len(parents[z]))
+            passthrough = level["children"] == 1
+            expand[passthrough] = child_expand[only_child[passthrough]]
+        level["expand"] = np.minimum(expand, max_zoom + 1)
+
+    return {"levels": levels, "categories": list(cat_names), "min_zoom": min_zoom, "max_zoom": max_zoom}
+
+
+def clusters_payload(clusters, precision=5):
+    """Compact per-zoom cluster summaries for the browser.
+
+    A zoom whose clusters are identical to the next deeper zoom is omitted;
+    the browser falls through to the deeper level.
+    """
+    levels = clusters["levels"]
+    zooms = {}
+    for z, level in levels.items():
+        if z < clusters["max_zoom"] and len(level["count"]) == len(levels[z + 1]["count"]):
+            continue
+        lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * level["y"]))))
+        lng = (level["x"] - 0.5) * 360.0
+        multi = level["count"] > 1
+        zooms[z] = {
+            "lat": np.round(lat, precision).tolist(),
+            "lng": np.round(lng, precision).tolist(),
+            "count": level["count"].tolist(),
+            "point": level["point"].tolist(),
+            "expand": level["expand"].tolist(),
+            # Breakdown only where it carries information (count > 1)
+            "cats": [row.tolist() if is_multi else None for row, is_multi in zip(level["breakdown"], multi)],
+        }
+    return {"zooms": zooms, "categories": clusters["categories"],
+            "minZoom": clusters["min_zoom"], "maxZoom": clusters["max_zoom"]}
+
+
+class ServerClusters(folium.map.Layer):
+    """Layer that draws clusters precomputed in Python for the current zoom."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var clusters = {{ this.clusters }};
+            var points = {{ this.points }};
+            var fields = {{ this.fields }};
+            var iconUrls = {{ this.icon_urls }};
+            var sprites = {{ this.sprites or "null" }};
+            var group = L.layerGroup();
+            var cache = {};
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            function value(col, i) {
+                var column = points.cols[col];
+                if (!column) { return ""; }
+                var dict = points.dicts[col];
+                return dict ? dict[column[i]] : column[i];
+            }
+            function popupHtml(i) {
+                return fields.map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(value(f[1], i));
+                }).join("<br>");
+            }
+
+            var icons = {};
+            function pointIcon(i) {
+                var category = value({{ this.category_column|tojson }}, i);
+                if (!icons[category]) {
+                    {%- if this.sprites %}
+                    // Atlas cell picked by CSS class; no image request per category
+                    icons[category] = L.divIcon({
+                        className: sprites.classes[category] || sprites["default"],
+                        iconSize: {{ this.icon_size|tojson }}
+                    });
+                    {%- else %}
+                    icons[category] = L.icon({
+                        iconUrl: iconUrls[category] || {{ this.default_icon|tojson }},
+                        iconSize: {{ this.icon_size|tojson }}
+                    });
+                    {%- endif %}
+                }
+                return icons[category];
+            }
+            var clusterIcons = {};
+            function clusterIcon(count) {
+                var label = count >= 1000 ? Math.round(count / 100) / 10 + "k" : String(count);
+                if (!clusterIcons[label]) {
+                    var size = count < 10 ? 30 : count < 100 ? 36 : count < 1000 ? 42 : 48;
+                    var color = count < 10 ? "rgba(110,204,57,0.8)" : count < 100 ? "rgba(240,194,12,0.8)" : "rgba(241,128,23,0.8)";
+                    clusterIcons[label] = L.divIcon({
+                        html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size +
+                              'px;border-radius:50%;background:' + color + ';text-align:center;font:bold 12px sans-serif;">' +
+                              label + '</div>',
+                        className: "",
+                        iconSize: [size, size]
+                    });
+                }
+                return clusterIcons[label];
+            }
+            function breakdownHtml(cats) {
+                return cats.map(function(n, c) {
+                    return n ? escapeHtml(clusters.categories[c]) + ": " + n : null;
+                }).filter(Boolean).join("<br>");
+            }
+
+            var pointMarkers = {};
+            function pointMarker(p) {
+                if (!pointMarkers[p]) {
+                    var marker = L.marker([points.lat[p], points.lng[p]], {icon: pointIcon(p)});
+                    marker.bindPopup(function() { return popupHtml(p); }, {maxWidth: {{ this.max_width }}});
+                    marker.bindTooltip(function() { return escapeHtml(value({{ this.name_column|tojson }}, p)); });
+                    pointMarkers[p] = marker;
+                }
+                return pointMarkers[p];
+            }
+
+            function build(z, i) {
+                var level = clusters.zooms[z];
+                var latlng = [level.lat[i], level.lng[i]];
+                if (level.point[i] >= 0) {
+                    return pointMarker(level.point[i]);
+                }
+                var cluster = L.marker(latlng, {icon: clusterIcon(level.count[i])});
+                cluster.bindTooltip(function() { return breakdownHtml(level.cats[i]); });
+                cluster.on("click", function() { map.setView(latlng, level.expand[i]); });
+                return cluster;
+            }
+
+            function update() {
+                if (!map.hasLayer(group)) { return; }
+                var bounds = map.getBounds().pad(0.25);
+                group.clearLayers();
+                // Beyond the deepest cluster level every point is drawn on its own
+                if (Math.round(map.getZoom()) > clusters.maxZoom) {
+                    for (var p = 0; p < points.n; p++) {
+                        if (bounds.contains([points.lat[p], points.lng[p]])) { group.addLayer(pointMarker(p)); }
+                    }
+                    return;
+                }
+                var z = Math.max(clusters.minZoom, Math.round(map.getZoom()));
+                while (!clusters.zooms[z]) { z++; }
+                var level = clusters.zooms[z];
+                for (var i = 0; i < level.count.length; i++) {
+                    if (!bounds.contains([level.lat[i], level.lng[i]])) { continue; }
+                    var key = z + ":" + i;
+                    if (!cache[key]) { cache[key] = build(z, i); }
+                    group.addLayer(cache[key]);
+                }
+            }
+
+            map.on("moveend", update);
+            group.on("add", update);
+            {%- if this.show %}
+            group.addTo(map);
+            {%- endif %}
+
+            group.records = function() {
+                var out = new Array(points.n);
+                for (var i = 0; i < points.n; i++) {
+                    out[i] = {
+                        name: value({{ this.name_column|tojson }}, i),
+                        lat: points.lat[i],
+                        lng: points.lng[i],
+                        popup: popupHtml(i),
+                        marker: null
+                    };
+                }
+                return out;
+            };
+            return group;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, df, name="Stakeholders", icon_mapping=None, fields=None,
+                 category_column="Category", name_column="Company Name",
+                 default_icon=DEFAULT_ICON, icon_size=(30, 30), max_width=300,
+                 min_zoom=0, max_zoom=16, radius=60, sprites=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "ServerClusters"
+        if fields is None:
+            fields = [(label, col) for label, col in POPUP_FIELDS if col in df.columns]
+
+        columns = [col for _, col in fields]
+        for col in (category_column, name_column):
+            if col in df.columns and col not in columns:
+                columns.append(col)
+
+        categories = df[category_column] if category_column in df.columns else None
+
+        def build():
+            clusters = build_clusters(df["Latitude"], df["Longitude"], categories,
+                                      min_zoom=min_zoom, max_zoom=max_zoom, radius=radius)
+            return dump_payload(clusters_payload(clusters))
+
+        coordinates = ["Latitude", "Longitude"]
+        key = frame_hash(df, coordinates + [category_column])
+        self.clusters = cached_text("clusters", key + "-" + options_key(min_zoom=min_zoom, max_zoom=max_zoom,
+                                                                          radius=radius), build)
+        key = frame_hash(df, coordinates + columns) + "-" + options_key(columns=columns)
+        self.points = cached_text("markers", key, lambda: dump_payload(to_columnar(df, columns)))
+        self.fields = json.dumps(fields)
+        self.icon_urls = json.dumps(icon_mapping or {})
+        self.category_column = category_column
+        self.name_column = name_column
+        self.default_icon = default_icon
+        self.sprites = json.dumps(sprites) if sprites is not None else None
+        self.icon_size = [sprites["size"]] * 2 if sprites is not None else list(icon_size)
+        self.max_width = max_width
+
+
+def add_server_clusters(m, df, **kwargs):
+    """Add stakeholders as precomputed clusters; returns the layer element."""
+    layer = ServerClusters(df, **kwargs)
+    layer.add_to(m)
+    return layer
@@ -0,0 +1,310 @@
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from cache import cached_text, frame_hash, options_key
+from loader import ENTITY_COLUMN, load_stakeholders, row_keys
+from search_index import normalize, trigrams
+
+# Columns that decide whether two rows are the same company
+MATCH_COLUMNS = ["Company Name", "Phone number", "Email/Website", "Latitude", "Longitude"]
+
+# Legal-form and filler words dropped before names are compared
+NAME_STOPWORDS = {
+    "ltd", "limited", "plc", "inc", "co", "company", "nig", "nigeria", "nigerian",
+    "enterprise", "enterprises", "ventures", "intl", "international", "and", "the", "of",
+}
+
+# Shared mailboxes: the whole address is the block key, not the domain
+WEBMAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "yahoo.co", "yahoo.co.uk", "ymail.com",
+    "hotmail.com", "outlook.com", "live.com", "aol.com", "icloud.com",
+}
+
+# Blocking: keys shared by more rows than this are not discriminative and are
+# skipped (name trigrams get a tighter cap and must share MIN_SHARED_TRIGRAMS)
+MAX_BLOCK = 200
+MAX_TRIGRAM_BLOCK = 50
+MIN_SHARED_TRIGRAMS = 2
+GRID_DEGREES = 0.005  # ~550 m cells, on two grids offset by half a cell
+
+# Scoring: weighted evidence per candidate pair, matched above MATCH_THRESHOLD.
+# "conflict" (both rows have company mail/web domains and share none) counts
+# against a match, and names less similar than MIN_NAME_SIMILARITY (trigram
+# Jaccard) never match, whatever else is shared
+WEIGHTS = {"name": 0.55, "phone": 0.3, "email": 0.25, "near": 0.2, "conflict": -0.3}
+MATCH_THRESHOLD = 0.6
+MIN_NAME_SIMILARITY = 0.5
+NEAR_METERS = 250
+SCORE_CHUNK = 250_000
+
+# Set in the parent before the pool starts (see regions.py)
+_shared = {}
+
+
+def normalize_name(name):
+    """Company name reduced to its distinctive words ("Namalco Nigerian Ltd" -> "namalco")."""
+    words = normalize(name).split()
+    return " ".join(word for word in words if word not in NAME_STOPWORDS) or " ".join(words)
+
+
+def phone_keys(values):
+    """(row, key) pairs: the last ten digits of every phone number in a cell.
+
+    Handles "+234 803 ...", "0803-...", stray backticks and several numbers
+    separated by commas or slashes.
+    """
+    parts = values.fillna("").astype(str).str.split(r"[,/;]|\bor\b", regex=True).explode()
+    digits = parts.str.replace(r"\D", "", regex=True).str.replace(r"^234", "", regex=True).str.lstrip("0")
+    digits = digits[digits.str.len() >= 7].str[-10:]
+    return digits.index.to_numpy(), ("p:" + digits).to_numpy(dtype=object)
+
+
+def email_keys(values):
+    """(row, key) pairs: company mail or web domain, or the full address on webmail."""
+    parts = values.fillna("").astype(str).str.lower().str.split(r"[\s,;]+", regex=True).explode()
+    parts = parts[parts.str.contains(".", regex=False)]
+    address = parts.str.extract(r"^([^@/]+@([a-z0-9.-]+\.[a-z]{2,}))")
+    website = parts.str.extract(r"^(?:https?://)?(?:www\.)?([a-z0-9.-]+\.[a-z]{2,})(?:[/?#]|$)")[0]
+    webmail = address[1].isin(WEBMAIL_DOMAINS)
+    keys = address[1].where(~webmail, address[0]).fillna(website).dropna()
+    return keys.index.to_numpy(), ("e:" + keys).to_numpy(dtype=object)
+
+
+def grid_keys(lat, lng, cell=GRID_DEGREES):
+    """(row, key) pairs: the grid cell of each point on two staggered grids."""
+    valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+    rows, keys = [], []
+    for offset in (0, 1):
+        x = np.floor(lng[valid] / cell + offset / 2).astype(np.int64)
+        y = np.floor(lat[valid] / cell + offset / 2).astype(np.int64)
+        rows.append(valid)
+        keys.append(((x << 32) + y) * 2 + offset)
+    return np.concatenate(rows), np.concatenate(keys)
+
+
+def trigram_matrix(names):
+    """Sparse boolean (rows x trigrams) matrix of the normalized names.
+
+    Trigrams are extracted once per distinct name; rows with the same name
+    share a row of the distinct-name matrix.
+    """
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+    vocabulary, rows, grams = {}, [], []
+    for position, name in enumerate(uniques):
+        for gram in trigrams(name) if name else ():
+            rows.append(position)
+            grams.append(vocabulary.setdefault(gram, len(vocabulary)))
+    distinct = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, grams)),
+                                 shape=(len(uniques), len(vocabulary)))
+    return distinct[codes]
+
+
+def incidence(n, rows, keys):
+    """Sparse boolean (rows x distinct keys) matrix."""
+    codes, uniques = pd.factorize(keys)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, codes)), shape=(n, len(uniques)))
+    matrix.data[:] = 1  # repeated (row, key) pairs were summed
+    return matrix
+
+
+def _co_occurring(matrix, max_block, min_shared=1):
+    # Pairs (i < j) sharing at least ``min_shared`` keys held by 2..max_block rows
+    sizes = matrix.getnnz(axis=0)
+    blocked = matrix[:, np.flatnonzero((sizes >= 2) & (sizes <= max_block))]
+    shared = sparse.triu(blocked @ blocked.T, k=1).tocoo()
+    keep = shared.data >= min_shared
+    return shared.row[keep], shared.col[keep]
+
+
+def candidate_pairs(features):
+    """Unique (left, right) row pairs that share at least one block."""
+    pairs = [
+        _co_occurring(features["phone"], MAX_BLOCK),
+        _co_occurring(features["email"], MAX_BLOCK),
+        _co_occurring(features["grid"], MAX_BLOCK),
+        _co_occurring(features["trigrams"], MAX_TRIGRAM_BLOCK, MIN_SHARED_TRIGRAMS),
+    ]
+    left = np.concatenate([p[0] for p in pairs]).astype(np.int64)
+    right = np.concatenate([p[1] for p in pairs]).astype(np.int64)
+    n = features["trigrams"].shape[0]
+    unique = np.unique(left * n + right)
+    return unique // n, unique % n
+
+
+def _shares_key(matrix, left, right):
+    return np.asarray(matrix[left].multiply(matrix[right]).sum(axis=1)).ravel() > 0
+
+
+def score_pairs(task):
+    """Evidence and score for one chunk of candidate pairs; runs in a worker."""
+    left, right = task
+    features = _shared["features"]
+    grams = features["trigrams"]
+    shared = np.asarray(grams[left].multiply(grams[right]).sum(axis=1)).ravel()
+    sizes = features["trigram_counts"]
+    name = shared / np.maximum(sizes[left] + sizes[right] - shared, 1)
+
+    lat, lng = np.radians(features["lat"]), np.radians(features["lng"])
+    a = (np.sin((lat[right] - lat[left]) / 2) ** 2
+         + np.cos(lat[left]) * np.cos(lat[right]) * np.sin((lng[right] - lng[left]) / 2) ** 2)
+    near = 2 * 6_371_000 * np.arcsin(np.sqrt(a)) <= NEAR_METERS  # NaN (no coordinates) is never near
+
+    domains = features["domain"]
+    has_domain = domains.getnnz(axis=1) > 0
+    evidence = {
+        "name": name,
+        "phone": _shares_key(features["phone"], left, right),
+        "email": _shares_key(features["email"], left, right),
+        "near": near,
+        "conflict": has_domain[left] & has_domain[right] & ~_shares_key(domains, left, right),
+    }
+    score = sum(WEIGHTS[key] * values for key, values in evidence.items())
+    score = np.where(name >= MIN_NAME_SIMILARITY, score, 0.0)
+    return pd.DataFrame({"left": left, "right": right, "score": score, **evidence})
+
+
+def _init_worker(shared):
+    _shared.update(shared)
+
+
+def match_features(df):
+    """Normalized blocking and scoring features for every row."""
+    n = len(df)
+    frame = df.reset_index(drop=True)
+    names = frame["Company Name"].fillna("").astype(str)
+    normalized = {name: normalize_name(name) for name in pd.unique(names)}
+    names = np.array([normalized[name] for name in names], dtype=object)
+    lat = frame["Latitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+    lng = frame["Longitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+    empty = pd.Series([""] * n)
+    grams = trigram_matrix(names)
+    email_rows, emails = email_keys(frame.get("Email/Website", empty))
+    company = np.array(["@" not in key for key in emails], dtype=bool)  # webmail keys are whole addresses
+    return {
+        "trigrams": grams,
+        "trigram_counts": grams.getnnz(axis=1),
+        "phone": incidence(n, *phone_keys(frame.get("Phone number", empty))),
+        "email": incidence(n, email_rows, emails),
+        "domain": incidence(n, email_rows[company], emails[company]),
+        "grid": incidence(n, *grid_keys(lat, lng)),
+        "lat": lat,
+        "lng": lng,
+    }
+
+
+def find_matches(df, workers=None, threshold=MATCH_THRESHOLD):
+    """Scored candidate pairs (row positions) at or above ``threshold``.
+
+    Rows are only compared within a block (same phone, same mail domain or
+    address, same grid cell, or at least two rare name trigrams in common),
+    so the work grows with block sizes, not with the square of the rows.
+    Blocks are scored in chunks of SCORE_CHUNK pairs, in parallel when
+    called from the main thread.
+    """
+    features = match_features(df)
+    left, right = candidate_pairs(features)
+    tasks = [(left[i:i + SCORE_CHUNK], right[i:i + SCORE_CHUNK]) for i in range(0, len(left), SCORE_CHUNK)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if threading.current_thread() is not threading.main_thread():
+        workers = 1  # pipeline stages and the server's reloads run on threads; never fork from one
+
+    if workers <= 1:
+        _shared["features"] = features
+        scored = [score_pairs(task) for task in tasks]
+    elif "fork" in multiprocessing.get_all_start_methods():
+        _shared["features"] = features
+        with multiprocessing.get_context("fork").Pool(workers, _init_worker, ({},)) as pool:
+            scored = pool.map(score_pairs, tasks)
+    else:
+        with multiprocessing.get_context().Pool(workers, _init_worker, ({"features": features},)) as pool:
+            scored = pool.map(score_pairs, tasks)
+    _shared.clear()
+
+    if not scored:
+        return score_pairs((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)))
+    matches = pd.concat(scored, ignore_index=True)
+    return matches[matches["score"] >= threshold].reset_index(drop=True)
+
+
+def entity_representatives(n, matches):
+    """Row position of each row's canonical record (the first row of its entity)."""
+    graph = sparse.coo_matrix((np.ones(len(matches)), (matches["left"], matches["right"])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    first = np.full(labels.max() + 1 if n else 0, n, dtype=np.int64)
+    np.minimum.at(first, labels, np.arange(n))
+    return first[labels]
+
+
+def resolve_entities(df, workers=None, threshold=MATCH_THRESHOLD, use_cache=True):
+    """Copy of ``df`` with an ``entity_id`` column shared by rows of the same company.
+
+    The id is the ``row_keys`` key of the entity's first row, so companies
+    without duplicates keep the key the live updates already use. Results
+    are cached by the content of the matching columns.
+    """
+    df = df.drop(columns=ENTITY_COLUMN, errors="ignore").reset_index(drop=True)
+
+    def build():
+        return json.dumps(entity_representatives(len(df), find_matches(df, workers, threshold)).tolist())
+
+    if use_cache:
+        key = frame_hash(df, MATCH_COLUMNS) + "-" + options_key(
+            threshold=threshold, weights=WEIGHTS, min_name=MIN_NAME_SIMILARITY, stopwords=sorted(NAME_STOPWORDS),
+            near=NEAR_METERS, grid=GRID_DEGREES, blocks=[MAX_BLOCK, MAX_TRIGRAM_BLOCK, MIN_SHARED_TRIGRAMS])
+        representatives = np.array(json.loads(cached_text("entities", key, build)), dtype=np.int64)
+    else:
+        representatives = np.array(json.loads(build()), dtype=np.int64)
+    df[ENTITY_COLUMN] = row_keys(df)[representatives] if len(df) else []
+    return df
+
+
+def merge_entities(df):
+    """One row per ``entity_id``: the first non-empty value of each column, in row order."""
+    if ENTITY_COLUMN not in df.columns:
+        df = resolve_entities(df)
+    text = [col for col in df.columns if df[col].dtype == object or pd.api.types.is_string_dtype(df[col])]
+    blanked = df.copy()
+    for col in text:
+        blanked[col] = blanked[col].mask(blanked[col].astype(str).str.strip() == "")
+    merged = blanked.groupby(ENTITY_COLUMN, sort=False, observed=True).first().reset_index()
+    for col in text:
+        if col != ENTITY_COLUMN:
+            merged[col] = merged[col].fillna("")
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            merged[col] = merged[col].astype(df[col].dtype)
+    return merged[list(df.columns)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find duplicate stakeholders across one or more registries.")
+    parser.add_argument("paths", nargs="*", default=["stakeholders.csv"])
+    parser.add_argument("--workers", type=int, help="default: one per core")
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD)
+    parser.add_argument("--out", help="write the merged registry (one row per company) to this CSV")
+    args = parser.parse_args()
+
+    df = pd.concat([load_stakeholders(path, drop_invalid=False).assign(source=path) for path in args.paths],
+                   ignore_index=True)
+    start = time.perf_counter()
+    matches = find_matches(df, args.workers, args.threshold)
+    resolved = df.assign(**{ENTITY_COLUMN: row_keys(df)[entity_representatives(len(df), matches)]})
+    elapsed = time.perf_counter() - start
+
+    names = df["Company Name"].astype(str).to_numpy()
+    for row in matches.itertuples():
+        print(f"{row.score:.2f}  {names[row.left]!r} ({df['source'][row.left]}) ~ "
+              f"{names[row.right]!r} ({df['source'][row.right]})")
+    entities = resolved[ENTITY_COLUMN].nunique()
+    print(f"{len(df):,} rows -> {entities:,} companies ({len(matches):,} matched pairs) in {elapsed:.1f} s")
+    if args.out:
+        merge_entities(resolved).drop(columns="source").to_csv(args.out, index=False)
@@ -0,0 +1,315 @@
+import argparse
+import base64
+import json
+import re
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+from boundary_store import read_boundaries
+from search_index import split_commodities
+from spatial_join import assign_lgas
+
+# Canonical category names; variants ("Aggregators", "seed companies",
+# "PROCESSOR") are folded onto these
+CATEGORIES = ["Contract Farming", "Seeds Company", "Aggregator", "Processors", "Fertilizer Company"]
+
+# Facet value for rows without a commodity or outside every LGA
+UNSPECIFIED = "Unspecified"
+
+FACETS = ["category", "commodity", "lga"]
+FACET_LABELS = {"category": "Category", "commodity": "Commodity", "lga": "LGA"}
+
+
+def facet_key(value):
+    """Comparison key: lowercase words with a plural "s" dropped ("Seeds Companies" -> "seed company")."""
+    words = re.sub(r"[^0-9a-z]+", " ", str(value).lower()).split()
+    return " ".join(re.sub(r"(?<=[a-z]{3})(ies|s)$", lambda m: "y" if m.group(1) == "ies" else "", word)
+                    for word in words)
+
+
+def _canonical(values, known=()):
+    # Display value per distinct raw value: a known name when the keys match,
+    # else the most common spelling among the raw values sharing its key
+    cleaned = values.astype(object).fillna("").astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    display = {facet_key(name): name for name in known}
+    mapping = {}
+    for spelling in cleaned[cleaned != ""].value_counts().index:  # most common first
+        key = facet_key(spelling)
+        if key:
+            mapping[spelling] = display.setdefault(key, spelling)
+    return cleaned.map(mapping).fillna("")
+
+
+def normalize_categories(values):
+    """Category values folded onto CATEGORIES (other values keep their most common spelling)."""
+    return _canonical(values, CATEGORIES)
+
+
+def _encode(values, missing=UNSPECIFIED):
+    # Dictionary encoding in the smallest unsigned dtype
+    codes, uniques = pd.factorize(values.replace("", missing), sort=True)
+    return codes.astype(np.min_scalar_type(max(len(uniques) - 1, 0))), list(uniques)
+
+
+def _bitset(n, positions):
+    mask = np.zeros(n, dtype=bool)
+    mask[positions] = True
+    return np.packbits(mask)
+
+
+class FacetStore:
+    """Compact, faceted stakeholder store for fast multi-facet filtering.
+
+    Categories, commodities and LGAs are dictionary encoded and each facet
+    value has a packed bitset (one bit per row, 125 KB per value for a
+    million rows); filters are AND/OR over bitsets. Coordinates are float32
+    arrays. ``Commodity`` is free text, so a row is in the bitset of every
+    commodity it lists.
+    """
+
+    def __init__(self, df, lgas=None):
+        df = df.reset_index(drop=True)
+        self.n = len(df)
+        self.lat = df["Latitude"].to_numpy(dtype=np.float32, na_value=np.nan)
+        self.lng = df["Longitude"].to_numpy(dtype=np.float32, na_value=np.nan)
+        self.names = df["Company Name"].fillna("").astype(str).to_numpy(dtype=object)
+
+        self.category_codes, self.categories = _encode(normalize_categories(df["Category"]))
+
+        # Commodities: (row, code) pairs, CSR style. Free text is split once
+        # per distinct value, then expanded to the rows holding that value
+        raw_codes, raw_values = pd.factorize(df["Commodity"].astype(object).fillna(""))
+        parts = _canonical(split_commodities(pd.Series(raw_values, dtype=object)).str.title())
+        parts = parts[parts != ""]
+        parts = parts[~pd.MultiIndex.from_arrays([parts.index, parts]).duplicated()]
+        value_codes, self.commodities = _encode(parts)
+        by_value = np.argsort(raw_codes, kind="stable")
+        starts = np.searchsorted(raw_codes[by_value], np.arange(len(raw_values) + 1))
+        distinct = parts.index.to_numpy()
+        sizes = starts[distinct + 1] - starts[distinct]
+        within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        rows = by_value[np.repeat(starts[distinct], sizes) + within]
+        codes = np.repeat(value_codes, sizes)
+        missing = np.setdiff1d(np.arange(self.n), rows)
+        if len(missing):
+            self.commodities.append(UNSPECIFIED)
+        rows = np.concatenate([rows, missing])
+        codes = np.concatenate([codes, np.full(len(missing), len(self.commodities) - 1)])
+        order = np.argsort(rows, kind="stable")
+        self.commodity_codes = codes[order].astype(np.min_scalar_type(max(len(self.commodities) - 1, 0)))
+        self.commodity_offsets = np.searchsorted(rows[order], np.arange(self.n + 1)).astype(np.int64)
+
+        if "lganame" not in df.columns:
+            df = assign_lgas(df, lgas if lgas is not None else read_boundaries("lga_boundaries.geojson"))
+        self.lga_codes, self.lgas = _encode(df["lganame"].fillna("").astype(str))
+
+        self.bitsets = {
+            "category": {value: _bitset(self.n, self.category_codes == i) for i, value in enumerate(self.categories)},
+            "commodity": {value: _bitset(self.n, rows[codes == i]) for i, value in enumerate(self.commodities)},
+            "lga": {value: _bitset(self.n, self.lga_codes == i) for i, value in enumerate(self.lgas)},
+        }
+        self._lookup = {facet: {facet_key(value): value for value in values} for facet, values in self.bitsets.items()}
+
+    def values(self, facet):
+        return list(self.bitsets[facet])
+
+    def bitset(self, facet, value):
+        """Packed bitset of one facet value (matched by ``facet_key``, so "maize" finds "Maize")."""
+        if facet not in self.bitsets:
+            raise ValueError(f"Unknown facet: {facet} (expected one of {', '.join(FACETS)})")
+        value = self._lookup[facet].get(facet_key(value))
+        if value is None:
+            return np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        return self.bitsets[facet][value]
+
+    def mask(self, **facets):
+        """Packed bitset of the rows matching every facet; a list of values matches any of them.
+
+        ``store.mask(category="Processors", commodity="Maize", lga="Zaria")``
+        """
+        result = np.full((self.n + 7) // 8, 0xFF, dtype=np.uint8)
+        for facet, wanted in facets.items():
+            if wanted is None:
+                continue
+            union = np.zeros_like(result)
+            for value in [wanted] if isinstance(wanted, str) else wanted:
+                union |= self.bitset(facet, value)
+            result &= union
+        return result
+
+    def filter(self, **facets):
+        """Row positions matching the facets (see ``mask``)."""
+        return np.flatnonzero(np.unpackbits(self.mask(**facets), count=self.n))
+
+    def count(self, **facets):
+        return int(np.bitwise_count(self.mask(**facets)).sum())
+
+    def facet_counts(self, facet, **facets):
+        """Rows per value of ``facet`` among the rows matching the other facets."""
+        selected = self.mask(**facets)
+        return {value: int(np.bitwise_count(bits & selected).sum()) for value, bits in self.bitsets[facet].items()}
+
+    def row_commodities(self, i):
+        return [self.commodities[c] for c in self.commodity_codes[self.commodity_offsets[i]:self.commodity_offsets[i + 1]]]
+
+    def nbytes(self):
+        """Memory held by the encoded columns and bitsets (names excluded)."""
+        arrays = [self.lat, self.lng, self.category_codes, self.lga_codes, self.commodity_codes, self.commodity_offsets]
+        return sum(a.nbytes for a in arrays) + sum(b.nbytes for bits in self.bitsets.values() for b in bits.values())
+
+
+class FacetFilter(folium.MacroElement):
+    """Shows only the markers of a ColumnarMarkers layer whose facet values are toggled on.
+
+    Every facet value becomes a layer-control entry (``FacetToggle``) that
+    only flips bits: the markers exist once and are added to or removed
+    from their target in one batch per change. A marker is shown when, in
+    every facet, at least one of its values is on.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var source = {{ this.markers.get_name() }};
+            var target = {{ this.target.get_name() }};
+            var bitsets = {{ this.bitsets }};
+            var n = source.markers.length;
+            var active = {};
+            var shown = new Uint8Array(n).fill(1);
+            var pending = null;
+
+            function decode(text) {
+                var raw = atob(text), bytes = new Uint8Array(raw.length);
+                for (var i = 0; i < raw.length; i++) { bytes[i] = raw.charCodeAt(i); }
+                return bytes;
+            }
+            Object.keys(bitsets).forEach(function(facet) {
+                active[facet] = {};
+                Object.keys(bitsets[facet]).forEach(function(value) {
+                    bitsets[facet][value] = decode(bitsets[facet][value]);
+                });
+            });
+
+            function selected() {
+                // Bytewise AND across facets of the OR within each facet
+                var mask = new Uint8Array((n + 7) >> 3).fill(255);
+                Object.keys(active).forEach(function(facet) {
+                    var union = new Uint8Array(mask.length);
+                    Object.keys(active[facet]).forEach(function(value) {
+                        var bits = bitsets[facet][value];
+                        for (var i = 0; i < union.length; i++) { union[i] |= bits[i]; }
+                    });
+                    for (var i = 0; i < mask.length; i++) { mask[i] &= union[i]; }
+                });
+                return mask;
+            }
+            function refresh() {
+                pending = null;
+                var mask = selected(), add = [], remove = [];
+                for (var i = 0; i < n; i++) {
+                    var on = (mask[i >> 3] >> (7 - (i & 7))) & 1;
+                    if (on !== shown[i]) {
+                        (on ? add : remove).push(source.markers[i]);
+                        shown[i] = on;
+                    }
+                }
+                if (target.removeLayers) {
+                    target.removeLayers(remove);
+                    target.addLayers(add);
+                } else {
+                    remove.forEach(function(marker) { target.removeLayer(marker); });
+                    add.forEach(function(marker) { target.addLayer(marker); });
+                }
+            }
+            // The layer control toggles many entries at once; refresh once
+            function schedule() { if (!pending) { pending = setTimeout(refresh, 0); } }
+
+            var Toggle = L.Layer.extend({
+                initialize: function(facet, value) { this.facet = facet; this.value = value; },
+                onAdd: function() { active[this.facet][this.value] = true; schedule(); },
+                onRemove: function() { delete active[this.facet][this.value]; schedule(); }
+            });
+
+            return {
+                toggle: function(facet, value) { return new Toggle(facet, value); },
+                shown: function() { return shown; },
+                refresh: refresh
+            };
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, store, markers, target, facets=("category", "commodity")):
+        super().__init__()
+        self._name = "FacetFilter"
+        self.markers = markers
+        self.target = target
+        self.bitsets = json.dumps({
+            facet: {value: base64.b64encode(bits.tobytes()).decode("ascii") for value, bits in store.bitsets[facet].items()}
+            for facet in facets
+        })
+
+
+class FacetToggle(folium.map.Layer):
+    """Layer-control entry for one facet value of a FacetFilter."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = {{ this.filter.get_name() }}.toggle({{ this.facet|tojson }}, {{ this.value|tojson }});
+        {%- if this.show %}
+        {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {%- endif %}
+        {% endmacro %}
+    """)
+
+    def __init__(self, facet_filter, facet, value, name=None, show=True):
+        super().__init__(name=name or value, overlay=True, control=True, show=show)
+        self._name = "FacetToggle"
+        self.filter = facet_filter
+        self.facet = facet
+        self.value = value
+
+
+def add_facet_layers(m, store, markers, target, facets=("category", "commodity"), counts=True):
+    """One toggleable layer per facet value over the markers of ``markers``; returns the filter.
+
+    Entries are named "Category: Processors (12)" and listed facet by facet.
+    """
+    facet_filter = FacetFilter(store, markers, target, facets)
+    facet_filter.add_to(m)
+    for facet in facets:
+        sizes = store.facet_counts(facet)
+        for value in store.values(facet):
+            name = f"{FACET_LABELS[facet]}: {value}" + (f" ({sizes[value]})" if counts else "")
+            FacetToggle(facet_filter, facet, value, name=name).add_to(m)
+    return facet_filter
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter stakeholders by category, commodity and LGA.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--category", action="append")
+    parser.add_argument("--commodity", action="append")
+    parser.add_argument("--lga", action="append")
+    args = parser.parse_args()
+
+    from loader import load_stakeholders
+
+    df = load_stakeholders(args.csv)
+    start = time.perf_counter()
+    store = FacetStore(df)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    positions = store.filter(category=args.category, commodity=args.commodity, lga=args.lga)
+    queried = time.perf_counter() - start
+    for i in positions:
+        print(f"{store.names[i]} | {store.categories[store.category_codes[i]]} | "
+              f"{', '.join(store.row_commodities(i))} | {store.lgas[store.lga_codes[i]]}")
+    print(f"{len(positions)} of {store.n:,} rows; built in {built * 1000:.0f} ms, "
+          f"filtered in {queried * 1000:.2f} ms, {store.nbytes() / 1024:.0f} KB")
+    for facet in FACETS:
+        print(f"{FACET_LABELS[facet]}: {store.facet_counts(facet)}")
@@ -0,0 +1,387 @@
+import argparse
+import difflib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from boundary_store import read_boundaries
+from cache import CACHE_DIR, options_key, stats
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # only the HTTP backend needs requests
+    requests = None
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+USER_AGENT = "stakeholders-map/1.0"
+
+# Usage policy of the public Nominatim server: one request at a time, at most one per second
+PUBLIC_NOMINATIM_HOSTS = {"nominatim.openstreetmap.org"}
+PUBLIC_MIN_INTERVAL = 1.0
+
+LGA_PATH = "lga_boundaries.geojson"
+ADDRESS_COLUMN = "Office Address"
+
+# Place a row was geocoded to ("" when its own coordinates were valid)
+GEOCODE_COLUMN = "Geocoded"
+
+# Spellings normalized before addresses are compared or cached
+ABBREVIATIONS = {
+    "rd": "road", "st": "street", "str": "street", "ave": "avenue", "expy": "expressway",
+    "govt": "government", "lga": "",
+}
+
+# A place name followed by one of these is part of a road name ("Kaduna-Zaria Road")
+ROAD_WORDS = {"road", "street", "way", "avenue", "expressway", "express", "highway", "bypass", "close", "crescent"}
+
+# Trailing words dropped to get a town alias shared by split LGAs (Kaduna North/South -> Kaduna)
+COMPASS_WORDS = {"north", "south", "east", "west", "central"}
+
+# Misspelled tokens of this length or more are matched to the closest place name
+FUZZY_MIN_LENGTH = 5
+FUZZY_CUTOFF = 0.8
+
+# Lookups are written to the cache in batches so an interrupted run keeps its progress
+BATCH_SIZE = 1000
+
+
+def normalize_address(text):
+    """Lowercase, punctuation-free address with common abbreviations expanded (the cache key)."""
+    tokens = "".join(c if c.isalnum() else " " for c in str(text).lower()).split()
+    return " ".join(word for word in (ABBREVIATIONS.get(token, token) for token in tokens) if word)
+
+
+class GeocodeCache:
+    """Persistent address -> coordinates cache (SQLite under .cache/geocode).
+
+    Keys are normalized addresses, per backend. Misses are stored too (as
+    NULL coordinates) so unresolvable addresses are not looked up again.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            directory = os.path.join(CACHE_DIR, "geocode")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "geocode.sqlite")
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS places (backend TEXT, address TEXT, lat REAL, lng REAL,"
+                        " place TEXT, PRIMARY KEY (backend, address))")
+
+    def get(self, backend, addresses):
+        """{address: (lat, lng, place)} for the cached ones (lat is None for known misses)."""
+        found = {}
+        addresses = list(addresses)
+        for start in range(0, len(addresses), 500):
+            chunk = addresses[start:start + 500]
+            rows = self.db.execute(f"SELECT address, lat, lng, place FROM places WHERE backend = ? AND address IN"
+                                   f" ({', '.join('?' * len(chunk))})", [backend] + chunk)
+            found.update({address: (lat, lng, place) for address, lat, lng, place in rows})
+        return found
+
+    def put(self, backend, rows):
+        self.db.executemany("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?)",
+                            [(backend, address, lat, lng, place) for address, lat, lng, place in rows])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class GazetteerBackend:
+    """Offline geocoder over place names, e.g. the LGAs of ``lga_boundaries.geojson``.
+
+    An address resolves to the last place named in it (Nigerian addresses
+    end with the town), preferring plain mentions over road names ("Zaria
+    Road") and state names; a place maps to a point inside its boundary, so
+    precision is that of the gazetteer (LGA level for the boundaries file).
+    """
+
+    concurrent = False
+
+    def __init__(self, places, states=()):
+        # places: {normalized name: (lat, lng, label)}; states: names that mean a whole state
+        self.places = dict(places)
+        self.states = set(states)
+        self.name = f"gazetteer-{options_key(places=sorted(self.places.items()))}"
+        self._longest = max((len(name.split()) for name in self.places), default=1)
+        self._words = sorted({name for name in self.places if " " not in name})
+        self._fuzzy = {}
+
+    @classmethod
+    def from_boundaries(cls, path=LGA_PATH, name_field="lganame", state_field="statename"):
+        """Gazetteer of the boundary names: each area, its town alias and its state."""
+        frame = read_boundaries(path, columns=[name_field, state_field])
+        frame = frame[frame.geometry.notna() & frame[name_field].notna()]
+        areas, states = {}, {}
+        for name, state, geometry in zip(frame[name_field], frame[state_field], frame.geometry):
+            words = str(name).split()
+            areas.setdefault(normalize_address(name), (name, []))[1].append(geometry)
+            if len(words) > 1 and words[-1].lower() in COMPASS_WORDS:
+                alias = " ".join(words[:-1])
+                areas.setdefault(normalize_address(alias), (alias, []))[1].append(geometry)
+            if state:
+                states.setdefault(normalize_address(state), (state, []))[1].append(geometry)
+        # A state name that is also a town (Kaduna) means the town
+        states = {key: group for key, group in states.items() if key not in areas}
+        places = {}
+        for key, (label, geometries) in {**areas, **states}.items():
+            point = shapely.point_on_surface(shapely.union_all(geometries))
+            places[key] = (round(point.y, 6), round(point.x, 6), label)
+        return cls(places, states)
+
+    def _match_word(self, word):
+        if word in self.places or len(word) < FUZZY_MIN_LENGTH:
+            return word
+        if word not in self._fuzzy:
+            close = difflib.get_close_matches(word, self._words, n=1, cutoff=FUZZY_CUTOFF)
+            self._fuzzy[word] = close[0] if close else word
+        return self._fuzzy[word]
+
+    def geocode(self, address):
+        tokens = [self._match_word(word) for word in address.split()]
+        matches, covered = [], set()
+        for size in range(min(self._longest, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                span = range(start, start + size)
+                phrase = " ".join(tokens[start:start + size])
+                if phrase in self.places and covered.isdisjoint(span):
+                    matches.append((start, start + size, phrase))
+                    covered.update(span)
+        if not matches:
+            return None
+
+        def rank(match):
+            start, end, phrase = match
+            if phrase in self.states or tokens[end:end + 1] == ["state"]:
+                return 0, start
+            # Other place names may sit in between: "Kaduna Zaria Road"
+            following = next((tokens[i] for i in range(end, len(tokens)) if i not in covered), "")
+            return (1 if following in ROAD_WORDS else 2), start
+
+        return self.places[max(matches, key=rank)[2]]
+
+
+class NominatimBackend:
+    """Nominatim /search over one pooled HTTP session.
+
+    Against the public server requests go one at a time, at least
+    PUBLIC_MIN_INTERVAL seconds apart (its usage policy); point
+    ``base_url`` at your own instance or at ``python geocode.py serve``
+    (the local stand-in) for concurrent batch runs.
+    """
+
+    def __init__(self, base_url=NOMINATIM_URL, country="ng", pool_size=8, timeout=30):
+        if requests is None:
+            raise ImportError("requests is required for the nominatim backend")
+        host = urlsplit(base_url).hostname or ""
+        public = host in PUBLIC_NOMINATIM_HOSTS
+        self.concurrent = not public
+        self.min_interval = PUBLIC_MIN_INTERVAL if public else 0.0
+        self._lock = threading.Lock()
+        self._last = 0.0
+        self.name = f"nominatim-{urlsplit(base_url).netloc}-{country}"
+        self.url = base_url.rstrip("/")
+        self.country = country
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+
+    def _throttle(self):
+        with self._lock:
+            wait = self._last + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last = time.monotonic()
+
+    def geocode(self, address):
+        if self.min_interval:
+            self._throttle()
+        response = self.session.get(f"{self.url}/search", timeout=self.timeout, params={
+            "q": address, "format": "jsonv2", "limit": 1, "countrycodes": self.country,
+        })
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"]), results[0].get("display_name", "")
+
+
+def _lookup(backend, address):
+    # None for "no such place"; False for a failed request, which is retried on the next run
+    try:
+        return backend.geocode(address)
+    except Exception:
+        stats["geocode:error"] += 1
+        return False
+
+
+def resolve_addresses(addresses, backends, cache=None, workers=8):
+    """{normalized address: (lat, lng, place)} for the ones any backend resolves.
+
+    ``addresses`` must already be normalized and unique. Each backend in
+    turn gets the addresses still unresolved: cached answers are used first
+    and only the misses are looked up, concurrently for HTTP backends.
+    """
+    cache = cache or GeocodeCache()
+    pending = [address for address in addresses if address]
+    found = {}
+    for backend in backends:
+        if not pending:
+            break
+        known = cache.get(backend.name, pending)
+        stats["geocode:hit"] += len(known)
+        misses = [address for address in pending if address not in known]
+        stats["geocode:miss"] += len(misses)
+        pool = ThreadPoolExecutor(max_workers=workers) if backend.concurrent and workers > 1 and misses else None
+        try:
+            for start in range(0, len(misses), BATCH_SIZE):
+                batch = misses[start:start + BATCH_SIZE]
+                if pool is not None:
+                    results = list(pool.map(lambda address: _lookup(backend, address), batch))
+                else:
+                    results = [_lookup(backend, address) for address in batch]
+                rows = [(address, *(result or (None, None, None)))
+                        for address, result in zip(batch, results) if result is not False]
+                cache.put(backend.name, rows)
+                known.update({address: (lat, lng, place) for address, lat, lng, place in rows})
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        found.update({address: hit for address, hit in known.items() if hit[0] is not None})
+        pending = [address for address in pending if address not in found]
+    return found
+
+
+def geocode_addresses(addresses, backends=None, cache=None, workers=8):
+    """Latitude, Longitude and place for each address (NaN/"" where unresolved).
+
+    Work is bounded by the number of distinct addresses, not rows: the raw
+    texts are deduplicated, normalized, deduplicated again and resolved
+    once each (see ``resolve_addresses``).
+    """
+    backends = backends if backends is not None else [GazetteerBackend.from_boundaries()]
+    raw = pd.Series(addresses, dtype=object).fillna("").astype(str)
+    codes, uniques = pd.factorize(raw)
+    keys = np.array([normalize_address(text) for text in uniques], dtype=object)
+    key_codes, unique_keys = pd.factorize(keys)
+    found = resolve_addresses(list(unique_keys), backends, cache, workers)
+
+    hits = [found.get(key, (np.nan, np.nan, "")) for key in unique_keys]
+    lat = np.array([hit[0] for hit in hits], dtype=float)
+    lng = np.array([hit[1] for hit in hits], dtype=float)
+    place = np.array([hit[2] for hit in hits], dtype=object)
+    rows = key_codes[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+    return pd.DataFrame({"Latitude": lat[rows], "Longitude": lng[rows], "place": place[rows]}, index=raw.index)
+
+
+def invalid_coordinates(df):
+    """Rows whose coordinates are missing, out of range or exactly (0, 0)."""
+    lat = pd.to_numeric(df["Latitude"], errors="coerce").astype(float)
+    lng = pd.to_numeric(df["Longitude"], errors="coerce").astype(float)
+    return (lat.isna() | lng.isna() | ~lat.between(-90, 90) | ~lng.between(-180, 180)
+            | ((lat == 0) & (lng == 0)))
+
+
+def geocode_missing(df, backends=None, cache=None, workers=8, drop_unresolved=True):
+    """Fill the coordinates of rows without valid ones from their Office Address.
+
+    Load with ``drop_invalid=False`` so those rows are still there. Filled
+    rows get the matched place in ``Geocoded``; rows nobody can place are
+    dropped (or kept with NaN coordinates when ``drop_unresolved`` is False).
+    """
+    df = df.copy()
+    invalid = invalid_coordinates(df).to_numpy()
+    df[GEOCODE_COLUMN] = ""
+    if invalid.any() and ADDRESS_COLUMN in df.columns:
+        found = geocode_addresses(df.loc[invalid, ADDRESS_COLUMN], backends, cache, workers)
+        for col in ("Latitude", "Longitude"):
+            df[col] = df[col].where(~invalid, pd.Series(found[col].to_numpy(), index=df.index[invalid]))
+        df.loc[invalid, GEOCODE_COLUMN] = found["place"].to_numpy()
+        stats["geocode:filled"] += int(found["Latitude"].notna().sum())
+    if drop_unresolved:
+        df = df[~invalid_coordinates(df).to_numpy()].reset_index(drop=True)
+    return df
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    # Answers Nominatim /search from a gazetteer (set by serve_stand_in)
+    gazetteer = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/search":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query).get("q", [""])[0]
+        hit = self.gazetteer.geocode(normalize_address(query))
+        data = [{"lat": str(hit[0]), "lon": str(hit[1]), "display_name": hit[2]}] if hit else []
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stand_in(host="127.0.0.1", port=8081, background=False, gazetteer=None):
+    """Local Nominatim stand-in; with ``background`` it runs in a thread."""
+    _StandInHandler.gazetteer = gazetteer or GazetteerBackend.from_boundaries()
+    server = ThreadingHTTPServer((host, port), _StandInHandler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"nominatim stand-in on http://{host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill missing stakeholder coordinates from office addresses.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the local nominatim stand-in")
+    serve.add_argument("--port", type=int, default=8081)
+    fill = sub.add_parser("fill", help="geocode the rows without valid coordinates")
+    fill.add_argument("--csv", default="stakeholders.csv")
+    fill.add_argument("--backend", default="gazetteer",
+                      help='"gazetteer", "nominatim" or a stand-in URL (tried before the gazetteer)')
+    fill.add_argument("--workers", type=int, default=8)
+    fill.add_argument("--out", help="write the filled registry to this CSV")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_stand_in(port=args.port)
+    else:
+        from loader import load_stakeholders
+
+        backends = [GazetteerBackend.from_boundaries()]
+        if args.backend == "nominatim":
+            backends.insert(0, NominatimBackend())
+        elif args.backend != "gazetteer":
+            backends.insert(0, NominatimBackend(base_url=args.backend))
+        df = load_stakeholders(args.csv, drop_invalid=False)
+        start = time.perf_counter()
+        filled = geocode_missing(df, backends, workers=args.workers, drop_unresolved=False)
+        elapsed = time.perf_counter() - start
+        missing = int(invalid_coordinates(df).sum())
+        addresses = df.loc[invalid_coordinates(df), ADDRESS_COLUMN].map(normalize_address).nunique()
+        print(f"{missing:,} of {len(df):,} rows without coordinates ({addresses:,} distinct addresses): "
+              f"{stats['geocode:filled']:,} filled in {elapsed:.2f} s")
+        print(f"Geocode cache: {stats['geocode:hit']} hits, {stats['geocode:miss']} misses, "
+              f"{stats['geocode:error']} errors")
+        if args.out:
+            filled.to_csv(args.out, index=False)
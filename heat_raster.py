@@ -0,0 +1,205 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import shutil
+import struct
+import zlib
+
+import folium
+import numpy as np
+from jinja2 import Template
+
+from cache import cache_path, options_key, stats, write_atomic
+from clustering import mercator_xy
+
+# Zoom bands sharing one raster: (min_zoom, max_zoom)
+DEFAULT_BANDS = ((0, 7), (8, 10), (11, 13), (14, 18))
+
+# Same ramp as the HeatMap in stakeholders_maps.py
+DEFAULT_GRADIENT = {0.2: "blue", 0.5: "green", 0.8: "yellow", 1.0: "red"}
+
+_COLORS = {
+    "blue": (0, 0, 255), "green": (0, 128, 0), "lime": (0, 255, 0),
+    "yellow": (255, 255, 0), "orange": (255, 165, 0), "red": (255, 0, 0),
+}
+
+
+def heat_weights(df, category_weights=None, commodity_weights=None, default=1.0):
+    """Per-row weights from Category and (free-text) Commodity, vectorized.
+
+    ``commodity_weights`` keys are matched case-insensitively inside the
+    Commodity text, so "Maize" applies to "Maize, Rice & Ginger".
+    """
+    weights = np.full(len(df), float(default))
+    if category_weights:
+        weights *= df["Category"].map(category_weights).fillna(1.0).to_numpy(dtype=float)
+    if commodity_weights:
+        commodity = df["Commodity"].fillna("").astype(str)
+        for name, weight in commodity_weights.items():
+            mask = commodity.str.contains(name, case=False, regex=False).to_numpy()
+            weights[mask] *= weight
+    return weights
+
+
+def encode_png(rgba):
+    """Minimal RGBA PNG encoder (no imaging library needed)."""
+    height, width, _ = rgba.shape
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)]).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+
+def _gaussian_matrix(centers, sigma):
+    # Dense separable kernel: row i spreads grid cell i to its neighbours
+    d = (centers[:, None] - centers[None, :]) / sigma
+    return np.exp(-0.5 * d * d)
+
+
+def density_grid(x, y, weights, bounds, shape, sigma):
+    """Weighted Gaussian KDE on a regular grid (in projected units)."""
+    x0, y0, x1, y1 = bounds
+    rows, cols = shape
+    hist, y_edges, x_edges = np.histogram2d(y, x, bins=(rows, cols), range=((y0, y1), (x0, x1)), weights=weights)
+    ky = _gaussian_matrix((y_edges[:-1] + y_edges[1:]) / 2, sigma)
+    kx = _gaussian_matrix((x_edges[:-1] + x_edges[1:]) / 2, sigma)
+    return ky @ hist @ kx.T
+
+
+def colorize(density, gradient=None, max_opacity=0.8, vmax=None):
+    """Map a density grid to RGBA using a Leaflet.heat style gradient."""
+    gradient = gradient or DEFAULT_GRADIENT
+    stops = sorted((float(k), _COLORS.get(v, (255, 0, 0))) for k, v in gradient.items())
+    positions = np.array([0.0] + [s for s, _ in stops])
+    colors = np.array([stops[0][1]] + [c for _, c in stops], dtype=float)
+
+    if vmax is None:
+        vmax = density.max() or 1.0
+    t = np.clip(density / vmax, 0.0, 1.0)
+
+    rgba = np.empty(density.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(t, positions, colors[:, channel])
+    rgba[..., 3] = np.clip(t / positions[1], 0.0, 1.0) * max_opacity * 255
+    return rgba
+
+
+def data_hash(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def build_heat_rasters(lat, lng, weights=None, bounds=None, bands=DEFAULT_BANDS, radius=15,
+                       max_cells=1024, gradient=None):
+    """Render one heat PNG per zoom band, cached by data hash and options.
+
+    ``radius`` is the kernel bandwidth in screen pixels at the middle zoom
+    of each band. ``bounds`` is (south, west, north, east); by default the
+    data extent padded by three bandwidths. Returns a list of dicts with
+    zoom range, lat/lng bounds and the PNG path in the cache.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    weights = np.ones(len(lat)) if weights is None else np.asarray(weights, dtype=float)
+    x, y = mercator_xy(lat, lng)
+    key = data_hash(lat, lng, weights)
+
+    rasters = []
+    for min_zoom, max_zoom in bands:
+        sigma = radius / (256 * 2 ** ((min_zoom + max_zoom) / 2))
+        if bounds is None:
+            pad = 3 * sigma
+            box = (x.min() - pad, y.min() - pad, x.max() + pad, y.max() + pad)
+        else:
+            south, west, north, east = bounds
+            (bx0, bx1), (by1, by0) = mercator_xy([south, north], [west, east])
+            box = (bx0, by0, bx1, by1)
+
+        # Cells of about a quarter bandwidth, capped for memory
+        width, height = box[2] - box[0], box[3] - box[1]
+        cell = max(sigma / 4, max(width, height) / max_cells)
+        shape = (max(1, int(math.ceil(height / cell))), max(1, int(math.ceil(width / cell))))
+
+        options = options_key(box=box, shape=shape, sigma=sigma, gradient=gradient)
+        path = cache_path("heatmap", f"{key}-{min_zoom}-{max_zoom}-{options}", "png")
+        if os.path.exists(path):
+            stats["heatmap:hit"] += 1
+        else:
+            stats["heatmap:miss"] += 1
+            density = density_grid(x, y, weights, box, shape, sigma)
+            # Mercator y grows southwards, so grid rows are already top -> bottom
+            write_atomic(path, encode_png(colorize(density, gradient)))
+
+        south, north = (float(v) for v in np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * np.array([box[3], box[1]]))))))
+        west, east = float(box[0] - 0.5) * 360.0, float(box[2] - 0.5) * 360.0
+        rasters.append({"minZoom": min_zoom, "maxZoom": max_zoom, "path": path,
+                        "bounds": [[south, west], [north, east]]})
+
+    return rasters
+
+
+class HeatRaster(folium.map.Layer):
+    """Precomputed heatmap: one image overlay per zoom band."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var bands = {{ this.bands }};
+            var group = L.layerGroup();
+            var overlays = bands.map(function(band) {
+                return L.imageOverlay(band.url, band.bounds, {opacity: 1, interactive: false});
+            });
+
+            function update() {
+                if (!map.hasLayer(group)) { return; }
+                var z = Math.round(map.getZoom());
+                bands.forEach(function(band, i) {
+                    var active = z >= band.minZoom && z <= band.maxZoom;
+                    if (active && !group.hasLayer(overlays[i])) { group.addLayer(overlays[i]); }
+                    if (!active && group.hasLayer(overlays[i])) { group.removeLayer(overlays[i]); }
+                });
+            }
+
+            map.on("zoomend", update);
+            group.on("add", update);
+            {%- if this.show %}
+            group.addTo(map);
+            {%- endif %}
+            return group;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, rasters, name="Heatmap", image_dir=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "HeatRaster"
+        bands = []
+        for raster in rasters:
+            if image_dir is None:
+                # Inline as a data URI so the HTML stays self-contained
+                with open(raster["path"], "rb") as f:
+                    url = "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+            else:
+                os.makedirs(image_dir, exist_ok=True)
+                url = os.path.join(image_dir, os.path.basename(raster["path"]))
+                shutil.copyfile(raster["path"], url)
+                url = url.replace(os.sep, "/")
+            bands.append({"minZoom": raster["minZoom"], "maxZoom": raster["maxZoom"],
+                          "bounds": raster["bounds"], "url": url})
+        self.bands = json.dumps(bands)
+
+
+def add_heat_raster(m, df, weights=None, name="Heatmap", image_dir=None, **kwargs):
+    """Add a precomputed heat layer for the stakeholder frame."""
+    rasters = build_heat_rasters(df["Latitude"], df["Longitude"], weights, **kwargs)
+    layer = HeatRaster(rasters, name=name, image_dir=image_dir)
+    layer.add_to(m)
+    return layer
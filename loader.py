@@ -0,0 +1,201 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache import cache_path, file_hash, options_key, row_hashes, stats
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # the Arrow cache is optional; without it every run parses the CSV
+    pa = None
+
+# Bump when the cleaning rules change so stale caches are not reused
+SCHEMA_VERSION = 1
+
+# Expected columns and their types once cleaned
+TEXT_COLUMNS = [
+    "Company Name", "Office Address", "Contact Person",
+    "Phone number", "Designation", "Email/Website",
+]
+CATEGORY_COLUMNS = ["Category", "Commodity"]
+COORDINATE_COLUMNS = ["Latitude", "Longitude"]
+REQUIRED_COLUMNS = ["Company Name", "Category"] + COORDINATE_COLUMNS
+
+# Files above this size are streamed in chunks instead of parsed in one go
+STREAM_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_CHUNKSIZE = 200_000
+
+# Canonical company id added by dedupe.resolve_entities
+ENTITY_COLUMN = "entity_id"
+
+
+def _read_csv(path, **kwargs):
+    # utf-8-sig strips the BOM Excel puts in front of "S/N"; every column is
+    # read as text first so phone numbers keep their leading zeros
+    return pd.read_csv(path, encoding="utf-8-sig", dtype=str, keep_default_na=False, **kwargs)
+
+
+def validate_columns(columns):
+    """Normalized column names; raises ValueError when required ones are missing."""
+    columns = [str(col).replace("\ufeff", "").strip() for col in columns]
+    missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing:
+        raise ValueError(f"stakeholders file is missing columns: {', '.join(missing)}")
+    return columns
+
+
+def clean_chunk(df, drop_invalid=True):
+    """Apply the typed schema to one raw chunk of the CSV."""
+    df.columns = validate_columns(df.columns)
+    for col in TEXT_COLUMNS + CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna("").astype(str).str.strip()
+    for col in COORDINATE_COLUMNS:
+        df[col] = pd.to_numeric(df[col].str.strip(), errors="coerce").astype(np.float32)
+    if "S/N" in df.columns:
+        df["S/N"] = pd.to_numeric(df["S/N"], errors="coerce").astype("Int64")
+    if drop_invalid:
+        df = df.dropna(subset=COORDINATE_COLUMNS)
+    return df
+
+
+def iter_stakeholder_chunks(path="stakeholders.csv", chunksize=DEFAULT_CHUNKSIZE, drop_invalid=True):
+    """Cleaned chunks of the CSV; memory stays bounded by ``chunksize`` rows."""
+    for chunk in _read_csv(path, chunksize=chunksize):
+        yield clean_chunk(chunk, drop_invalid)
+
+
+def _finish(df):
+    # Categorical columns are rebuilt after loading: dictionaries differ per chunk
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df.reset_index(drop=True)
+
+
+def _cache_file(path, drop_invalid):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = options_key(schema=SCHEMA_VERSION, drop_invalid=drop_invalid)
+    return cache_path("stakeholders", f"{stem}-{file_hash(path)[:16]}-{key}", "arrow")
+
+
+def _write_cache(target, chunks):
+    # Arrow IPC (uncompressed) so later runs can memory-map the file
+    tmp_path = f"{target}.tmp{os.getpid()}"
+    writer = None
+    try:
+        for chunk in chunks:
+            # A Table, not a RecordBatch: large string columns can arrive chunked
+            table = pa.Table.from_pandas(chunk.reset_index(drop=True), preserve_index=False)
+            if writer is None:
+                writer = pa.ipc.new_file(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, target)
+
+
+def open_stakeholder_table(path="stakeholders.csv", drop_invalid=True, chunksize=None):
+    """Memory-mapped Arrow table of the cleaned registry (builds the cache if needed).
+
+    Numeric columns can be read zero-copy, e.g.
+    ``table["Latitude"].to_numpy()``.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required for the Arrow stakeholder cache")
+    target = _cache_file(path, drop_invalid)
+    if os.path.exists(target):
+        stats["stakeholders:hit"] += 1
+    else:
+        stats["stakeholders:miss"] += 1
+        if chunksize is None and os.path.getsize(path) > STREAM_THRESHOLD:
+            chunksize = DEFAULT_CHUNKSIZE
+        if chunksize:
+            chunks = iter_stakeholder_chunks(path, chunksize, drop_invalid)
+        else:
+            chunks = [clean_chunk(_read_csv(path), drop_invalid)]
+        _write_cache(target, chunks)
+    return pa.ipc.open_file(pa.memory_map(target, "r")).read_all()
+
+
+def load_stakeholders(path="stakeholders.csv", drop_invalid=True, use_cache=True, chunksize=None):
+    """Cleaned stakeholder DataFrame with a typed schema.
+
+    Text columns are stripped strings (phone numbers keep leading zeros),
+    Category/Commodity are categorical and coordinates are float32. Rows
+    without valid coordinates are dropped unless ``drop_invalid`` is False.
+    With pyarrow installed the cleaned frame is cached as Arrow IPC, keyed by
+    the CSV's hash, and memory-mapped on later runs.
+    """
+    if use_cache and pa is not None:
+        return _finish(open_stakeholder_table(path, drop_invalid, chunksize).to_pandas())
+    if chunksize:
+        return _finish(pd.concat(iter_stakeholder_chunks(path, chunksize, drop_invalid), ignore_index=True))
+    return _finish(clean_chunk(_read_csv(path), drop_invalid))
+
+
+def row_keys(df):
+    """Stable string key per row, used to diff two versions of the registry.
+
+    The canonical ``entity_id`` when the registry has been merged to one
+    row per company, else ``S/N`` when it is present and unique, otherwise
+    a hash of the company name (with an ordinal suffix for repeated names),
+    so editing any other column keeps the key.
+    """
+    if ENTITY_COLUMN in df.columns and df[ENTITY_COLUMN].is_unique:
+        return df[ENTITY_COLUMN].astype(str).to_numpy()
+    if "S/N" in df.columns and df["S/N"].notna().all() and df["S/N"].is_unique:
+        return ("sn-" + df["S/N"].astype(str)).to_numpy()
+    names = df["Company Name"].astype(str).str.strip().str.lower()
+    hashed = pd.util.hash_array(names.to_numpy(dtype=object)).astype(np.uint64)
+    keys = pd.Series([f"{h:016x}" for h in hashed], index=df.index)
+    repeat = names.groupby(names).cumcount()
+    keys[repeat > 0] = keys[repeat > 0] + "-" + repeat[repeat > 0].astype(str)
+    return keys.to_numpy()
+
+
+def diff_hashes(old_keys, old_hashes, new_keys, new_hashes):
+    """(added, removed, changed) from unique row keys and content hashes alone.
+
+    ``added`` and ``changed`` are positions in the new arrays; ``removed``
+    are the old keys that disappeared. One hash lookup per row, no frame
+    comparison.
+    """
+    old_keys = np.asarray(old_keys, dtype=object)
+    position = pd.Index(old_keys).get_indexer(np.asarray(new_keys, dtype=object))
+    found = position >= 0
+    added = np.flatnonzero(~found)
+    matched = np.flatnonzero(found)
+    changed = matched[np.asarray(old_hashes)[position[matched]] != np.asarray(new_hashes)[matched]]
+    kept = np.zeros(len(old_keys), dtype=bool)
+    kept[position[matched]] = True
+    removed = sorted(old_keys[~kept].tolist())
+    return added.astype(np.int64), removed, changed.astype(np.int64)
+
+
+def diff_stakeholders(old, new, columns=None):
+    """(added, removed, changed) between two frames, matched by ``row_keys``.
+
+    ``added`` and ``changed`` are row positions in ``new``; ``removed`` are
+    the keys that disappeared. ``columns`` limits which columns count as a
+    change (default: all).
+    """
+    return diff_hashes(row_keys(old), row_hashes(old, columns), row_keys(new), row_hashes(new, columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate stakeholders.csv and build its Arrow cache.")
+    parser.add_argument("path", nargs="?", default="stakeholders.csv")
+    parser.add_argument("--chunksize", type=int)
+    args = parser.parse_args()
+
+    for attempt in ("first", "cached"):
+        start = time.perf_counter()
+        df = load_stakeholders(args.path, chunksize=args.chunksize)
+        print(f"{attempt} load: {len(df):,} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(df.dtypes.to_string())
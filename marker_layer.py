@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+
+import folium
+import pandas as pd
+from jinja2 import Template
+
+from cache import cached_text, frame_hash, options_key, row_hashes, stats
+
+# Columns shown in the popup, in display order (label, column)
+POPUP_FIELDS = [
+    ("Company", "Company Name"),
+    ("Category", "Category"),
+    ("Commodity", "Commodity"),
+    ("Office Address", "Office Address"),
+    ("Contact Person", "Contact Person"),
+    ("Phone", "Phone number"),
+    ("Designation", "Designation"),
+    ("Email/Website", "Email/Website"),
+]
+
+DEFAULT_ICON = "https://cdn-icons-png.flaticon.com/512/684/684908.png"
+
+# Sidecar popup details, written next to the HTML
+DETAILS_DIR = "details"
+
+# Popup columns kept in the marker payload when details live in sidecar shards
+SUMMARY_COLUMNS = ["Company Name", "Category"]
+
+# Page-wide loader for sidecar detail shards, shared by every marker layer.
+# Shards are cached and their callbacks keyed by shard URL, so layers reading
+# different details directories on one page do not take each other's shards.
+DETAILS_LOADER_JS = """var detailLoader = window.stakeholderDetailLoader || (window.stakeholderDetailLoader = (function() {
+                var shards = {};
+                var pending = {};
+                window.stakeholderDetails = function(url, shard) {
+                    shards[url] = shard;
+                    (pending[url] || []).forEach(function(done) { done(shard); });
+                    delete pending[url];
+                };
+                function load(url, format, done) {
+                    if (url in shards) { return done(shards[url]); }
+                    if (pending[url]) { return pending[url].push(done); }
+                    pending[url] = [done];
+                    var fail = function() { window.stakeholderDetails(url, null); };
+                    if (format === "js") {
+                        var script = document.createElement("script");
+                        script.src = url;
+                        script.onerror = fail;
+                        document.head.appendChild(script);
+                    } else {
+                        fetch(url).then(function(r) { return r.ok ? r.json() : null; })
+                            .then(function(shard) { window.stakeholderDetails(url, shard); }, fail);
+                    }
+                }
+                return {shards: shards, load: load};
+            })());"""
+
+
+def to_columnar(df, columns=None, precision=6, dict_ratio=0.5):
+    """Turn the stakeholder frame into one columnar payload (parallel arrays).
+
+    Low-cardinality columns (Category, Commodity, ...) are dictionary encoded:
+    the column holds integer codes and ``dicts[column]`` the distinct values.
+    """
+    if columns is None:
+        columns = [col for _, col in POPUP_FIELDS if col in df.columns]
+
+    payload = {
+        "n": len(df),
+        "lat": df["Latitude"].astype(float).round(precision).tolist(),
+        "lng": df["Longitude"].astype(float).round(precision).tolist(),
+        "cols": {},
+        "dicts": {},
+    }
+
+    for col in columns:
+        values = df[col].fillna("").astype(str).str.strip()
+        codes, uniques = pd.factorize(values)
+        if len(uniques) <= dict_ratio * max(len(values), 1):
+            payload["cols"][col] = codes.tolist()
+            payload["dicts"][col] = uniques.tolist()
+        else:
+            payload["cols"][col] = values.tolist()
+
+    return payload
+
+
+def dump_payload(payload):
+    # Compact JSON that is safe to inline inside a <script> tag
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).replace("</", "<\\/")
+
+
+def write_detail_shards(df, out_dir=DETAILS_DIR, columns=None, shard_size=500, fmt="js"):
+    """Write popup details to id-range shards: row ``i`` is in shard ``i // shard_size``.
+
+    ``fmt="js"`` wraps each shard in a ``stakeholderDetails(url, ...)``
+    callback, keyed by the shard's URL relative to the page, so pages opened
+    from file:// can load them with <script> tags. Shard files are named
+    ``d-<k>-<content hash>``, so a page never pairs with shards of another
+    build and only shards whose rows changed are written; files from the
+    previous build (listed in ``manifest.json``) that are no longer used are
+    removed. Returns the shard metadata expected by ``ColumnarMarkers(details=...)``.
+    """
+    if fmt not in ("js", "json"):
+        raise ValueError(f"Unknown details format: {fmt}")
+    if columns is None:
+        columns = [col for _, col in POPUP_FIELDS if col in df.columns and col not in SUMMARY_COLUMNS]
+    os.makedirs(out_dir, exist_ok=True)
+
+    url = out_dir.replace(os.sep, "/").rstrip("/") + "/"
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    options = options_key(columns=columns, shard_size=shard_size, fmt=fmt, url=url)
+    previous = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            previous = json.load(f).get("files", [])
+
+    hashes = row_hashes(df, columns)
+    files = []
+    values = None
+    for start in range(0, len(df), shard_size):
+        digest = hashlib.sha256(options.encode("utf-8") + hashes[start:start + shard_size].tobytes())
+        name = f"d-{start // shard_size}-{digest.hexdigest()[:16]}.{fmt}"
+        files.append(name)
+        if os.path.exists(os.path.join(out_dir, name)):
+            stats["details:hit"] += 1
+            continue
+        stats["details:miss"] += 1
+        if values is None:
+            values = {col: df[col].fillna("").astype(str).str.strip().tolist() for col in columns}
+        shard = {"start": start, "cols": {col: values[col][start:start + shard_size] for col in columns}}
+        body = json.dumps(shard, separators=(",", ":"), ensure_ascii=False)
+        if fmt == "js":
+            body = f'stakeholderDetails("{url}{name}",{body});'
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(body)
+
+    # Drop shards of the previous build that this one no longer uses
+    for name in set(previous) - set(files):
+        if os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"options": options, "files": files}, f)
+
+    return {"url": url, "format": fmt, "shardSize": shard_size, "count": len(df), "columns": columns,
+            "files": files}
+
+
+class ColumnarMarkers(folium.MacroElement):
+    """Single marker layer built on the client from a columnar payload.
+
+    Python does one vectorized pass over the frame; popups and tooltips are
+    templated in the browser only when they are opened. With ``details``
+    (from ``write_detail_shards``) the payload keeps only name and category
+    and the other popup fields are fetched from their shard on first open.
+    With ``sprites`` (from ``sprites.add_sprite_icons``) markers use the
+    category's atlas class instead of an image URL.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var data = {{ this.payload }};
+            var fields = {{ this.fields }};
+            var iconUrls = {{ this.icon_urls }};
+            var sprites = {{ this.sprites or "null" }};
+            var target = {{ this.target.get_name() }};
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            {%- if this.details %}
+            var details = {{ this.details }};
+            {{ this.details_loader }}
+            var shards = detailLoader.shards;
+            function shardUrl(i) { return details.url + details.files[Math.floor(i / details.shardSize)]; }
+            function loadDetails(i, done) { detailLoader.load(shardUrl(i), details.format, done); }
+            {%- endif %}
+
+            function value(col, i) {
+                var column = data.cols[col];
+                if (!column) {
+                    {%- if this.details %}
+                    var shard = shards[shardUrl(i)];
+                    return shard && shard.cols[col] ? shard.cols[col][i - shard.start] : "";
+                    {%- else %}
+                    return "";
+                    {%- endif %}
+                }
+                var dict = data.dicts[col];
+                return dict ? dict[column[i]] : column[i];
+            }
+            function popupHtml(i) {
+                {%- if this.details %}
+                var loaded = shards[shardUrl(i)];
+                var html = fields.filter(function(f) {
+                    return loaded || f[1] in data.cols;
+                }).map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(value(f[1], i));
+                }).join("<br>");
+                return loaded === undefined ? html + "<br><i>Loading details...</i>" : html;
+                {%- else %}
+                return fields.map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(value(f[1], i));
+                }).join("<br>");
+                {%- endif %}
+            }
+
+            // One shared icon per category instead of one per marker
+            var icons = {};
+            function iconFor(i) {
+                var category = value({{ this.category_column|tojson }}, i);
+                if (!icons[category]) {
+                    {%- if this.sprites %}
+                    // Atlas cell picked by CSS class; no image request per category
+                    icons[category] = L.divIcon({
+                        className: sprites.classes[category] || sprites["default"],
+                        iconSize: {{ this.icon_size|tojson }}
+                    });
+                    {%- else %}
+                    icons[category] = L.icon({
+                        iconUrl: iconUrls[category] || {{ this.default_icon|tojson }},
+                        iconSize: {{ this.icon_size|tojson }}
+                    });
+                    {%- endif %}
+                }
+                return icons[category];
+            }
+
+            var markers = new Array(data.n);
+            for (var i = 0; i < data.n; i++) {
+                var options = {icon: iconFor(i)};
+                {% if this.search_key %}
+                options[{{ this.search_key|tojson }}] = value({{ this.name_column|tojson }}, i);
+                {% endif %}
+                var marker = L.marker([data.lat[i], data.lng[i]], options);
+                marker.bindPopup((function(i) {
+                    return function() { return popupHtml(i); };
+                })(i), {maxWidth: {{ this.max_width }}});
+                {%- if this.details %}
+                marker.on("popupopen", (function(i) {
+                    return function(e) {
+                        if (shards[shardUrl(i)] !== undefined) { return; }
+                        loadDetails(i, function() { e.popup.setContent(popupHtml(i)); });
+                    };
+                })(i));
+                {%- endif %}
+                marker.bindTooltip((function(i) {
+                    return function() { return escapeHtml(value({{ this.name_column|tojson }}, i)); };
+                })(i));
+                markers[i] = marker;
+            }
+
+            if (target.addLayers) {
+                target.addLayers(markers);
+            } else {
+                markers.forEach(function(marker) { target.addLayer(marker); });
+            }
+
+            return {
+                data: data,
+                markers: markers,
+                value: value,
+                popupHtml: popupHtml,
+                records: function() {
+                    var out = new Array(data.n);
+                    for (var i = 0; i < data.n; i++) {
+                        out[i] = {
+                            name: value({{ this.name_column|tojson }}, i),
+                            lat: data.lat[i],
+                            lng: data.lng[i],
+                            popup: popupHtml(i),
+                            marker: markers[i]
+                        };
+                    }
+                    return out;
+                }
+            };
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, df, target, icon_mapping=None, fields=None,
+                 category_column="Category", name_column="Company Name",
+                 default_icon=DEFAULT_ICON, icon_size=(30, 30), max_width=300,
+                 search_key=None, details=None, sprites=None):
+        super().__init__()
+        self._name = "ColumnarMarkers"
+        if fields is None:
+            fields = [(label, col) for label, col in POPUP_FIELDS if col in df.columns]
+
+        columns = [col for _, col in fields]
+        if details is not None:
+            columns = [col for col in columns if col not in details["columns"]]
+        for col in (category_column, name_column):
+            if col in df.columns and col not in columns:
+                columns.append(col)
+
+        self.target = target
+        key = frame_hash(df, ["Latitude", "Longitude"] + columns) + "-" + options_key(columns=columns)
+        self.payload = cached_text("markers", key, lambda: dump_payload(to_columnar(df, columns)))
+        self.fields = json.dumps(fields)
+        self.icon_urls = json.dumps(icon_mapping or {})
+        self.category_column = category_column
+        self.name_column = name_column
+        self.default_icon = default_icon
+        self.sprites = json.dumps(sprites) if sprites is not None else None
+        self.icon_size = [sprites["size"]] * 2 if sprites is not None else list(icon_size)
+        self.max_width = max_width
+        self.search_key = search_key
+        self.details = json.dumps(details) if details is not None else None
+        self.details_loader = DETAILS_LOADER_JS
+
+
+def add_columnar_markers(m, df, target=None, details_dir=None, details_format="js", **kwargs):
+    """Add all stakeholders as one columnar layer; returns the layer element.
+
+    With ``details_dir`` the contact details are written to sidecar shards
+    there (keep the directory next to the saved HTML) and loaded on demand.
+    """
+    if target is None:
+        target = folium.FeatureGroup(name="Stakeholders").add_to(m)
+    if details_dir is not None:
+        kwargs["details"] = write_detail_shards(df, details_dir, fmt=details_format)
+    layer = ColumnarMarkers(df, target, **kwargs)
+    layer.add_to(m)
+    return layer
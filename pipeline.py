@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import folium
+from folium.plugins import MarkerCluster
+
+from boundaries import load_boundaries
+from cache import stats
+from dedupe import merge_entities, resolve_entities
+from geocode import geocode_missing
+from heat_raster import HeatRaster, build_heat_rasters
+from loader import load_stakeholders
+from marker_layer import DEFAULT_ICON, ColumnarMarkers, write_detail_shards
+from search_index import add_search_box
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then omitted
+    resource = None
+
+PROFILE_PATH = "pipeline_profile.jsonl"
+
+# Same icons as stakeholders.py
+ICON_MAPPING = {
+    "Contract Farming": "img/contract.png",
+    "Seeds Company": "img/seeds.png",
+    "Aggregator": "img/aggreg.png",
+    "Processors": "img/proces.png",
+    "Fertilizer Company": "img/fert.png",
+}
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def output_bytes(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class Pipeline:
+    """Named stages with dependencies, run concurrently where the DAG allows.
+
+    A stage is a function whose parameters name the stages it depends on;
+    it receives their results as keyword arguments. ``outputs`` lists files
+    or directories the stage writes, measured for the profile.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name=None, outputs=()):
+        def register(func):
+            deps = func.__code__.co_varnames[:func.__code__.co_argcount]
+            self.stages[name or func.__name__] = {"func": func, "deps": tuple(deps), "outputs": tuple(outputs)}
+            return func
+        return register
+
+    def order(self, targets=None):
+        """Stages needed for ``targets`` (default: all), dependencies first."""
+        seen, ordered = set(), []
+
+        def visit(name, path):
+            if name in path:
+                raise ValueError(f"Stage cycle: {' -> '.join(path + (name,))}")
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            if name in seen:
+                return
+            for dep in self.stages[name]["deps"]:
+                visit(dep, path + (name,))
+            seen.add(name)
+            ordered.append(name)
+
+        for name in targets or self.stages:
+            visit(name, ())
+        return ordered
+
+    def run(self, targets=None, workers=4, trace_memory=True):
+        """Run the stages; returns (results, profile).
+
+        With ``workers=1`` stages run one at a time and each stage's peak
+        traced memory is its own; with more workers concurrent stages share
+        the peak of the window they overlap in. ``rss_growth`` is how much a
+        stage raised the process's peak RSS (the OS only reports a running
+        maximum, so stages that stay under an earlier peak report 0).
+        """
+        names = self.order(targets)
+        results, profile = {}, {"stages": {}, "workers": workers}
+        lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        started = time.perf_counter()
+
+        def execute(name):
+            spec = self.stages[name]
+            with lock:
+                args = {dep: results[dep] for dep in spec["deps"]}
+                if trace_memory and workers == 1:
+                    tracemalloc.reset_peak()
+            begin, cpu, rss = time.perf_counter(), time.thread_time(), peak_rss()
+            value = spec["func"](**args)
+            entry = {
+                "start": round(begin - started, 4),
+                "wall": round(time.perf_counter() - begin, 4),
+                "cpu": round(time.thread_time() - cpu, 4),
+                "output_bytes": output_bytes(spec["outputs"]),
+                "rss_growth": peak_rss() - rss if rss is not None else None,
+            }
+            if trace_memory:
+                entry["traced_peak"] = tracemalloc.get_traced_memory()[1]
+            with lock:
+                results[name] = value
+                profile["stages"][name] = entry
+            return name
+
+        pending, running = list(names), {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in [n for n in pending if all(d in results for d in self.stages[n]["deps"])]:
+                    pending.remove(name)
+                    running[pool.submit(execute, name)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    future.result()
+
+        profile["wall"] = round(time.perf_counter() - started, 4)
+        profile["peak_rss"] = peak_rss()
+        if trace_memory:
+            profile["traced_peak"] = tracemalloc.get_traced_memory()[1]
+        profile["cache"] = dict(stats)
+        return results, profile
+
+
+# The core of the stakeholders.py build (markers, heat raster, boundaries,
+# search) as a DAG, for profiling. Loading, boundary simplification and icon
+# checks are independent; layers are prepared in parallel and attached to
+# the map in a fixed order by "assemble". It writes its own page so it never
+# overwrites the full map from stakeholders.py.
+stakeholders_map = Pipeline()
+OUT_HTML = "stakeholders_pipeline_map.html"
+
+
+@stakeholders_map.stage()
+def stakeholders():
+    df = merge_entities(resolve_entities(load_stakeholders("stakeholders.csv", drop_invalid=False)))
+    return geocode_missing(df)
+
+
+@stakeholders_map.stage()
+def boundaries():
+    return {
+        "state": load_boundaries("kaduna.geojson"),
+        "lga": load_boundaries("lga_boundaries.geojson", properties=["lganame", "lgacode", "statename"]),
+    }
+
+
+@stakeholders_map.stage()
+def icons():
+    # Categories whose icon file is missing fall back to the default icon
+    return {category: path if os.path.exists(path) else DEFAULT_ICON for category, path in ICON_MAPPING.items()}
+
+
+@stakeholders_map.stage()
+def base_map(stakeholders):
+    center = [stakeholders["Latitude"].mean(), stakeholders["Longitude"].mean()]
+    return folium.Map(location=center, zoom_start=6)
+
+
+@stakeholders_map.stage(outputs=["details"])
+def markers(stakeholders, icons):
+    cluster = MarkerCluster()
+    details = write_detail_shards(stakeholders, "details")
+    layer = ColumnarMarkers(stakeholders, cluster, icon_mapping=icons, details=details)
+    return cluster, layer
+
+
+@stakeholders_map.stage()
+def heatmap(stakeholders):
+    return HeatRaster(build_heat_rasters(stakeholders["Latitude"], stakeholders["Longitude"], radius=10))
+
+
+@stakeholders_map.stage()
+def boundary_layers(boundaries):
+    return [
+        folium.GeoJson(boundaries["state"], name="Kaduna State Boundary"),
+        folium.GeoJson(boundaries["lga"], name="LGA Boundaries"),
+    ]
+
+
+@stakeholders_map.stage()
+def assemble(base_map, markers, heatmap, boundary_layers):
+    cluster, layer = markers
+    cluster.add_to(base_map)
+    layer.add_to(base_map)
+    heatmap.add_to(base_map)
+    for boundary in boundary_layers:
+        boundary.add_to(base_map)
+    folium.LayerControl().add_to(base_map)
+    return base_map
+
+
+@stakeholders_map.stage(outputs=["search"])
+def search(assemble, stakeholders):
+    add_search_box(assemble, stakeholders)
+    return assemble
+
+
+@stakeholders_map.stage(outputs=[OUT_HTML])
+def save(search):
+    search.save(OUT_HTML)
+    return OUT_HTML
+
+
+def write_profile(profile, path=PROFILE_PATH, target=None):
+    """Append the run's profile as one JSON line."""
+    record = dict(profile, time=time.strftime("%Y-%m-%dT%H:%M:%S"), target=target)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def print_profile(profile):
+    print(f"{'stage':<16}{'start s':>9}{'wall s':>9}{'cpu s':>9}{'traced MB':>11}{'+RSS MB':>9}{'output KB':>11}")
+    for name, entry in sorted(profile["stages"].items(), key=lambda item: item[1]["start"]):
+        traced = entry.get("traced_peak", 0) / 1e6
+        growth = (entry.get("rss_growth") or 0) / 1e6
+        print(f"{name:<16}{entry['start']:>9.3f}{entry['wall']:>9.3f}{entry['cpu']:>9.3f}"
+              f"{traced:>11.1f}{growth:>9.1f}{entry['output_bytes'] / 1024:>11.1f}")
+    rss = profile["peak_rss"]
+    print(f"total {profile['wall']:.3f} s" + (f", peak RSS {rss / 1e6:.0f} MB" if rss else ""))
+    if profile["workers"] > 1:
+        print("traced MB and +RSS MB are shared by overlapping stages; use --workers 1 for per-stage memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the stakeholder map as a profiled stage DAG.")
+    parser.add_argument("targets", nargs="*", help="stages to run with their dependencies (default: all)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent stages; 1 gives exact per-stage memory")
+    parser.add_argument("--profile", default=PROFILE_PATH, help="JSON lines file the run profile is appended to")
+    parser.add_argument("--no-trace", action="store_true", help="skip tracemalloc (it slows allocation-heavy stages)")
+    parser.add_argument("--list", action="store_true", help="print the stages and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        for name in stakeholders_map.order():
+            print(f"{name}: {', '.join(stakeholders_map.stages[name]['deps']) or '-'}")
+    else:
+        _, run_profile = stakeholders_map.run(args.targets or None, args.workers, not args.no_trace)
+        print_profile(run_profile)
+        write_profile(run_profile, args.profile, args.targets or "all")
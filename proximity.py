@@ -0,0 +1,173 @@
+import argparse
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+from shapely.geometry import shape
+
+from boundaries import load_boundaries
+from routing import EARTH_RADIUS_KM
+
+LGA_PROPERTIES = ["lganame", "lgacode"]
+
+
+def unit_vectors(lat, lng):
+    """Points on the unit sphere; chord length is monotone in great-circle distance."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0.0, 1.0))
+
+
+class CategoryIndex:
+    """One KD-tree per category over 3D unit vectors, so distances are exact haversine.
+
+    Queries take arrays of coordinates and return positional row ids into
+    the frame the index was built from.
+    """
+
+    def __init__(self, df, category_column="Category"):
+        lat = pd.to_numeric(df["Latitude"], errors="coerce").to_numpy(dtype=float)
+        lng = pd.to_numeric(df["Longitude"], errors="coerce").to_numpy(dtype=float)
+        valid = np.isfinite(lat) & np.isfinite(lng)
+        categories = df[category_column].astype(str).str.strip().to_numpy()
+        xyz = unit_vectors(lat[valid], lng[valid])
+        positions = np.flatnonzero(valid)
+
+        self.df = df
+        self.trees = {}
+        self.positions = {}
+        for category in np.unique(categories[valid]):
+            mask = categories[valid] == category
+            self.trees[category] = cKDTree(xyz[mask])
+            self.positions[category] = positions[mask]
+
+    def nearest(self, lat, lng, category, k=1):
+        """(km, row ids) of the ``k`` nearest ``category`` rows, each shaped (n, k).
+
+        Missing neighbours (fewer than ``k`` rows in the category) are inf / -1.
+        """
+        n = len(np.atleast_1d(lat))
+        if category not in self.trees:
+            return np.full((n, k), np.inf), np.full((n, k), -1, dtype=np.int64)
+        tree = self.trees[category]
+        chord, idx = tree.query(unit_vectors(lat, lng), k=k)
+        chord, idx = chord.reshape(n, k), idx.reshape(n, k)
+        found = idx < tree.n
+        rows = np.full((n, k), -1, dtype=np.int64)
+        rows[found] = self.positions[category][idx[found]]
+        return np.where(found, chord_to_km(chord), np.inf), rows
+
+    def within(self, lat, lng, category, radius_km):
+        """Row ids of ``category`` rows within ``radius_km`` of each point (list of arrays)."""
+        if category not in self.trees:
+            return [np.empty(0, dtype=np.int64) for _ in np.atleast_1d(lat)]
+        hits = self.trees[category].query_ball_point(unit_vectors(lat, lng), float(km_to_chord(radius_km)))
+        return [self.positions[category][np.asarray(h, dtype=np.int64)] for h in hits]
+
+    def count_within(self, lat, lng, category, radius_km):
+        if category not in self.trees:
+            return np.zeros(len(np.atleast_1d(lat)), dtype=np.int64)
+        return np.asarray(self.trees[category].query_ball_point(
+            unit_vectors(lat, lng), float(km_to_chord(radius_km)), return_length=True), dtype=np.int64)
+
+
+def nearest_suppliers(df, origin_category, supplier_category, k=3, index=None):
+    """The ``k`` nearest ``supplier_category`` stakeholders for every ``origin_category`` one."""
+    index = index or CategoryIndex(df)
+    origins = df[df["Category"].astype(str).str.strip() == origin_category]
+    origins = origins[origins["Latitude"].notna() & origins["Longitude"].notna()]
+    km, rows = index.nearest(origins["Latitude"], origins["Longitude"], supplier_category, k)
+
+    found = rows >= 0
+    origin_pos = np.repeat(np.arange(len(origins)), k).reshape(-1, k)[found]
+    names = df["Company Name"].to_numpy()
+    return pd.DataFrame({
+        "from_name": origins["Company Name"].to_numpy()[origin_pos],
+        "rank": np.tile(np.arange(1, k + 1), (len(origins), 1))[found],
+        "to_name": names[rows[found]],
+        "km": km[found].round(2),
+    })
+
+
+def coverage_gaps(df, category, radius_km=30.0, boundaries="lga_boundaries.geojson", index=None):
+    """Per-LGA distance to the nearest ``category`` stakeholder and the count within ``radius_km``.
+
+    Distances are measured from each LGA's representative point (a point
+    guaranteed to lie inside it); ``gap`` is True when nothing is within
+    the radius. Returns the LGA properties plus the GeoJSON used.
+    """
+    index = index or CategoryIndex(df)
+    geojson = load_boundaries(boundaries, properties=LGA_PROPERTIES)
+    points = shapely.point_on_surface([shape(f["geometry"]) for f in geojson["features"]])
+    lng, lat = shapely.get_x(points), shapely.get_y(points)
+
+    km, rows = index.nearest(lat, lng, category, k=1)
+    names = np.append(df["Company Name"].astype(str).to_numpy(), "")
+    table = pd.DataFrame([{col: f["properties"].get(col) for col in LGA_PROPERTIES} for f in geojson["features"]])
+    table["nearest_km"] = np.where(np.isfinite(km[:, 0]), km[:, 0].round(1), np.nan)
+    table["nearest_name"] = names[rows[:, 0]]
+    table["within_radius"] = index.count_within(lat, lng, category, radius_km)
+    table["gap"] = table["within_radius"] == 0
+    return table, geojson
+
+
+def add_coverage_layer(m, df, category, radius_km=30.0, boundaries="lga_boundaries.geojson",
+                       name=None, gap_color="#d7301f", index=None):
+    """LGAs without a ``category`` stakeholder within ``radius_km`` (red), others outlined."""
+    table, geojson = coverage_gaps(df, category, radius_km, boundaries, index)
+
+    # Copy the coverage numbers into each feature so the tooltip can show them
+    features = []
+    for feature, row in zip(geojson["features"], table.itertuples(index=False)):
+        props = dict(feature["properties"])
+        props["nearest_km"] = None if pd.isna(row.nearest_km) else float(row.nearest_km)
+        props["nearest_name"] = row.nearest_name
+        props["within_radius"] = int(row.within_radius)
+        props["gap"] = bool(row.gap)
+        features.append(dict(feature, properties=props))
+
+    layer = folium.GeoJson(
+        dict(geojson, features=features),
+        name=name or f"No {category} within {radius_km:g} km",
+        style_function=lambda feature: {
+            "fillColor": gap_color if feature["properties"]["gap"] else "transparent",
+            "fillOpacity": 0.5,
+            "color": gap_color if feature["properties"]["gap"] else "gray",
+            "weight": 1,
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=["lganame", "nearest_name", "nearest_km", "within_radius"],
+            aliases=["LGA", f"Nearest {category}", "Distance (km)", f"Within {radius_km:g} km"],
+        ),
+    ).add_to(m)
+    return layer, table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nearest-supplier and coverage-gap queries.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--category", default="Seeds Company", help="supplier category")
+    parser.add_argument("--origin", default="Contract Farming", help="category to find suppliers for")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--radius", type=float, default=30.0, help="coverage radius in km")
+    args = parser.parse_args()
+
+    from loader import load_stakeholders
+
+    df = load_stakeholders(args.csv)
+    index = CategoryIndex(df)
+    print(nearest_suppliers(df, args.origin, args.category, args.k, index).to_string(index=False))
+    table, _ = coverage_gaps(df, args.category, args.radius, index=index)
+    gaps = table[table["gap"]]
+    print(f"\n{len(gaps)} of {len(table)} LGAs have no {args.category} within {args.radius:g} km:")
+    print(gaps.drop(columns="gap").to_string(index=False))
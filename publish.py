@@ -0,0 +1,280 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from cache import write_atomic
+
+try:
+    import brotli
+except ImportError:  # .br siblings are skipped; .gz is always written
+    brotli = None
+
+# Output mode for the map scripts: "inline" saves one self-contained page,
+# "external" saves a small HTML shell plus content-hashed files in ASSETS_DIR
+ASSETS_DIR = "assets"
+
+# Per-page list of the asset files each shell references, kept in ASSETS_DIR
+# so files no page uses any more can be removed
+ASSET_MANIFEST = "pages.json"
+
+# JSON literals shorter than this stay inline (a request costs more than the bytes)
+MIN_PAYLOAD = 1024
+
+# Strings shorter than this are never moved to the string table, and a string
+# must occur at least twice to be worth a table slot
+MIN_SHARED_STRING = 8
+
+# Float arrays at least this long may be shipped as base64 float32 (binary_coordinates=True)
+MIN_BINARY_ARRAY = 64
+
+# Defines mapData (payloads by content hash) and mapRevive, which expands
+# string-table references ("\u0000<n>") and {"$f32": base64} arrays in place
+RUNTIME_JS = r"""var mapData = window.mapData || (window.mapData = {});
+function mapRevive(value, strings) {
+    if (typeof value === "string") {
+        return value.charCodeAt(0) === 0 ? strings[+value.slice(1)] : value;
+    }
+    if (Array.isArray(value)) {
+        for (var i = 0; i < value.length; i++) {
+            value[i] = mapRevive(value[i], strings);
+        }
+        return value;
+    }
+    if (value !== null && typeof value === "object") {
+        if (typeof value.$f32 === "string") {
+            var raw = atob(value.$f32), bytes = new Uint8Array(raw.length);
+            for (var j = 0; j < raw.length; j++) {
+                bytes[j] = raw.charCodeAt(j);
+            }
+            return Array.prototype.slice.call(new Float32Array(bytes.buffer));
+        }
+        for (var key in value) {
+            value[key] = mapRevive(value[key], strings);
+        }
+    }
+    return value;
+}
+"""
+
+SCRIPT_PATTERN = re.compile(r"<script(\s[^>]*)?>(.*?)</script>", re.DOTALL | re.IGNORECASE)
+
+
+def json_literals(text, min_length=64):
+    """(start, end) spans of the JSON values embedded in a page's scripts."""
+    decoder = json.JSONDecoder()
+    # Only openings that look like data ({"key", [[, [{), not JS blocks
+    opening = re.compile(r'\{"|\[\[|\[\{')
+    spans, i = [], 0
+    while True:
+        match = opening.search(text, i)
+        if match is None:
+            return spans
+        i = match.start()
+        try:
+            _, end = decoder.raw_decode(text, i)
+        except ValueError:
+            i += 1
+            continue
+        if end - i >= min_length:
+            spans.append((i, end))
+        i = end
+
+
+def _is_coordinate_array(value):
+    return (len(value) >= MIN_BINARY_ARRAY
+            and all(isinstance(v, float) for v in value)
+            and all(-180.0 <= v <= 180.0 for v in value))
+
+
+def pack_payload(value, shared_strings=True, binary_coordinates=False):
+    """(value, string table) with repeated strings and optional float arrays packed.
+
+    Strings of MIN_SHARED_STRING+ characters that occur more than once are
+    replaced by "\\u0000<n>" references into the table; with
+    ``binary_coordinates`` long arrays of coordinate-range floats become
+    {"$f32": base64 little-endian float32} (about 1 m of precision).
+    """
+    counts = Counter()
+
+    def count(node):
+        if isinstance(node, str):
+            if len(node) >= MIN_SHARED_STRING:
+                counts[node] += 1
+        elif isinstance(node, list):
+            for item in node:
+                count(item)
+        elif isinstance(node, dict):
+            for item in node.values():
+                count(item)
+
+    if shared_strings:
+        count(value)
+    # Most bytes saved first, so the busiest strings get the shortest references
+    shared = sorted((s for s, n in counts.items() if n > 1), key=lambda s: -len(s) * counts[s])
+    index = {s: i for i, s in enumerate(shared)}
+
+    def pack(node):
+        if isinstance(node, str):
+            return f"\x00{index[node]}" if node in index else node
+        if isinstance(node, list):
+            if binary_coordinates and _is_coordinate_array(node):
+                data = np.asarray(node, dtype="<f4").tobytes()
+                return {"$f32": base64.b64encode(data).decode("ascii")}
+            return [pack(item) for item in node]
+        if isinstance(node, dict):
+            return {key: pack(item) for key, item in node.items()}
+        return node
+
+    packed = pack(value) if shared or binary_coordinates else value
+    return packed, shared
+
+
+def _minify(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def write_asset(directory, name, body, precompress=True):
+    """Write ``body`` to ``directory/name`` plus .gz/.br siblings unless it already exists.
+
+    Asset names carry a content hash, so an existing file is always current.
+    Returns True if the file was written.
+    """
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return False
+    data = body.encode("utf-8")
+    if precompress:
+        write_atomic(path + ".gz", gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            write_atomic(path + ".br", brotli.compress(data, quality=11))
+    write_atomic(path, data)
+    return True
+
+
+def _content_name(text, ext):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] + ext
+
+
+def prune_assets(directory, page, names):
+    """Record ``names`` as the assets of ``page`` and delete files no page uses any more.
+
+    Only files recorded for ``page`` by an earlier run are candidates, so
+    assets of other pages sharing the directory are left alone.
+    Returns the number of files removed.
+    """
+    path = os.path.join(directory, ASSET_MANIFEST)
+    pages = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            pages = json.load(f)
+    previous = set(pages.get(page, []))
+    pages[page] = sorted(names)
+    in_use = set().union(*pages.values())
+    removed = 0
+    for name in previous - in_use:
+        for suffix in ("", ".gz", ".br"):
+            if os.path.exists(os.path.join(directory, name + suffix)):
+                os.remove(os.path.join(directory, name + suffix))
+        removed += 1
+    write_atomic(path, json.dumps(pages, indent=1, sort_keys=True))
+    return removed
+
+
+def externalize(html, out_html, assets_dir=ASSETS_DIR, min_length=MIN_PAYLOAD, shared_strings=True,
+                binary_coordinates=False, precompress=True):
+    """Save a rendered page as a small HTML shell plus content-hashed data files.
+
+    Every JSON literal of ``min_length``+ characters in an inline script
+    moves to ``assets_dir/<hash>.js`` (minified, repeated strings shared,
+    see ``pack_payload``) and is referenced from the script as
+    ``mapData["<hash>"]``. The data files are loaded by <script> tags so
+    the page still opens from file://. Files whose content did not change
+    keep their names, so browsers re-download only the changed payloads;
+    identical payloads share one file and one <script> tag, and files the
+    page's previous shell used that no page needs any more are removed
+    (see ``prune_assets``). Returns a summary dict (shell bytes, assets
+    written, reused and removed).
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(out_html)), assets_dir)
+    os.makedirs(directory, exist_ok=True)
+    runtime = _content_name(RUNTIME_JS, ".js")
+    names, written = [], 0
+
+    def rewrite(match):
+        nonlocal written
+        attrs, body = match.group(1) or "", match.group(2)
+        if "src=" in attrs:
+            return match.group(0)
+        spans = json_literals(body, min_length)
+        if not spans:
+            return match.group(0)
+        parts, tags, last = [], [], 0
+        for start, end in spans:
+            value, strings = pack_payload(json.loads(body[start:end]), shared_strings, binary_coordinates)
+            payload = _minify(value)
+            if strings:
+                payload = f"mapRevive({payload},{_minify(strings)})"
+            name = _content_name(payload, ".js")
+            key = name[:-len(".js")]
+            written += write_asset(directory, name, f'mapData["{key}"]={payload};\n', precompress)
+            # A payload already loaded by an earlier tag needs no second one
+            if name not in names:
+                names.append(name)
+                tags.append(f'<script src="{assets_dir}/{name}"></script>')
+            parts += [body[last:start], f'mapData["{key}"]']
+            last = end
+        parts.append(body[last:])
+        return "\n".join(tags) + f"\n<script{attrs}>" + "".join(parts) + "</script>"
+
+    shell = SCRIPT_PATTERN.sub(rewrite, html)
+    used = list(names)
+    if names:
+        used.append(runtime)
+        written += write_asset(directory, runtime, RUNTIME_JS, precompress)
+        # The runtime goes before the first data file
+        first = shell.index(f'<script src="{assets_dir}/{names[0]}"')
+        shell = shell[:first] + f'<script src="{assets_dir}/{runtime}"></script>\n' + shell[first:]
+    data = shell.encode("utf-8")
+    write_atomic(out_html, data)
+    if precompress:
+        write_atomic(out_html + ".gz", gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            write_atomic(out_html + ".br", brotli.compress(data, quality=11))
+    removed = prune_assets(directory, os.path.basename(out_html), used)
+    return {"shell_bytes": len(data), "assets": len(names), "written": written,
+            "reused": len(used) - written, "removed": removed}
+
+
+def save_map(m, out_html, mode="external", **options):
+    """Save a folium map in ``mode`` ("inline" or "external", see ``externalize``)."""
+    if mode == "inline":
+        m.save(out_html)
+        return None
+    if mode != "external":
+        raise ValueError(f"Unknown output mode: {mode}")
+    return externalize(m.get_root().render(), out_html, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a saved map page into a shell and content-hashed assets.")
+    parser.add_argument("page", help="self-contained HTML written by one of the map scripts")
+    parser.add_argument("--out", help="shell path (default: overwrite the page)")
+    parser.add_argument("--assets", default=ASSETS_DIR)
+    parser.add_argument("--min-length", type=int, default=MIN_PAYLOAD)
+    parser.add_argument("--binary-coordinates", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.page, encoding="utf-8") as f:
+        page = f.read()
+    summary = externalize(page, args.out or args.page, args.assets, args.min_length,
+                          binary_coordinates=args.binary_coordinates)
+    print(f"{len(page.encode('utf-8')):,} bytes -> {summary['shell_bytes']:,} byte shell, "
+          f"{summary['assets']} data files ({summary['written']} written, {summary['reused']} unchanged, "
+          f"{summary['removed']} removed)")
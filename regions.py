@@ -0,0 +1,174 @@
+import argparse
+import html
+import multiprocessing
+import os
+import re
+import time
+
+import folium
+import numpy as np
+
+from boundaries import load_boundaries
+from boundary_store import read_boundaries
+from marker_layer import add_columnar_markers
+from spatial_join import assign_lgas
+from tiles import write_point_tiles
+
+REGIONS_DIR = "regions"
+LEVELS = ("state", "lga")
+BOUNDARY_PROPERTIES = ["lganame", "lgacode", "statename"]
+
+# Same icons as stakeholders.py (paths are rewritten relative to each page)
+ICON_MAPPING = {
+    "Contract Farming": "img/contract.png",
+    "Seeds Company": "img/seeds.png",
+    "Aggregator": "img/aggreg.png",
+    "Processors": "img/proces.png",
+    "Fertilizer Company": "img/fert.png",
+}
+
+# Set in the parent before the pool starts. Forked workers inherit it
+# copy-on-write; otherwise the initializer ships it once per worker, never
+# once per task.
+_shared = {}
+
+
+def slugify(text):
+    return re.sub(r"[^0-9a-z]+", "-", str(text).lower()).strip("-") or "region"
+
+
+def partition(df, boundaries="lga_boundaries.geojson", level="lga"):
+    """Stakeholder row positions per region: {region id: (name, positions)}.
+
+    Every LGA (or state) in the boundary file gets an entry, even without
+    stakeholders, so the batch produces one map per region.
+    """
+    lgas = read_boundaries(boundaries)
+    joined = assign_lgas(df, lgas)
+    if level == "lga":
+        names = dict(zip(lgas["lgacode"].astype(str), lgas["lganame"].astype(str)))
+        keys = joined["lgacode"].to_numpy()
+    else:
+        state_of = dict(zip(lgas["lgacode"].astype(str), lgas["statename"].astype(str)))
+        names = {slugify(state): state for state in state_of.values()}
+        keys = np.array([slugify(state_of[code]) if code else "" for code in joined["lgacode"]], dtype=object)
+
+    regions = {}
+    for region, name in names.items():
+        regions[region] = (name, np.flatnonzero(keys == region))
+    return regions
+
+
+def _init_worker(shared):
+    _shared.update(shared)
+
+
+def render_region(task):
+    """Render one region's page (and optional point tiles); runs in a worker."""
+    region, name, positions = task
+    start = time.perf_counter()
+    level, out_dir = _shared["level"], _shared["out_dir"]
+    features = _shared["features"].get(region, [])
+    df = _shared["df"].iloc[positions]
+
+    page_dir = os.path.join(out_dir, level)
+    m = folium.Map()
+    boundary = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=f"{name} boundary",
+        style_function=lambda feature: {"fillColor": "transparent", "color": "green", "weight": 2},
+        tooltip=folium.GeoJsonTooltip(fields=["lganame"], aliases=["LGA"]),
+    ).add_to(m)
+    if features:
+        m.fit_bounds(boundary.get_bounds())
+    if len(df):
+        icons = {category: os.path.relpath(path, page_dir).replace(os.sep, "/")
+                 for category, path in ICON_MAPPING.items()}
+        add_columnar_markers(m, df, icon_mapping=icons)
+        if _shared["tiles"]:
+            write_point_tiles(df, os.path.join(page_dir, f"{region}-tiles"), _shared["tile_zooms"])
+    folium.LayerControl().add_to(m)
+    m.save(os.path.join(page_dir, f"{region}.html"))
+    return region, name, len(df), time.perf_counter() - start
+
+
+def build_regions(df, level="lga", boundaries="lga_boundaries.geojson", out_dir=REGIONS_DIR,
+                  workers=None, tiles=False, tile_zooms=range(8, 15), verbose=True):
+    """Render one map per region in parallel; returns [(region, name, rows, seconds)].
+
+    Boundaries are parsed and simplified once in the parent (and cached),
+    the stakeholder frame is partitioned once, and each task only carries a
+    region id plus its row positions.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"Unknown region level: {level}")
+    started = time.perf_counter()
+    df = df.reset_index(drop=True)
+    regions = partition(df, boundaries, level)
+    features = {}
+    for feature in load_boundaries(boundaries, properties=BOUNDARY_PROPERTIES)["features"]:
+        props = feature["properties"]
+        region = str(props["lgacode"]) if level == "lga" else slugify(props["statename"])
+        features.setdefault(region, []).append(feature)
+    shared = {
+        "df": df,
+        "features": features,
+        "level": level,
+        "out_dir": out_dir,
+        "tiles": tiles,
+        "tile_zooms": tile_zooms,
+    }
+    os.makedirs(os.path.join(out_dir, level), exist_ok=True)
+
+    # Largest regions first so one big region does not finish last on its own
+    tasks = sorted(((region, name, positions) for region, (name, positions) in regions.items()),
+                   key=lambda task: -len(task[2]))
+    workers = workers or os.cpu_count() or 1
+    if "fork" in multiprocessing.get_all_start_methods():
+        _shared.update(shared)
+        context, initargs = multiprocessing.get_context("fork"), ({},)
+    else:
+        context, initargs = multiprocessing.get_context(), (shared,)
+
+    results = []
+    with context.Pool(min(workers, max(len(tasks), 1)), _init_worker, initargs) as pool:
+        for done, result in enumerate(pool.imap_unordered(render_region, tasks), 1):
+            results.append(result)
+            if verbose:
+                region, name, rows, seconds = result
+                print(f"[{done}/{len(tasks)}] {name}: {rows} stakeholders in {seconds * 1000:.0f} ms")
+
+    write_index(results, level, out_dir)
+    if verbose:
+        total = time.perf_counter() - started
+        busy = sum(seconds for *_, seconds in results)
+        print(f"{len(results)} {level} maps in {total:.1f} s with {workers} workers "
+              f"({busy:.1f} s of rendering, {busy / max(total, 1e-9):.1f}x parallel)")
+    return results
+
+
+def write_index(results, level, out_dir=REGIONS_DIR):
+    """Plain HTML list linking every region page."""
+    rows = "\n".join(
+        f'<li><a href="{level}/{region}.html">{html.escape(name)}</a> ({count})</li>'
+        for region, name, count, _ in sorted(results, key=lambda result: result[1])
+    )
+    with open(os.path.join(out_dir, f"{level}.html"), "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html>\n<meta charset=\"utf-8\">\n<title>Stakeholder maps by {level}</title>\n"
+                f"<ul>\n{rows}\n</ul>\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render one stakeholder map per state or LGA in parallel.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--level", choices=LEVELS, default="lga")
+    parser.add_argument("--boundaries", default="lga_boundaries.geojson")
+    parser.add_argument("--out-dir", default=REGIONS_DIR)
+    parser.add_argument("--workers", type=int, help="default: one per core")
+    parser.add_argument("--tiles", action="store_true", help="also write point tiles per region")
+    args = parser.parse_args()
+
+    from loader import load_stakeholders
+
+    build_regions(load_stakeholders(args.csv), args.level, args.boundaries, args.out_dir,
+                  args.workers, args.tiles)
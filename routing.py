@@ -0,0 +1,366 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import folium
+import numpy as np
+import pandas as pd
+
+from cache import CACHE_DIR, stats
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # only the HTTP backends need requests
+    requests = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+ORS_URL = "https://api.openrouteservice.org"
+
+# Origin category -> destination category for the logistics analytics
+LOGISTICS_LINKS = [
+    ("Aggregator", "Processors"),
+    ("Contract Farming", "Fertilizer Company"),
+]
+
+# Coordinates are rounded to ~1 m before they are used as cache keys
+KEY_PRECISION = 5
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distances in km; broadcasts like any numpy expression."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(origins, destinations):
+    """Straight-line km between every origin and destination ((lat, lng) arrays)."""
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+    return haversine_km(origins[:, None, 0], origins[:, None, 1], destinations[None, :, 0], destinations[None, :, 1])
+
+
+def candidate_pairs(origins, destinations, max_km=None, nearest=None):
+    """(origin, destination, straight km) for the pairs worth routing.
+
+    ``max_km`` drops pairs further apart in a straight line (roads are never
+    shorter), ``nearest`` keeps only the k closest destinations per origin.
+    """
+    straight = haversine_matrix(origins, destinations)
+    keep = np.ones(straight.shape, dtype=bool)
+    if max_km is not None:
+        keep &= straight <= max_km
+    if nearest is not None and nearest < straight.shape[1]:
+        kth = np.partition(straight, nearest - 1, axis=1)[:, nearest - 1:nearest]
+        keep &= straight <= kth
+    o, d = np.nonzero(keep)
+    return pd.DataFrame({"origin": o, "destination": d, "straight_km": straight[o, d]})
+
+
+class RouteCache:
+    """Persistent road distance/duration and geometry cache (SQLite under .cache/routes)."""
+
+    def __init__(self, path=None):
+        if path is None:
+            directory = os.path.join(CACHE_DIR, "routes")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "routes.sqlite")
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS legs (backend TEXT, o TEXT, d TEXT, km REAL, minutes REAL,"
+                        " PRIMARY KEY (backend, o, d))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS routes (backend TEXT, o TEXT, d TEXT, geometry TEXT,"
+                        " PRIMARY KEY (backend, o, d))")
+
+    @staticmethod
+    def key(lat, lng):
+        return f"{round(float(lat), KEY_PRECISION)},{round(float(lng), KEY_PRECISION)}"
+
+    def get_legs(self, backend, pairs):
+        """{(o, d): (km, minutes)} for the cached ones among ``pairs`` of keys."""
+        found = {}
+        pairs = list(pairs)
+        for start in range(0, len(pairs), 400):
+            chunk = pairs[start:start + 400]
+            clause = " OR ".join(["(o = ? AND d = ?)"] * len(chunk))
+            rows = self.db.execute(f"SELECT o, d, km, minutes FROM legs WHERE backend = ? AND ({clause})",
+                                   [backend] + [v for pair in chunk for v in pair])
+            found.update({(o, d): (km, minutes) for o, d, km, minutes in rows})
+        return found
+
+    def put_legs(self, backend, rows):
+        self.db.executemany("INSERT OR REPLACE INTO legs VALUES (?, ?, ?, ?, ?)",
+                            [(backend, o, d, km, minutes) for o, d, km, minutes in rows])
+        self.db.commit()
+
+    def get_route(self, backend, o, d):
+        row = self.db.execute("SELECT geometry FROM routes WHERE backend = ? AND o = ? AND d = ?",
+                              (backend, o, d)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_route(self, backend, o, d, geometry):
+        self.db.execute("INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?)", (backend, o, d, json.dumps(geometry)))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class HaversineBackend:
+    """Offline estimate: straight-line distance times a detour factor at a fixed speed."""
+
+    max_elements = 1_000_000
+
+    def __init__(self, detour=1.3, speed_kmh=40.0):
+        self.name = f"haversine-{detour}-{speed_kmh}"
+        self.detour = detour
+        self.speed_kmh = speed_kmh
+
+    def matrix(self, sources, destinations):
+        km = haversine_matrix(sources, destinations) * self.detour
+        return km, km / self.speed_kmh * 60.0
+
+    def route(self, coordinates):
+        (lat1, lng1), (lat2, lng2) = coordinates
+        km = float(haversine_km(lat1, lng1, lat2, lng2)) * self.detour
+        return {"coordinates": [[lat1, lng1], [lat2, lng2]], "km": km, "minutes": km / self.speed_kmh * 60.0}
+
+
+class OpenRouteServiceBackend:
+    """openrouteservice v2 matrix/directions over one pooled HTTP session.
+
+    Point ``base_url`` at ``python routing.py serve`` to use the local
+    stand-in instead of the public API.
+    """
+
+    # Free-plan limit on sources x destinations per matrix request
+    max_elements = 3500
+
+    def __init__(self, key=None, base_url=ORS_URL, profile="driving-car", pool_size=8, timeout=30):
+        if requests is None:
+            raise ImportError("requests is required for the openrouteservice backend")
+        self.name = f"ors-{profile}"
+        self.url = base_url.rstrip("/")
+        self.profile = profile
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        key = key or os.environ.get("ORS_API_KEY")
+        if key:
+            self.session.headers["Authorization"] = key
+
+    def _post(self, path, body):
+        response = self.session.post(f"{self.url}{path}", json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def matrix(self, sources, destinations):
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        locations = np.vstack([sources, destinations])[:, ::-1].tolist()  # ORS wants [lng, lat]
+        data = self._post(f"/v2/matrix/{self.profile}", {
+            "locations": locations,
+            "sources": list(range(len(sources))),
+            "destinations": list(range(len(sources), len(locations))),
+            "metrics": ["distance", "duration"],
+            "units": "km",
+        })
+        # Unroutable pairs come back as null
+        km = np.array(data["distances"], dtype=float)
+        minutes = np.array(data["durations"], dtype=float) / 60.0
+        return km, minutes
+
+    def route(self, coordinates):
+        data = self._post(f"/v2/directions/{self.profile}/geojson",
+                          {"coordinates": [[lng, lat] for lat, lng in coordinates]})
+        feature = data["features"][0]
+        summary = feature["properties"]["summary"]
+        return {"coordinates": [[lat, lng] for lng, lat in feature["geometry"]["coordinates"]],
+                "km": summary["distance"] / 1000.0, "minutes": summary["duration"] / 60.0}
+
+
+def _batches(sources, destinations, max_elements):
+    # Split a sources x destinations block into requests under the element limit
+    dest_step = min(len(destinations), max_elements)
+    source_step = max(1, max_elements // dest_step)
+    for s in range(0, len(sources), source_step):
+        for d in range(0, len(destinations), dest_step):
+            yield sources[s:s + source_step], destinations[d:d + dest_step]
+
+
+def distance_matrix(origins, destinations, backend=None, cache=None, max_km=None, nearest=None):
+    """Road km and minutes for origin/destination pairs, batched and cached.
+
+    ``origins`` and ``destinations`` are frames with Latitude/Longitude. Pairs
+    are prefiltered by straight-line distance (``max_km``/``nearest``), looked
+    up in the route cache, and only the misses go to the backend, grouped
+    into matrix requests under the backend's size limit. Returns one row per
+    pair with positional origin/destination ids.
+    """
+    backend = backend or HaversineBackend()
+    cache = cache or RouteCache()
+    o_coords = origins[["Latitude", "Longitude"]].to_numpy(dtype=float)
+    d_coords = destinations[["Latitude", "Longitude"]].to_numpy(dtype=float)
+
+    pairs = candidate_pairs(o_coords, d_coords, max_km, nearest)
+    o_keys = [RouteCache.key(lat, lng) for lat, lng in o_coords]
+    d_keys = [RouteCache.key(lat, lng) for lat, lng in d_coords]
+    pair_keys = list(zip([o_keys[i] for i in pairs["origin"]], [d_keys[j] for j in pairs["destination"]]))
+
+    legs = cache.get_legs(backend.name, set(pair_keys))
+    stats["routes:hit"] += len(set(pair_keys) & legs.keys())
+    missing = pairs[[key not in legs for key in pair_keys]]
+    stats["routes:miss"] += len(missing)
+
+    # One request per batch of origins, covering the destinations they still need
+    for sources in np.array_split(np.unique(missing["origin"]), max(1, math.ceil(missing["origin"].nunique() / 50))):
+        if not len(sources):
+            continue
+        wanted = np.unique(missing.loc[missing["origin"].isin(sources), "destination"])
+        for batch_o, batch_d in _batches(sources, wanted, backend.max_elements):
+            km, minutes = backend.matrix(o_coords[batch_o], d_coords[batch_d])
+            rows = [(o_keys[o], d_keys[d], km[i, j], minutes[i, j])
+                    for i, o in enumerate(batch_o) for j, d in enumerate(batch_d)]
+            cache.put_legs(backend.name, rows)
+            legs.update({(o, d): (k, t) for o, d, k, t in rows})
+
+    pairs["road_km"] = [legs[key][0] for key in pair_keys]
+    pairs["minutes"] = [legs[key][1] for key in pair_keys]
+    return pairs
+
+
+def logistics_matrix(df, links=LOGISTICS_LINKS, backend=None, cache=None, max_km=None, nearest=None):
+    """Distance matrices for every (origin category, destination category) link.
+
+    Returns one frame with company names, categories and road metrics.
+    """
+    frames = []
+    for origin_category, destination_category in links:
+        origins = df[df["Category"] == origin_category].reset_index(drop=True)
+        destinations = df[df["Category"] == destination_category].reset_index(drop=True)
+        if origins.empty or destinations.empty:
+            continue
+        pairs = distance_matrix(origins, destinations, backend, cache, max_km, nearest)
+        pairs.insert(0, "from_name", origins["Company Name"].to_numpy()[pairs["origin"]])
+        pairs.insert(1, "to_name", destinations["Company Name"].to_numpy()[pairs["destination"]])
+        pairs["link"] = f"{origin_category} -> {destination_category}"
+        for side, frame, column in (("from", origins, "origin"), ("to", destinations, "destination")):
+            pairs[f"{side}_lat"] = frame["Latitude"].to_numpy(dtype=float)[pairs[column]]
+            pairs[f"{side}_lng"] = frame["Longitude"].to_numpy(dtype=float)[pairs[column]]
+        frames.append(pairs.drop(columns=["origin", "destination"]))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def nearest_by_road(matrix):
+    """The closest destination (by road minutes) for every origin of every link."""
+    ranked = matrix.dropna(subset=["minutes"]).sort_values("minutes")
+    return ranked.drop_duplicates(["link", "from_name"]).sort_values(["link", "from_name"]).reset_index(drop=True)
+
+
+def add_routes(m, legs, backend=None, cache=None, name="Routes", color="blue"):
+    """Draw the road geometry of each leg (a row of ``logistics_matrix``) into ``m``."""
+    backend = backend or HaversineBackend()
+    cache = cache or RouteCache()
+    group = folium.FeatureGroup(name=name).add_to(m)
+    for leg in legs.itertuples(index=False):
+        o = RouteCache.key(leg.from_lat, leg.from_lng)
+        d = RouteCache.key(leg.to_lat, leg.to_lng)
+        route = cache.get_route(backend.name, o, d)
+        if route is None:
+            stats["route-geometry:miss"] += 1
+            route = backend.route([(leg.from_lat, leg.from_lng), (leg.to_lat, leg.to_lng)])
+            cache.put_route(backend.name, o, d, route)
+        else:
+            stats["route-geometry:hit"] += 1
+        folium.PolyLine(
+            locations=route["coordinates"],
+            color=color,
+            weight=5,
+            opacity=0.7,
+            tooltip=f"{leg.from_name} -> {leg.to_name}: {route['km']:.1f} km, {route['minutes']:.0f} min",
+        ).add_to(group)
+    return group
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    # Answers the two openrouteservice endpoints we use with haversine estimates
+    backend = HaversineBackend()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.startswith("/v2/matrix/"):
+            locations = np.array(body["locations"], dtype=float)[:, ::-1]
+            sources = body.get("sources", list(range(len(locations))))
+            destinations = body.get("destinations", list(range(len(locations))))
+            km, minutes = self.backend.matrix(locations[sources], locations[destinations])
+            scale = 1.0 if body.get("units") == "km" else 1000.0
+            data = {"distances": (km * scale).round(3).tolist(), "durations": (minutes * 60.0).round(1).tolist()}
+        elif self.path.startswith("/v2/directions/") and self.path.endswith("/geojson"):
+            coordinates = [(lat, lng) for lng, lat in body["coordinates"]]
+            route = self.backend.route(coordinates[:1] + coordinates[-1:])
+            data = {"type": "FeatureCollection", "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in route["coordinates"]]},
+                "properties": {"summary": {"distance": route["km"] * 1000.0, "duration": route["minutes"] * 60.0}},
+            }]}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stand_in(host="127.0.0.1", port=8080, background=False):
+    """Local openrouteservice stand-in; with ``background`` it runs in a thread."""
+    server = ThreadingHTTPServer((host, port), _StandInHandler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"openrouteservice stand-in on http://{host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Road distances between stakeholder categories.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the local openrouteservice stand-in")
+    serve.add_argument("--port", type=int, default=8080)
+    matrix = sub.add_parser("matrix", help="print the logistics distance matrix")
+    matrix.add_argument("--csv", default="stakeholders.csv")
+    matrix.add_argument("--backend", default="haversine", help='"haversine", "ors" or a stand-in URL')
+    matrix.add_argument("--max-km", type=float)
+    matrix.add_argument("--nearest", type=int)
+    matrix.add_argument("--out", help="write the matrix to this CSV")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_stand_in(port=args.port)
+    else:
+        from loader import load_stakeholders
+
+        if args.backend == "haversine":
+            backend = HaversineBackend()
+        elif args.backend == "ors":
+            backend = OpenRouteServiceBackend()
+        else:
+            backend = OpenRouteServiceBackend(base_url=args.backend)
+        table = logistics_matrix(load_stakeholders(args.csv), backend=backend, max_km=args.max_km,
+                                 nearest=args.nearest)
+        print(table.to_string(index=False))
+        print(f"Route cache: {stats['routes:hit']} hits, {stats['routes:miss']} misses")
+        if args.out:
+            table.to_csv(args.out, index=False)
@@ -0,0 +1,520 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import unicodedata
+
+import folium
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+from cache import cache_path, frame_hash, options_key, stats, write_atomic
+
+SEARCH_DIR = "search"
+
+# Bump when the pickled SearchIndex layout changes so stale caches are not reused
+INDEX_VERSION = 2
+
+# Indexed columns and how much a match in each counts towards the rank
+SEARCH_FIELDS = {
+    "Company Name": 3.0,
+    "Contact Person": 2.0,
+    "Commodity": 2.0,
+    "Office Address": 1.0,
+}
+
+# Columns shipped with each hit so the page can show and locate it
+DOC_COLUMNS = ["Company Name", "Category", "Commodity", "Office Address"]
+
+
+def normalize(text):
+    """Lowercase ASCII words separated by single spaces."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return " ".join("".join(c if c.isalnum() else " " for c in text.lower()).split())
+
+
+def _normalize_series(values):
+    return (values.fillna("").astype(str)
+            .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+            .str.lower().str.replace(r"[^0-9a-z]+", " ", regex=True).str.strip())
+
+
+def split_commodities(values):
+    """Split free-text commodities ("Maize, Rice & Ginger") into one value per row."""
+    parts = values.fillna("").astype(str).str.split(r"\s*(?:,|&|/|\band\b)\s*", regex=True)
+    parts = parts.explode().str.strip()
+    return parts[parts != ""]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Matching rule shared with the SearchBox script: a term matches a query word
+# it starts with, or (words of FUZZY_MIN_LENGTH+ letters) whose start is one
+# edit away from the word, keeping the first letter, so a word's matches all
+# sit in the shards of its first letter
+FUZZY_MIN_LENGTH = 3
+FUZZY_SCORE = 0.5
+
+
+def one_edit(a, b):
+    """True when ``a`` and ``b`` differ by at most one substitution, insertion or deletion."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = j = edits = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            i += 1
+            j += 1
+            continue
+        edits += 1
+        if edits > 1:
+            return False
+        if len(a) > len(b):
+            i += 1
+        elif len(a) < len(b):
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return edits + (len(a) - i) + (len(b) - j) <= 1
+
+
+def fuzzy_prefix(token, term):
+    """Typo-tolerant prefix test: the start of ``term`` is one edit away from ``token``."""
+    n = len(token)
+    return (term[:1] == token[:1]
+            and (one_edit(token, term[:n]) or one_edit(token, term[:n + 1]) or one_edit(token, term[:n - 1])))
+
+
+def _suffix_all(equal):
+    # ok[:, k] is True when equal[:, k:] is all True (ok[:, -1] for the empty tail)
+    ok = np.flip(np.logical_and.accumulate(np.flip(equal, axis=1), axis=1), axis=1)
+    return np.concatenate([ok, np.ones((len(equal), 1), dtype=bool)], axis=1)
+
+
+def fuzzy_prefix_rows(chars, lengths, token):
+    """``fuzzy_prefix(token, term)`` for every row of a term character matrix at once.
+
+    ``chars`` holds one zero-padded ASCII term per row and ``lengths`` their
+    lengths. A substitution keeps ``term[:n]`` within one mismatch of the
+    token; a deleted or inserted letter leaves the part after the common
+    prefix shifted by one, which is checked from that point on.
+    """
+    n = len(token)
+    t = np.frombuffer(token.encode("ascii"), dtype=np.uint8)
+    if chars.shape[1] < n + 1:
+        chars = np.pad(chars, ((0, 0), (0, n + 1 - chars.shape[1])))
+    rows = np.arange(len(chars))
+    same = chars[:, :n] == t
+    common = np.where(same.all(axis=1), n, same.argmin(axis=1))
+    substituted = (lengths >= n) & (same.sum(axis=1) >= n - 1)
+    # term[:n - 1] is the token with one letter dropped
+    deleted = (lengths >= n - 1) & _suffix_all(chars[:, :n - 1] == t[1:])[rows, np.minimum(common, n - 1)]
+    # term[:n + 1] is the token with one letter added
+    inserted = (lengths >= n + 1) & _suffix_all(chars[:, 1:n + 1] == t)[rows, common]
+    return (chars[:, 0] == t[0]) & (substituted | deleted | inserted)
+
+
+class SearchIndex:
+    """Prefix index (with one-typo tolerance) over stakeholder names, contacts, commodities and addresses."""
+
+    def __init__(self, terms, offsets, postings_doc, postings_weight, docs):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings_doc = postings_doc
+        self.postings_weight = postings_weight
+        self.docs = docs
+        # Terms as a zero-padded byte matrix (rows in term order) for the typo pass
+        width = max(terms.dtype.itemsize // 4, 1)
+        self.chars = terms.astype(f"<U{width}").view(np.uint32).reshape(len(terms), width).astype(np.uint8)
+        self.lengths = np.char.str_len(terms) if len(terms) else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, df, fields=None):
+        fields = fields or SEARCH_FIELDS
+        # Documents are addressed by row position, whatever the frame's index
+        df = df.reset_index(drop=True)
+        frames = []
+        for col, weight in fields.items():
+            if col not in df.columns:
+                continue
+            values = split_commodities(df[col]) if col == "Commodity" else df[col]
+            tokens = _normalize_series(values).str.split().explode().dropna()
+            tokens = tokens[tokens != ""]
+            frames.append(pd.DataFrame({"doc": tokens.index.to_numpy(), "term": tokens.to_numpy(), "weight": weight}))
+
+        pairs = pd.concat(frames, ignore_index=True)
+        pairs = pairs.groupby(["term", "doc"], sort=True)["weight"].max().reset_index()
+
+        terms, term_ids = np.unique(pairs["term"].to_numpy(dtype=str), return_inverse=True)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(terms)))])
+
+        docs = pd.DataFrame({col: df[col].fillna("").astype(str).str.strip().to_numpy()
+                             for col in DOC_COLUMNS if col in df.columns})
+        docs["lat"] = df["Latitude"].to_numpy(dtype=float)
+        docs["lng"] = df["Longitude"].to_numpy(dtype=float)
+
+        return cls(terms, offsets, pairs["doc"].to_numpy(dtype=np.int64),
+                   pairs["weight"].to_numpy(dtype=np.float32), docs)
+
+    def _range(self, prefix):
+        lo = np.searchsorted(self.terms, prefix, side="left")
+        hi = np.searchsorted(self.terms, prefix + "\uffff", side="left")
+        return lo, hi
+
+    def _prefix_terms(self, token):
+        ids = np.arange(*self._range(token))
+        lengths = np.char.str_len(self.terms[ids]) if len(ids) else np.array([])
+        # Exact match scores 1.0, longer completions a little less
+        return ids, 0.6 + 0.4 * len(token) / np.maximum(lengths, 1)
+
+    def _fuzzy_terms(self, token, prefix_ids):
+        # Same first letter, not already a prefix match, start one edit away
+        lo, hi = self._range(token[0])
+        match = fuzzy_prefix_rows(self.chars[lo:hi], self.lengths[lo:hi], token)
+        match[prefix_ids - lo] = False
+        ids = lo + np.flatnonzero(match)
+        return ids, np.full(len(ids), FUZZY_SCORE)
+
+    def search(self, query, limit=10, fuzzy=True):
+        """Ranked matches for a free-text query as (row position, score) pairs.
+
+        Every query word must match (by prefix, or with ``fuzzy`` by a prefix
+        one typo away, see ``fuzzy_prefix``); ranks add up the best field
+        weight per word. The SearchBox script applies the same rule to the
+        shards, so both return the same hits.
+        """
+        tokens = normalize(query).split()
+        if not tokens:
+            return []
+        total = np.zeros(len(self.docs), dtype=np.float64)
+        matched = np.zeros(len(self.docs), dtype=np.int32)
+
+        for token in tokens:
+            ids, scores = self._prefix_terms(token)
+            if fuzzy and len(token) >= FUZZY_MIN_LENGTH:
+                fuzzy_ids, fuzzy_scores = self._fuzzy_terms(token, ids)
+                ids = np.concatenate([ids, fuzzy_ids])
+                scores = np.concatenate([scores, fuzzy_scores])
+            if not len(ids):
+                continue
+            starts, ends = self.offsets[ids], self.offsets[ids + 1]
+            lengths = ends - starts
+            index = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+            docs = self.postings_doc[index]
+            values = self.postings_weight[index] * np.repeat(scores, lengths)
+            # Best match per document for this word
+            best = np.zeros(len(self.docs), dtype=np.float64)
+            np.maximum.at(best, docs, values)
+            total += best
+            matched += best > 0
+
+        ranked = np.flatnonzero(matched == len(tokens))
+        if not len(ranked):
+            return []
+        # Ties keep row order (as in the browser), so sort fully before cutting
+        ranked = ranked[np.argsort(-total[ranked], kind="stable")][:limit]
+        return [(int(i), float(total[i])) for i in ranked]
+
+    def write_shards(self, out_dir=SEARCH_DIR, fmt="js", doc_shard_size=1000):
+        """Write term shards (by two-letter prefix) and id-range document shards.
+
+        ``fmt="js"`` wraps each shard in a callback so pages opened from
+        file:// can load them with <script> tags. File names carry a content
+        hash (``meta["files"]`` maps shard name to file), so a page never
+        reads shards written for another build.
+        """
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir)
+        files = {}
+
+        def write(name, data):
+            body = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+            if fmt == "js":
+                body = f'stakeholderSearchShard("{name}",{body});'
+            files[name] = f"{name}-{hashlib.sha256(body.encode('utf-8')).hexdigest()[:12]}.{fmt}"
+            with open(os.path.join(out_dir, files[name]), "w", encoding="utf-8") as f:
+                f.write(body)
+
+        prefixes = np.array([term[:2] for term in self.terms])
+        boundaries = np.flatnonzero(prefixes[1:] != prefixes[:-1]) + 1
+        shards = []
+        for lo, hi in zip(np.r_[0, boundaries], np.r_[boundaries, len(self.terms)]):
+            postings = []
+            for term_id in range(lo, hi):
+                a, b = self.offsets[term_id], self.offsets[term_id + 1]
+                flat = np.empty(2 * (b - a), dtype=np.float64)
+                flat[0::2] = self.postings_doc[a:b]
+                flat[1::2] = self.postings_weight[a:b]
+                postings.append([int(v) if v.is_integer() else float(v) for v in flat])
+            write(f"t-{prefixes[lo]}", {"terms": self.terms[lo:hi].tolist(), "postings": postings})
+            shards.append(str(prefixes[lo]))
+
+        for start in range(0, len(self.docs), doc_shard_size):
+            chunk = self.docs.iloc[start:start + doc_shard_size]
+            data = {"start": start, "lat": chunk["lat"].round(6).tolist(), "lng": chunk["lng"].round(6).tolist()}
+            data.update({col: chunk[col].tolist() for col in DOC_COLUMNS if col in chunk.columns})
+            write(f"d-{start // doc_shard_size}", data)
+
+        meta = {"format": fmt, "docShardSize": doc_shard_size, "count": len(self.docs), "shards": shards,
+                "files": files}
+        with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return meta
+
+
+class SearchBox(folium.MacroElement):
+    """Typeahead box that queries the sharded search index in the browser."""
+
+    _template = Template("""
+        {% macro header(this, kwargs) %}
+        <style>
+            #{{ this.get_name() }} { position: fixed; top: 10px; left: 60px; z-index: 1000; width: 300px; }
+            #{{ this.get_name() }} input { width: 100%; padding: 5px; box-sizing: border-box; }
+            #{{ this.get_name() }} ul { list-style-type: none; padding: 0; margin: 0; background: white; border: 1px solid #ccc; }
+            #{{ this.get_name() }} li { padding: 5px; cursor: pointer; }
+            #{{ this.get_name() }} li small { color: #666; }
+        </style>
+        {% endmacro %}
+
+        {% macro html(this, kwargs) %}
+        <div id="{{ this.get_name() }}">
+            <input type="text" placeholder="{{ this.placeholder }}">
+            <ul></ul>
+        </div>
+        {% endmacro %}
+
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var meta = {{ this.meta }};
+            var baseUrl = {{ this.url|tojson }};
+            var fields = {{ this.fields }};
+            var box = document.getElementById({{ this.get_name()|tojson }});
+            var input = box.querySelector("input");
+            var list = box.querySelector("ul");
+            var shards = {};
+            var pending = {};
+
+            window.stakeholderSearchShard = function(name, data) {
+                shards[name] = data;
+                (pending[name] || []).forEach(function(done) { done(data); });
+                delete pending[name];
+            };
+            function loadShard(name, done) {
+                if (name in shards) { return done(shards[name]); }
+                if (pending[name]) { return pending[name].push(done); }
+                pending[name] = [done];
+                var url = baseUrl + meta.files[name];
+                var fail = function() { window.stakeholderSearchShard(name, null); };
+                if (meta.format === "js") {
+                    var script = document.createElement("script");
+                    script.src = url;
+                    script.onerror = fail;
+                    document.head.appendChild(script);
+                } else {
+                    fetch(url).then(function(r) { return r.ok ? r.json() : null; })
+                        .then(function(data) { window.stakeholderSearchShard(name, data); }, fail);
+                }
+            }
+            function loadAll(names, done) {
+                var left = names.length, out = {};
+                if (!left) { return done(out); }
+                names.forEach(function(name) {
+                    loadShard(name, function(data) { out[name] = data; if (--left === 0) { done(out); } });
+                });
+            }
+
+            function normalize(text) {
+                return text.normalize("NFKD").replace(/[\\u0300-\\u036f]/g, "").toLowerCase()
+                    .replace(/[^0-9a-z]+/g, " ").trim();
+            }
+            // True when a and b differ by at most one edit
+            function oneEdit(a, b) {
+                if (Math.abs(a.length - b.length) > 1) { return false; }
+                var i = 0, j = 0, edits = 0;
+                while (i < a.length && j < b.length) {
+                    if (a[i] === b[j]) { i++; j++; continue; }
+                    if (++edits > 1) { return false; }
+                    if (a.length > b.length) { i++; } else if (a.length < b.length) { j++; } else { i++; j++; }
+                }
+                return edits + (a.length - i) + (b.length - j) <= 1;
+            }
+            // Typo-tolerant prefix test (search_index.fuzzy_prefix): one
+            // substitution, insertion or deletion after the first letter
+            function fuzzyPrefix(token, term) {
+                return term[0] === token[0] && (oneEdit(token, term.slice(0, token.length)) ||
+                    oneEdit(token, term.slice(0, token.length + 1)) ||
+                    oneEdit(token, term.slice(0, token.length - 1)));
+            }
+            // Term shards (by two-letter prefix) that can hold a word's matches
+            function shardsFor(token) {
+                return meta.shards.filter(function(s) {
+                    if (s[0] !== token[0]) { return false; }
+                    if (token.length >= {{ this.fuzzy_min_length }}) { return true; }
+                    return token.length === 1 || s === token.slice(0, 2);
+                }).map(function(s) { return "t-" + s; });
+            }
+            function scoreToken(token, loaded, totals, counts) {
+                var best = {};
+                shardsFor(token).forEach(function(name) {
+                    var shard = loaded[name];
+                    if (!shard) { return; }
+                    shard.terms.forEach(function(term, t) {
+                        var score = 0;
+                        if (term.lastIndexOf(token, 0) === 0) {
+                            score = 0.6 + 0.4 * token.length / term.length;
+                        } else if (token.length >= {{ this.fuzzy_min_length }} && fuzzyPrefix(token, term)) {
+                            score = {{ this.fuzzy_score }};
+                        }
+                        if (!score) { return; }
+                        var postings = shard.postings[t];
+                        for (var k = 0; k < postings.length; k += 2) {
+                            var value = postings[k + 1] * score;
+                            if (!(best[postings[k]] >= value)) { best[postings[k]] = value; }
+                        }
+                    });
+                });
+                Object.keys(best).forEach(function(doc) {
+                    totals[doc] = (totals[doc] || 0) + best[doc];
+                    counts[doc] = (counts[doc] || 0) + 1;
+                });
+            }
+
+            var current = 0;
+            function search(query) {
+                var tokens = normalize(query).split(" ").filter(Boolean);
+                var run = ++current;
+                if (!tokens.length) { list.innerHTML = ""; return; }
+                var names = [];
+                tokens.forEach(function(token) {
+                    shardsFor(token).forEach(function(name) {
+                        if (names.indexOf(name) < 0) { names.push(name); }
+                    });
+                });
+                loadAll(names, function(loaded) {
+                    if (run !== current) { return; }
+                    var totals = {}, counts = {};
+                    tokens.forEach(function(token) { scoreToken(token, loaded, totals, counts); });
+                    var hits = Object.keys(totals).filter(function(doc) { return counts[doc] === tokens.length; })
+                        .sort(function(a, b) { return totals[b] - totals[a]; }).slice(0, {{ this.limit }});
+                    var docNames = hits.map(function(doc) { return "d-" + Math.floor(doc / meta.docShardSize); })
+                        .filter(function(name, i, all) { return all.indexOf(name) === i; });
+                    loadAll(docNames, function(docs) {
+                        if (run === current) { render(hits, docs); }
+                    });
+                });
+            }
+
+            function render(hits, docs) {
+                list.innerHTML = "";
+                hits.forEach(function(doc) {
+                    var shard = docs["d-" + Math.floor(doc / meta.docShardSize)];
+                    if (!shard) { return; }
+                    var i = doc - shard.start;
+                    var li = document.createElement("li");
+                    li.textContent = shard["Company Name"][i] + " ";
+                    var small = document.createElement("small");
+                    small.textContent = shard["Category"] ? shard["Category"][i] : "";
+                    li.appendChild(small);
+                    li.addEventListener("click", function() {
+                        input.value = shard["Company Name"][i];
+                        list.innerHTML = "";
+                        var latlng = [shard.lat[i], shard.lng[i]];
+                        map.flyTo(latlng, {{ this.zoom }});
+                        var content = document.createElement("div");
+                        fields.forEach(function(f) {
+                            if (!shard[f[1]]) { return; }
+                            var row = document.createElement("div");
+                            var label = document.createElement("b");
+                            label.textContent = f[0] + ": ";
+                            row.appendChild(label);
+                            row.appendChild(document.createTextNode(shard[f[1]][i]));
+                            content.appendChild(row);
+                        });
+                        L.popup().setLatLng(latlng).setContent(content).openOn(map);
+                    });
+                    list.appendChild(li);
+                });
+            }
+
+            input.addEventListener("input", function() { search(input.value); });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, meta, url=SEARCH_DIR, placeholder="Search company, contact, commodity or address...",
+                 limit=10, zoom=13):
+        super().__init__()
+        self._name = "SearchBox"
+        self.meta = json.dumps(meta)
+        self.url = f"{url.rstrip('/')}/"
+        self.placeholder = placeholder
+        self.limit = limit
+        self.zoom = zoom
+        self.fuzzy_min_length = FUZZY_MIN_LENGTH
+        self.fuzzy_score = FUZZY_SCORE
+        self.fields = json.dumps([["Company", "Company Name"], ["Category", "Category"],
+                                  ["Commodity", "Commodity"], ["Office Address", "Office Address"]])
+
+
+def add_search_box(m, df, out_dir=SEARCH_DIR, fmt="js", **kwargs):
+    """Build the index for ``df``, write its shards and add the search box.
+
+    The index is cached by the hash of the searched columns, and the shards
+    are only rewritten when ``out_dir`` holds another build.
+    """
+    key = frame_hash(df, list(SEARCH_FIELDS) + DOC_COLUMNS + ["Latitude", "Longitude"])
+    key = f"{key}-{options_key(version=INDEX_VERSION)}"
+    path = cache_path("search", key, "pkl")
+    if os.path.exists(path):
+        stats["search:hit"] += 1
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+    else:
+        stats["search:miss"] += 1
+        index = SearchIndex.build(df)
+        write_atomic(path, pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+
+    meta = None
+    meta_path = os.path.join(out_dir, "meta.json")
+    build_key = f"{key}-{options_key(fmt=fmt)}"
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    # Shards written before files were content-named have no "files" map
+    if meta is None or meta.get("build") != build_key or "files" not in meta:
+        meta = index.write_shards(out_dir, fmt)
+        meta["build"] = build_key
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    SearchBox(meta, url=out_dir, **kwargs).add_to(m)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the stakeholder search index from the command line.")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
+    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+
+    index = SearchIndex.build(df)
+    start = time.perf_counter()
+    hits = index.search(" ".join(args.query), args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for position, score in hits:
+        doc = index.docs.iloc[position]
+        print(f"{score:5.2f}  {doc['Company Name']}  ({doc.get('Category', '')}; {doc.get('Commodity', '')})")
+    print(f"{len(hits)} hits in {elapsed:.2f} ms")
@@ -0,0 +1,711 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+from jinja2 import Template
+from shapely.geometry import mapping, shape
+
+from boundaries import load_boundaries
+from cache import frame_hash
+from clustering import mercator_xy
+from dedupe import merge_entities, resolve_entities
+from facets import normalize_categories
+from geocode import geocode_missing
+from loader import diff_stakeholders, load_stakeholders, row_keys
+from marker_layer import DEFAULT_ICON, POPUP_FIELDS, dump_payload
+from publish import ASSETS_DIR
+from sprites import SPRITES_PATH, add_sprite_icons
+from tiles import TiledGeoJson, clip_to_tile, pixel_degrees, tile_bounds, use_local_leaflet
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Above this many points in the viewport the server answers with clusters
+POINT_LIMIT = 2000
+CLUSTER_RADIUS = 60
+
+# Directories served as static files, relative to the working directory
+STATIC_DIRS = ("leaflet", "img", ASSETS_DIR)
+
+# Deltas touching more rows than this tell pages to refetch instead
+MAX_DELTA_ROWS = 5000
+KEEPALIVE_SECONDS = 15
+
+ICON_MAPPING = {
+    "Contract Farming": "img/contract.png",
+    "Seeds Company": "img/seeds.png",
+    "Aggregator": "img/aggreg.png",
+    "Processors": "img/proces.png",
+    "Fertilizer Company": "img/fert.png",
+}
+
+STATUS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+          405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class StakeholderStore:
+    """In-memory stakeholder index answering bbox/zoom/category queries.
+
+    Points go into an STRtree; dense viewports are aggregated on a screen
+    grid (``CLUSTER_RADIUS`` pixels at the requested zoom) so a response
+    never carries more than ``POINT_LIMIT`` markers.
+    """
+
+    def __init__(self, df):
+        df = df[df["Latitude"].notna() & df["Longitude"].notna()].reset_index(drop=True)
+        self.df = df
+        self.lat = df["Latitude"].to_numpy(dtype=float)
+        self.lng = df["Longitude"].to_numpy(dtype=float)
+        self.x, self.y = mercator_xy(self.lat, self.lng)
+        self.category_codes, categories = pd.factorize(normalize_categories(df["Category"]))
+        self.categories = list(categories)
+        self.names = df["Company Name"].astype(str).to_numpy()
+        self.keys = row_keys(df)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.tree = shapely.STRtree(shapely.points(self.lng, self.lat))
+        self.version = frame_hash(df)
+
+    def query(self, bbox, zoom, categories=None, limit=POINT_LIMIT):
+        west, south, east, north = bbox
+        idx = np.sort(self.tree.query(shapely.box(west, south, east, north)))
+        if categories:
+            wanted = [self.categories.index(c) for c in categories if c in self.categories]
+            idx = idx[np.isin(self.category_codes[idx], wanted)]
+
+        if len(idx) <= limit:
+            return {"points": {
+                "id": self.keys[idx].tolist(),
+                "lat": self.lat[idx].round(6).tolist(),
+                "lng": self.lng[idx].round(6).tolist(),
+                "name": self.names[idx].tolist(),
+                "category": self.category_codes[idx].tolist(),
+            }, "clusters": None, "categories": self.categories, "total": int(len(idx))}
+
+        cell = CLUSTER_RADIUS / (256 * 2 ** zoom)
+        gx = np.floor(self.x[idx] / cell).astype(np.int64)
+        gy = np.floor(self.y[idx] / cell).astype(np.int64)
+        _, group, counts = np.unique(gx * (2 ** 31) + gy, return_inverse=True, return_counts=True)
+        group = group.ravel()
+        return {"points": None, "clusters": {
+            "lat": (np.bincount(group, weights=self.lat[idx]) / counts).round(6).tolist(),
+            "lng": (np.bincount(group, weights=self.lng[idx]) / counts).round(6).tolist(),
+            "count": counts.tolist(),
+        }, "categories": self.categories, "total": int(len(idx))}
+
+    def details(self, key):
+        row = self.df.iloc[self.positions[key]]
+        return {col: str(row[col]) for _, col in POPUP_FIELDS if col in self.df.columns}
+
+    def rows(self, positions):
+        """Marker summaries for row positions, as sent in live deltas."""
+        return [{"id": self.keys[i], "lat": round(float(self.lat[i]), 6), "lng": round(float(self.lng[i]), 6),
+                 "name": self.names[i], "category": self.categories[self.category_codes[i]]} for i in positions]
+
+    def delta(self, new):
+        """What changed from this store to ``new``, as a live-update event."""
+        added, removed, changed = diff_stakeholders(self.df, new.df)
+        delta = {"version": new.version, "categories": new.categories,
+                 "added": new.rows(added), "removed": removed, "changed": new.rows(changed)}
+        if len(added) + len(removed) + len(changed) > MAX_DELTA_ROWS:
+            delta.update(added=[], removed=[], changed=[], reload=True)
+        return delta
+
+
+class BoundaryTiles:
+    """Boundary outlines cut into z/x/y GeoJSON tiles on request.
+
+    Each zoom's boundaries are simplified to about one pixel (through the
+    boundary cache) and indexed in an STRtree the first time that zoom is
+    asked for.
+    """
+
+    def __init__(self, path, properties=None, min_zoom=4, max_zoom=14):
+        self.path = path
+        self.properties = properties
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.levels = {}
+        # Tiles are cut in worker threads; one build per zoom, none across a reload
+        self.lock = threading.Lock()
+
+    def level(self, z):
+        with self.lock:
+            if z not in self.levels:
+                collection = load_boundaries(self.path, tolerance=pixel_degrees(z), properties=self.properties)
+                features = [f for f in collection["features"] if f["geometry"]]
+                outlines = np.array([shape(f["geometry"]).boundary for f in features])
+                self.levels[z] = (features, outlines, shapely.STRtree(outlines))
+            return self.levels[z]
+
+    def invalidate(self):
+        with self.lock:
+            self.levels.clear()
+
+    def tile(self, z, x, y):
+        z = max(self.min_zoom, min(self.max_zoom, z))
+        features, outlines, tree = self.level(z)
+        box = shapely.box(*tile_bounds(x, y, z))
+        out = []
+        for i in tree.query(box):
+            clipped = clip_to_tile(outlines[i], x, y, z)
+            if not clipped.is_empty:
+                out.append({"type": "Feature", "properties": features[i]["properties"], "geometry": mapping(clipped)})
+        return {"type": "FeatureCollection", "features": out}
+
+
+class LatencyMetrics:
+    """Per-route request counts and latency percentiles over a sliding window."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.counts = defaultdict(int)
+        self.bytes = defaultdict(int)
+        # /metrics is served from a worker thread while requests are recorded
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, size):
+        with self.lock:
+            self.samples[route].append(seconds)
+            self.counts[route] += 1
+            self.bytes[route] += size
+
+    def summary(self):
+        with self.lock:
+            snapshot = {route: (list(samples), self.counts[route], self.bytes[route])
+                        for route, samples in self.samples.items()}
+        out = {}
+        for route, (samples, count, size) in snapshot.items():
+            ms = np.array(samples) * 1000
+            out[route] = {"count": count, "bytes": size,
+                          "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                          "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                          "max_ms": round(float(ms.max()), 3)}
+        return out
+
+
+class ViewportStakeholders(folium.map.Layer):
+    """Markers fetched from the server for the current viewport, zoom and category."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var options = {{ this.options }};
+            var fields = options.fields;
+            var group = L.layerGroup();
+            var category = "";
+            var controller = null;
+            var icons = {};
+            var markers = {};
+            var clustered = false;
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            function iconFor(name) {
+                if (!icons[name] && options.sprites) {
+                    icons[name] = L.divIcon({
+                        className: options.sprites.classes[name] || options.sprites["default"],
+                        iconSize: [options.sprites.size, options.sprites.size]
+                    });
+                } else if (!icons[name]) {
+                    icons[name] = L.icon({iconUrl: options.icons[name] || options.defaultIcon, iconSize: [30, 30]});
+                }
+                return icons[name];
+            }
+            function clusterIcon(count) {
+                var size = count < 100 ? 36 : count < 1000 ? 42 : 48;
+                var label = count >= 1000 ? Math.round(count / 100) / 10 + "k" : String(count);
+                return L.divIcon({
+                    html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size +
+                          'px;border-radius:50%;background:rgba(241,128,23,0.8);text-align:center;font:bold 12px sans-serif;">' +
+                          label + '</div>',
+                    className: "",
+                    iconSize: [size, size]
+                });
+            }
+            function detailsPopup(id, marker) {
+                fetch(options.url + "/" + encodeURIComponent(id)).then(function(r) { return r.json(); }).then(function(row) {
+                    marker.setPopupContent(fields.map(function(f) {
+                        return "<b>" + f[0] + ":</b> " + escapeHtml(row[f[1]] || "");
+                    }).join("<br>"));
+                });
+                return "<i>Loading...</i>";
+            }
+
+            function addMarker(id, lat, lng, name, categoryName) {
+                var marker = L.marker([lat, lng], {icon: iconFor(categoryName)});
+                marker.bindTooltip(escapeHtml(name));
+                marker.bindPopup("", {maxWidth: 300});
+                marker.on("popupopen", function() { marker.setPopupContent(detailsPopup(id, marker)); });
+                markers[id] = marker;
+                group.addLayer(marker);
+            }
+            function removeMarker(id) {
+                group.removeLayer(markers[id]);
+                delete markers[id];
+            }
+
+            function render(data) {
+                if (data.clusters) {
+                    group.clearLayers();
+                    markers = {};
+                    clustered = true;
+                    data.clusters.count.forEach(function(count, i) {
+                        var latlng = [data.clusters.lat[i], data.clusters.lng[i]];
+                        var marker = L.marker(latlng, {icon: clusterIcon(count)});
+                        marker.on("click", function() { map.setView(latlng, map.getZoom() + 2); });
+                        group.addLayer(marker);
+                    });
+                    return;
+                }
+                if (clustered) {
+                    group.clearLayers();
+                    clustered = false;
+                }
+                // Markers already on the map are kept; live deltas keep them current
+                var points = data.points, seen = {};
+                points.id.forEach(function(id, i) {
+                    seen[id] = true;
+                    if (!markers[id]) {
+                        addMarker(id, points.lat[i], points.lng[i], points.name[i], data.categories[points.category[i]]);
+                    }
+                });
+                Object.keys(markers).forEach(function(id) {
+                    if (!seen[id]) { removeMarker(id); }
+                });
+            }
+
+            function update() {
+                if (!map.hasLayer(group)) { return; }
+                var b = map.getBounds();
+                var query = "?bbox=" + [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].map(function(v) {
+                    return v.toFixed(5);
+                }).join(",") + "&zoom=" + Math.round(map.getZoom());
+                if (category) { query += "&category=" + encodeURIComponent(category); }
+                // Drop the response of a viewport the user already left
+                if (controller) { controller.abort(); }
+                controller = window.AbortController ? new AbortController() : null;
+                fetch(options.url + query, controller ? {signal: controller.signal} : {})
+                    .then(function(r) { return r.json(); })
+                    .then(render, function() {});
+            }
+
+            function setCategories(categories) {
+                options.categories = categories;
+                select.innerHTML = '<option value="">All categories</option>' + categories.map(function(c) {
+                    return '<option value="' + escapeHtml(c) + '">' + escapeHtml(c) + '</option>';
+                }).join("");
+                select.value = category;
+            }
+
+            // Patch the visible markers with a live-update event from the server
+            group.applyDelta = function(delta) {
+                if (delta.categories) { setCategories(delta.categories); }
+                if (delta.reload || clustered) {
+                    update();
+                    return;
+                }
+                delta.removed.forEach(function(id) {
+                    if (markers[id]) { removeMarker(id); }
+                });
+                var bounds = map.getBounds();
+                delta.changed.concat(delta.added).forEach(function(row) {
+                    var marker = markers[row.id];
+                    var shown = bounds.contains([row.lat, row.lng]) && (!category || row.category === category);
+                    if (!shown) {
+                        if (marker) { removeMarker(row.id); }
+                    } else if (marker) {
+                        marker.setLatLng([row.lat, row.lng]);
+                        marker.setIcon(iconFor(row.category));
+                        marker.setTooltipContent(escapeHtml(row.name));
+                        if (marker.isPopupOpen()) { marker.setPopupContent(detailsPopup(row.id, marker)); }
+                    } else {
+                        addMarker(row.id, row.lat, row.lng, row.name, row.category);
+                    }
+                });
+            };
+
+            var select = L.DomUtil.create("select");
+            L.DomEvent.disableClickPropagation(select);
+            select.addEventListener("change", function() { category = select.value; update(); });
+            setCategories(options.categories);
+            var filter = L.control({position: "topright"});
+            filter.onAdd = function() { return select; };
+            filter.addTo(map);
+
+            map.on("moveend", update);
+            group.on("add", update);
+            {%- if this.show %}
+            group.addTo(map);
+            {%- endif %}
+            return group;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, categories, url="/api/stakeholders", name="Stakeholders", icon_mapping=None,
+                 fields=None, sprites=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "ViewportStakeholders"
+        self.options = dump_payload({
+            "url": url,
+            "categories": categories,
+            "icons": icon_mapping or {},
+            "defaultIcon": DEFAULT_ICON,
+            "fields": fields or POPUP_FIELDS,
+            "sprites": sprites,
+        })
+
+
+class LiveUpdates(folium.MacroElement):
+    """Subscribes the page to the server's event stream and patches layers in place."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            if (!window.EventSource) { return null; }
+            var source = new EventSource({{ this.url|tojson }});
+            var tiles = {
+                {%- for layer, element in this.tiles.items() %}
+                {{ layer|tojson }}: {{ element.get_name() }},
+                {%- endfor %}
+            };
+            source.addEventListener("stakeholders", function(event) {
+                {{ this.stakeholders.get_name() }}.applyDelta(JSON.parse(event.data));
+            });
+            source.addEventListener("boundaries", function(event) {
+                var layer = tiles[JSON.parse(event.data).layer];
+                if (layer) { layer.reload(); }
+            });
+            return source;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, stakeholders, tiles, url="/events"):
+        super().__init__()
+        self._name = "LiveUpdates"
+        self.stakeholders = stakeholders
+        self.tiles = tiles
+        self.url = url
+
+
+def map_shell(store, center=None, zoom_start=8):
+    """The page the server hands out: Leaflet from /leaflet and data from the API."""
+    if center is None:
+        center = [float(np.mean(store.lat)), float(np.mean(store.lng))] if len(store.lat) else [10.5, 7.5]
+    m = folium.Map(location=center, zoom_start=zoom_start)
+    use_local_leaflet(m, "/leaflet")
+    tiles = {
+        "state": TiledGeoJson("state", "State Boundary", "/tiles", 4, 14, "geojson",
+                              style={"color": "blue", "weight": 2, "fill": False}, zoom_slack=4).add_to(m),
+        "lga": TiledGeoJson("lga", "LGA Boundaries", "/tiles", 4, 14, "geojson",
+                            style={"color": "green", "weight": 1, "fill": False}, tooltip="lganame",
+                            zoom_slack=4).add_to(m),
+    }
+    sprites = add_sprite_icons(m, ICON_MAPPING, url=f"/{SPRITES_PATH}")
+    stakeholders = ViewportStakeholders(store.categories, sprites=sprites).add_to(m)
+    folium.LayerControl().add_to(m)
+    LiveUpdates(stakeholders, tiles).add_to(m)
+    return m.get_root().render().encode("utf-8")
+
+
+def load_registry(csv_path):
+    """The registry as served: one row per company, missing coordinates geocoded."""
+    return geocode_missing(merge_entities(resolve_entities(load_stakeholders(csv_path, drop_invalid=False))))
+
+
+class MapServer:
+    """Asyncio HTTP/1.1 server for the map shell, static assets, queries and tiles."""
+
+    def __init__(self, store, boundaries, csv_path=None, static_dirs=STATIC_DIRS, compress_min=1024,
+                 cache_size=256):
+        self.store = store
+        self.boundaries = boundaries
+        self.csv_path = csv_path
+        # One queue per open /events stream
+        self.clients = set()
+        self.static_dirs = static_dirs
+        self.compress_min = compress_min
+        self.metrics = LatencyMetrics()
+        # Compressed bodies by (etag, encoding); responses repeat a lot while panning
+        self.compressed = OrderedDict()
+        self.compressed_lock = threading.Lock()
+        self.cache_size = cache_size
+        self.shell = map_shell(store)
+
+    # -- routing ---------------------------------------------------------
+
+    def route(self, path, query):
+        """(route name, status, content type, body) for a GET request."""
+        if path in ("/", "/index.html"):
+            return "shell", 200, "text/html; charset=utf-8", self.shell
+        if path == "/api/stakeholders":
+            try:
+                bbox = [float(v) for v in query["bbox"][0].split(",")]
+                zoom = int(query.get("zoom", ["10"])[0])
+                if len(bbox) != 4 or not np.isfinite(bbox).all():
+                    raise ValueError(bbox)
+            except (KeyError, ValueError):
+                return "query", 400, "application/json", b'{"error":"bbox=w,s,e,n and zoom are required"}'
+            categories = [c for value in query.get("category", []) for c in value.split(",") if c]
+            return "query", 200, "application/json", self.json(self.store.query(bbox, zoom, categories))
+        if path.startswith("/api/stakeholders/"):
+            try:
+                key = unquote(path.rsplit("/", 1)[1])
+                return "details", 200, "application/json", self.json(self.store.details(key))
+            except KeyError:
+                return "details", 404, "application/json", b'{"error":"unknown stakeholder"}'
+        if path.startswith("/tiles/") and path.endswith(".geojson"):
+            try:
+                layer, z, x, y = path[len("/tiles/"):-len(".geojson")].split("/")
+                tiles = self.boundaries[layer]
+                return "tiles", 200, "application/geo+json", self.json(tiles.tile(int(z), int(x), int(y)))
+            except (KeyError, ValueError):
+                return "tiles", 404, "application/json", b'{"error":"unknown tile"}'
+        if path == "/metrics":
+            return "metrics", 200, "application/json", self.json(self.metrics.summary())
+        return self.static(path)
+
+    def static(self, path):
+        parts = [p for p in unquote(path).split("/") if p]
+        if not parts or parts[0] not in self.static_dirs or any(p in ("..", ".") for p in parts):
+            return "static", 404, "text/plain", b"not found"
+        file_path = os.path.join(*parts)
+        if not os.path.isfile(file_path):
+            return "static", 404, "text/plain", b"not found"
+        with open(file_path, "rb") as f:
+            body = f.read()
+        # Published assets are named by content hash and never change in place
+        route = "assets" if parts[0] == ASSETS_DIR else "static"
+        return route, 200, mimetypes.guess_type(file_path)[0] or "application/octet-stream", body
+
+    @staticmethod
+    def json(data):
+        return dump_payload(data).encode("utf-8")
+
+    # -- encoding --------------------------------------------------------
+
+    def encode(self, body, etag, content_type, accept_encoding):
+        compressible = content_type.startswith(("text/", "application/json", "application/geo+json",
+                                                "application/javascript"))
+        if len(body) < self.compress_min or not compressible:
+            return body, None
+        if brotli is not None and "br" in accept_encoding:
+            encoding = "br"
+        elif "gzip" in accept_encoding:
+            encoding = "gzip"
+        else:
+            return body, None
+        key = (etag, encoding)
+        with self.compressed_lock:
+            if key in self.compressed:
+                self.compressed.move_to_end(key)
+                return self.compressed[key], encoding
+        data = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, 6, mtime=0)
+        with self.compressed_lock:
+            self.compressed[key] = data
+            if len(self.compressed) > self.cache_size:
+                self.compressed.popitem(last=False)
+        return data, encoding
+
+    # -- protocol --------------------------------------------------------
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if request_line.split(b" ")[1:2] == [b"/events"]:
+                    await self.stream_events(writer)
+                    break
+                keep_alive = await self.respond(request_line, headers, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request_line, headers, writer):
+        start = time.perf_counter()
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            method, target, version = "", "/", "HTTP/1.0"
+        # Queries, tile cutting, hashing and compression run in a worker thread,
+        # so one slow request does not hold up the other connections
+        route, status, response_headers, body = await asyncio.to_thread(self.response, method, target, headers)
+
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        response_headers["Content-Length"] = str(len(body))
+        response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+        head = f"HTTP/1.1 {status} {STATUS.get(status, '')}\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in response_headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + (b"" if method == "HEAD" else body))
+        self.metrics.record(route, time.perf_counter() - start, len(body))
+        return keep_alive
+
+    def response(self, method, target, headers):
+        """(route name, status, headers, body) for a request; safe to call from any thread."""
+        url = urlsplit(target)
+        if method not in ("GET", "HEAD"):
+            route, status, content_type, body = "invalid", 405, "text/plain", b"method not allowed"
+        else:
+            try:
+                route, status, content_type, body = self.route(url.path, parse_qs(url.query))
+            except Exception as error:  # keep serving; the error goes to the client and the log
+                route, status, content_type, body = "error", 500, "text/plain", str(error).encode("utf-8")
+
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        response_headers = {"Content-Type": content_type, "ETag": etag, "Vary": "Accept-Encoding",
+                            "Cache-Control": "public, max-age=31536000, immutable" if route == "assets"
+                            else "no-cache"}
+        if status == 200 and etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            status, body = 304, b""
+        elif status == 200:
+            body, encoding = self.encode(body, etag, content_type, headers.get("accept-encoding", ""))
+            if encoding:
+                response_headers["Content-Encoding"] = encoding
+        return route, status, response_headers, body
+
+    # -- live updates ----------------------------------------------------
+
+    async def stream_events(self, writer):
+        """Server-sent events: stakeholder deltas and boundary changes until the page closes."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        await writer.drain()
+        queue = asyncio.Queue()
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b": keep-alive\n\n"
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    def publish(self, event, data):
+        message = f"event: {event}\ndata: {dump_payload(data)}\n\n".encode("utf-8")
+        for queue in self.clients:
+            queue.put_nowait(message)
+
+    async def reload_stakeholders(self):
+        # Parsing and indexing run off the event loop; the swap happens on it
+        def build():
+            store = StakeholderStore(load_registry(self.csv_path))
+            return store, self.store.delta(store), map_shell(store)
+
+        store, delta, shell = await asyncio.to_thread(build)
+        self.store, self.shell = store, shell
+        self.publish("stakeholders", delta)
+        print(f"{self.csv_path}: {len(delta['added'])} added, {len(delta['removed'])} removed, "
+              f"{len(delta['changed'])} changed" + (" (full reload)" if delta.get("reload") else ""))
+
+    def reload_boundaries(self, layer):
+        self.boundaries[layer].invalidate()
+        self.publish("boundaries", {"layer": layer})
+        print(f"{self.boundaries[layer].path}: {layer} tiles invalidated")
+
+    async def watch(self, interval=1.0):
+        """Poll the CSV and boundary files; push what changed to every open page.
+
+        A change is applied once the file has stopped changing for one
+        interval, so a save in progress is not read half-written.
+        """
+        sources = {layer: tiles.path for layer, tiles in self.boundaries.items()}
+        if self.csv_path:
+            sources[None] = self.csv_path
+
+        def signature(path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            return stat.st_mtime_ns, stat.st_size
+
+        print(f"Watching {', '.join(sources.values())} for changes")
+        applied = {source: signature(path) for source, path in sources.items()}
+        seen = dict(applied)
+        while True:
+            await asyncio.sleep(interval)
+            for source, path in sources.items():
+                current = signature(path)
+                if current is None or current == applied[source] or current != seen[source]:
+                    seen[source] = current
+                    continue
+                applied[source] = current
+                try:
+                    if source is None:
+                        await self.reload_stakeholders()
+                    else:
+                        self.reload_boundaries(source)
+                except Exception as error:  # keep the last good data; retry on the next save
+                    print(f"{path}: not reloaded ({error})")
+
+    async def serve(self, host="127.0.0.1", port=8000, watch=False, interval=1.0):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving the stakeholder map on http://{host}:{port}/ (metrics at /metrics)")
+        if watch:
+            watcher = asyncio.create_task(self.watch(interval))
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                if watch:
+                    watcher.cancel()
+
+
+def create_server(df, state_path="kaduna.geojson", lga_path="lga_boundaries.geojson", csv_path=None):
+    store = StakeholderStore(df)
+    boundaries = {
+        "state": BoundaryTiles(state_path),
+        "lga": BoundaryTiles(lga_path, properties=["lganame", "lgacode"]),
+    }
+    return MapServer(store, boundaries, csv_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the stakeholder map with viewport queries.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--watch", action="store_true", help="push CSV and boundary edits to open pages")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between file checks")
+    args = parser.parse_args()
+
+    try:
+        server = create_server(load_registry(args.csv), csv_path=args.csv)
+        asyncio.run(server.serve(args.host, args.port, args.watch, args.interval))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,398 @@
+import argparse
+import json
+import os
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+from boundaries import load_boundaries
+from boundary_store import read_boundaries
+from cache import row_hashes, write_atomic
+from loader import CATEGORY_COLUMNS, diff_hashes, load_stakeholders, row_keys
+from marker_layer import dump_payload
+from spatial_join import LGA_COLUMNS, assign_lgas
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Registry history (kept, unlike .cache/): manifest.json, one Arrow file per
+# version and index.arrow with the keys and hashes of the latest version
+SNAPSHOT_DIR = "snapshots"
+
+# Every KEYFRAME_EVERY-th version stores all rows so a checkout never replays
+# more than that many deltas
+KEYFRAME_EVERY = 50
+
+# Bookkeeping columns in the version files
+KEY, OP = "_key", "_op"
+
+# Sequential YlGn steps for the timeline choropleth
+TIMELINE_COLORS = ["#f7fcb9", "#d9f0a3", "#addd8e", "#78c679", "#31a354", "#006837"]
+
+
+def _read_table(path):
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def _write_table(path, table):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with pa.ipc.new_file(tmp_path, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _restore_categories(df):
+    # Categoricals come back as plain values once versions with different
+    # dictionaries are concatenated
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+class SnapshotStore:
+    """Delta-encoded history of the stakeholder registry.
+
+    Each ingest becomes a version holding only the rows added or changed
+    since the previous one, plus one key-only row per removed stakeholder.
+    Keyframe versions hold every row. Changes are found from row keys and
+    64-bit content hashes (``index.arrow``), never by comparing frames.
+    Each version's stakeholder count per LGA is kept in the manifest for
+    the timeline.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, lga_path="lga_boundaries.geojson"):
+        if pa is None:
+            raise ImportError("pyarrow is required for the snapshot store")
+        self.root = root
+        self.lga_path = lga_path
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.index_path = os.path.join(root, "index.arrow")
+        os.makedirs(root, exist_ok=True)
+        self.manifest = {"versions": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    @property
+    def versions(self):
+        return self.manifest["versions"]
+
+    def entry(self, version=None):
+        """Manifest entry of ``version`` (default: the latest)."""
+        if not self.versions:
+            raise KeyError("no snapshots recorded yet")
+        if version is None:
+            return self.versions[-1]
+        for entry in self.versions:
+            if entry["version"] == version:
+                return entry
+        raise KeyError(f"unknown snapshot version: {version}")
+
+    def read(self, version, columns=None):
+        """The rows stored for one version (with ``_key`` and ``_op`` columns)."""
+        table = _read_table(os.path.join(self.root, self.entry(version)["file"]))
+        if columns is not None:
+            table = table.select([KEY, OP] + [col for col in columns if col not in (KEY, OP)])
+        return table.to_pandas()
+
+    def _read_index(self):
+        # (keys, hashes, lgacodes) of the latest version; rebuilt when an
+        # interrupted ingest left it out of step with the manifest
+        if not self.versions:
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.uint64), np.empty(0, dtype=object)
+        latest = self.versions[-1]["version"]
+        if os.path.exists(self.index_path):
+            table = _read_table(self.index_path)
+            if json.loads(table.schema.metadata[b"snapshots"])["version"] == latest:
+                return (table.column("key").to_numpy(zero_copy_only=False).astype(object),
+                        table.column("hash").to_numpy(),
+                        table.column("lgacode").to_numpy(zero_copy_only=False).astype(object))
+        state = self.checkout(latest)
+        lgacodes = assign_lgas(state, read_boundaries(self.lga_path))["lgacode"].to_numpy(dtype=object)
+        return row_keys(state), row_hashes(state), lgacodes
+
+    def _write_index(self, version, keys, hashes, lgacodes):
+        table = pa.table({
+            "key": pa.array(keys, type=pa.string()),
+            "hash": pa.array(hashes, type=pa.uint64()),
+            "lgacode": pa.array(lgacodes, type=pa.string()),
+        }).replace_schema_metadata({b"snapshots": json.dumps({"version": version}).encode("utf-8")})
+        _write_table(self.index_path, table)
+
+    def ingest(self, df, label=None, source=None):
+        """Record ``df`` as a new version and return its manifest entry.
+
+        Nothing is written when no row changed since the latest version;
+        that version's entry is returned instead.
+        """
+        df = df.reset_index(drop=True)
+        keys, hashes = row_keys(df), row_hashes(df)
+        old_keys, old_hashes, old_lgas = self._read_index()
+        added, removed, changed = diff_hashes(old_keys, old_hashes, keys, hashes)
+        latest = self.versions[-1] if self.versions else None
+        if latest is not None and not (len(added) or len(removed) or len(changed)):
+            return latest
+
+        version = latest["version"] + 1 if latest else 1
+        last_keyframe = max((entry["version"] for entry in self.versions if entry["keyframe"]), default=0)
+        keyframe = latest is None or version - last_keyframe >= KEYFRAME_EVERY
+
+        # LGAs are looked up for added and changed rows only
+        position = pd.Index(old_keys).get_indexer(keys)
+        lgacodes = np.full(len(df), "", dtype=object)
+        known = position >= 0
+        lgacodes[known] = old_lgas[position[known]]
+        upserted = np.concatenate([added, changed])
+        if len(upserted):
+            located = assign_lgas(df.iloc[upserted], read_boundaries(self.lga_path))
+            lgacodes[upserted] = located["lgacode"].to_numpy(dtype=object)
+
+        counts = pd.Series(latest["lgas"] if latest else {}, dtype=np.int64)
+        removed_position = pd.Index(old_keys).get_indexer(removed)
+        for codes, sign in ((lgacodes[added], 1), (lgacodes[changed], 1),
+                            (old_lgas[position[changed]], -1), (old_lgas[removed_position], -1)):
+            counts = counts.add(sign * pd.Series(codes, dtype=object).value_counts(), fill_value=0)
+        counts = counts[(counts > 0) & (counts.index != "")].astype(np.int64)
+
+        ops = np.full(len(df), "", dtype=object)
+        ops[added], ops[changed] = "added", "changed"
+        rows = np.arange(len(df)) if keyframe else np.sort(upserted)
+        stored = df.iloc[rows].copy()
+        gone = df.iloc[:0].reindex(range(len(removed)))
+        stored = pd.concat([stored, gone], ignore_index=True)
+        stored.insert(0, OP, np.concatenate([ops[rows], np.full(len(removed), "removed", dtype=object)]))
+        stored.insert(0, KEY, np.concatenate([keys[rows], np.asarray(removed, dtype=object)]))
+
+        name = f"v{version:05d}.arrow"
+        _write_table(os.path.join(self.root, name), pa.Table.from_pandas(stored, preserve_index=False))
+        self._write_index(version, keys, hashes, lgacodes)
+        entry = {
+            "version": version,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "label": label,
+            "source": source,
+            "file": name,
+            "keyframe": keyframe,
+            "rows": len(df),
+            "added": len(added),
+            "removed": len(removed),
+            "changed": len(changed),
+            "lgas": {str(code): int(n) for code, n in counts.sort_index().items()},
+        }
+        self.versions.append(entry)
+        write_atomic(self.manifest_path, json.dumps(self.manifest, indent=1))
+        return entry
+
+    def checkout(self, version=None):
+        """The registry as of ``version`` (default: latest): its keyframe plus the deltas after it."""
+        version = self.entry(version)["version"]
+        start = max(entry["version"] for entry in self.versions if entry["keyframe"] and entry["version"] <= version)
+        state = self.read(start)
+        state = state[state[OP] != "removed"]
+        for entry in self.versions:
+            if start < entry["version"] <= version:
+                delta = self.read(entry["version"])
+                upserts = delta[delta[OP] != "removed"]
+                # Changed rows keep their place, added rows go to the end
+                kept = state[~state[KEY].isin(delta[KEY])]
+                previous = pd.Index(state[KEY])
+                order = np.concatenate([previous.get_indexer(kept[KEY]), previous.get_indexer(upserts[KEY])])
+                appended = order[len(kept):] < 0
+                order[len(kept):][appended] = len(state) + np.arange(appended.sum())
+                state = pd.concat([kept, upserts], ignore_index=True).iloc[np.argsort(order, kind="stable")]
+        return _restore_categories(state.drop(columns=[KEY, OP]).reset_index(drop=True))
+
+    def diff(self, old, new=None):
+        """(added, removed, changed) keys between two versions.
+
+        Only the ``_key``/``_op`` columns of the versions in between are
+        read, so the cost follows the number of changes, not the registry size.
+        """
+        old, new = self.entry(old)["version"], self.entry(new)["version"]
+        if old > new:
+            raise ValueError("the old version must come first")
+        ops = [self.read(entry["version"], columns=[])
+               for entry in self.versions if old < entry["version"] <= new]
+        ops = pd.concat(ops, ignore_index=True) if ops else pd.DataFrame({KEY: [], OP: []})
+        ops = ops[ops[OP] != ""]
+        grouped = ops.groupby(KEY, sort=True)[OP]
+        existed = grouped.first() != "added"
+        exists = grouped.last() != "removed"
+        return (existed.index[~existed & exists].tolist(),
+                existed.index[existed & ~exists].tolist(),
+                existed.index[existed & exists].tolist())
+
+
+class TimelineLayer(folium.map.Layer):
+    """LGA choropleth with a time slider over the registry's snapshot versions.
+
+    Each frame carries only a label, a total and a count per LGA code; the
+    boundaries are shipped once and restyled when the slider moves.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var frames = {{ this.frames }};
+            var colors = {{ this.colors }};
+            var current = frames.length - 1;
+            var max = 1;
+            frames.forEach(function(frame) {
+                Object.keys(frame.counts).forEach(function(code) { max = Math.max(max, frame.counts[code]); });
+            });
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            function count(feature, i) { return frames[i].counts[feature.properties.lgacode] || 0; }
+            function style(feature) {
+                var n = count(feature, current);
+                var step = Math.min(colors.length - 1, Math.floor(n / max * colors.length));
+                return {color: "#555", weight: 1, fillColor: colors[step], fillOpacity: n ? 0.7 : 0.15};
+            }
+
+            var layer = L.geoJSON({{ this.geojson }}, {
+                style: style,
+                onEachFeature: function(feature, l) {
+                    l.bindTooltip(function() {
+                        var n = count(feature, current);
+                        var change = current ? n - count(feature, current - 1) : 0;
+                        return "<b>" + escapeHtml(feature.properties.lganame) + "</b><br>" + n + " stakeholders" +
+                               (change ? " (" + (change > 0 ? "+" : "") + change + ")" : "");
+                    }, {sticky: true});
+                }
+            });
+
+            var label = null;
+            function show(i) {
+                current = i;
+                layer.setStyle(style);
+                if (label) {
+                    label.innerHTML = escapeHtml(frames[i].label) + " &middot; " + frames[i].rows + " stakeholders";
+                }
+            }
+
+            var slider = L.control({position: "bottomleft"});
+            slider.onAdd = function() {
+                var div = L.DomUtil.create("div");
+                div.style.cssText = "background:white;padding:6px 8px;font:12px sans-serif;border-radius:4px;";
+                var play = L.DomUtil.create("button", "", div);
+                var input = L.DomUtil.create("input", "", div);
+                label = L.DomUtil.create("span", "", div);
+                input.type = "range";
+                input.min = 0;
+                input.max = frames.length - 1;
+                input.value = current;
+                input.style.verticalAlign = "middle";
+                play.textContent = "▶";
+
+                var timer = null;
+                function stop() {
+                    clearInterval(timer);
+                    timer = null;
+                    play.textContent = "▶";
+                }
+                input.addEventListener("input", function() { stop(); show(+input.value); });
+                play.addEventListener("click", function() {
+                    if (timer) { return stop(); }
+                    if (current === frames.length - 1) { show(0); }
+                    input.value = current;
+                    play.textContent = "❚❚";
+                    timer = setInterval(function() {
+                        if (current >= frames.length - 1) { return stop(); }
+                        show(current + 1);
+                        input.value = current;
+                    }, {{ this.interval }});
+                });
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                show(current);
+                return div;
+            };
+            layer.on("add", function() { slider.addTo(map); });
+            layer.on("remove", function() { slider.remove(); });
+            {%- if this.show %}
+            layer.addTo(map);
+            {%- endif %}
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, geojson, frames, name="Registry growth per LGA", colors=None, interval=800, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "TimelineLayer"
+        self.geojson = dump_payload(geojson)
+        self.frames = dump_payload(frames)
+        self.colors = json.dumps(colors or TIMELINE_COLORS)
+        self.interval = int(interval)
+
+
+def timeline_frames(store):
+    """One slider frame per snapshot version: label, row total and counts per LGA."""
+    return [{
+        "label": entry["label"] or f"v{entry['version']} {entry['time'][:10]}",
+        "rows": entry["rows"],
+        "counts": entry["lgas"],
+    } for entry in store.versions]
+
+
+def add_timeline_layer(m, store, boundaries="lga_boundaries.geojson", **kwargs):
+    """Add the registry-growth slider for ``store``; returns the layer (None without snapshots)."""
+    if not store.versions:
+        return None
+    layer = TimelineLayer(load_boundaries(boundaries, properties=LGA_COLUMNS), timeline_frames(store), **kwargs)
+    layer.add_to(m)
+    return layer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versioned snapshots of the stakeholder registry.")
+    parser.add_argument("--root", default=SNAPSHOT_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="record CSV files as new versions, in order")
+    ingest.add_argument("paths", nargs="*", default=["stakeholders.csv"])
+    ingest.add_argument("--label")
+    sub.add_parser("log", help="list the recorded versions")
+    diff = sub.add_parser("diff", help="stakeholders added, removed and changed between two versions")
+    diff.add_argument("old", type=int)
+    diff.add_argument("new", type=int, nargs="?")
+    timeline = sub.add_parser("timeline", help="write a map with the registry-growth slider")
+    timeline.add_argument("--out", default="registry_timeline.html")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.root)
+    if args.command == "ingest":
+        from dedupe import merge_entities, resolve_entities
+
+        for path in args.paths:
+            start = time.perf_counter()
+            entry = store.ingest(merge_entities(resolve_entities(load_stakeholders(path))),
+                                 label=args.label, source=path)
+            print(f"{path}: v{entry['version']} (+{entry['added']} -{entry['removed']} ~{entry['changed']}, "
+                  f"{entry['rows']} rows) in {(time.perf_counter() - start) * 1000:.0f} ms")
+    elif args.command == "log":
+        for entry in store.versions:
+            print(f"v{entry['version']:<4} {entry['time']}  {entry['rows']:>8} rows  +{entry['added']} "
+                  f"-{entry['removed']} ~{entry['changed']}{'  keyframe' if entry['keyframe'] else ''}  "
+                  f"{entry['label'] or entry['source'] or ''}")
+    elif args.command == "diff":
+        added, removed, changed = store.diff(args.old, args.new)
+        for title, keys in (("added", added), ("removed", removed), ("changed", changed)):
+            print(f"{title} ({len(keys)}): {', '.join(keys)}")
+    else:
+        m = folium.Map(location=[10.5, 7.5], zoom_start=7, tiles="cartodb positron")
+        add_timeline_layer(m, store)
+        folium.LayerControl().add_to(m)
+        m.save(args.out)
+        print(f"Timeline of {len(store.versions)} versions saved to {args.out}")
@@ -0,0 +1,136 @@
+import argparse
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+
+from boundaries import load_boundaries
+from boundary_store import read_boundaries
+from search_index import split_commodities
+
+LGA_COLUMNS = ["lganame", "lgacode"]
+
+
+def assign_lgas(df, lgas, state=None, batch_size=500_000):
+    """Attach the containing LGA to every stakeholder (bulk STRtree join).
+
+    Each batch of points goes into an STRtree that is queried with every
+    LGA polygon at once: a polygon only meets the points inside its box, and
+    shapely prepares each polygon once per batch instead of once per point.
+    Adds ``lganame``/``lgacode`` (empty when no LGA contains the point)
+    and ``in_state`` (inside ``state`` geometry, or inside any LGA).
+    """
+    lat = pd.to_numeric(df["Latitude"], errors="coerce").to_numpy(dtype=float)
+    lng = pd.to_numeric(df["Longitude"], errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(lat) & np.isfinite(lng)
+
+    geometries = np.asarray(lgas.geometry.values)
+    match = np.full(len(df), -1, dtype=np.int64)
+
+    positions = np.flatnonzero(valid)
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        tree = shapely.STRtree(shapely.points(lng[batch], lat[batch]))
+        lga_idx, point_idx = tree.query(geometries, predicate="contains")
+        # A point on a shared edge can fall in two LGAs; keep the first
+        point_idx, first = np.unique(point_idx, return_index=True)
+        match[batch[point_idx]] = lga_idx[first]
+
+    out = df.copy()
+    found = match >= 0
+    for col in LGA_COLUMNS:
+        values = lgas[col].astype(str).to_numpy()
+        column = np.full(len(df), "", dtype=object)
+        column[found] = values[match[found]]
+        out[col] = column
+
+    if state is None:
+        out["in_state"] = found
+    else:
+        state_geometry = shapely.union_all(np.asarray(state.geometry.values))
+        shapely.prepare(state_geometry)
+        inside = np.zeros(len(df), dtype=bool)
+        inside[valid] = shapely.contains_xy(state_geometry, lng[valid], lat[valid])
+        out["in_state"] = inside
+    return out
+
+
+def lga_aggregates(df, by="Category"):
+    """Per-LGA stakeholder counts, total plus one column per Category/Commodity value.
+
+    Commodity is free text, so rows are split into one value per commodity
+    before counting ("Maize & Cowpea" counts for both).
+    """
+    joined = df[df["lgacode"] != ""]
+    if by == "Commodity":
+        values = split_commodities(joined["Commodity"]).str.title()
+    else:
+        values = joined[by].fillna("").astype(str).str.strip()
+    keys = pd.DataFrame({"lgacode": joined.loc[values.index, "lgacode"].to_numpy(), "value": values.to_numpy()})
+
+    # Every LGA with stakeholders keeps its row, even when none of them has a value to count
+    totals = joined.groupby("lgacode").size()
+    table = pd.crosstab(keys["lgacode"], keys["value"]).reindex(totals.index, fill_value=0)
+    table.insert(0, "total", totals)
+    names = joined.drop_duplicates("lgacode").set_index("lgacode")["lganame"]
+    table.insert(0, "lganame", names)
+    return table.reset_index()
+
+
+def add_lga_choropleth(m, aggregates, column="total", boundaries="lga_boundaries.geojson",
+                       name="Stakeholders per LGA", fill_color="YlGn"):
+    """Choropleth of an aggregate column, with all counts in the LGA tooltip."""
+    geojson = load_boundaries(boundaries, properties=LGA_COLUMNS)
+    by_code = aggregates.set_index("lgacode")
+    count_columns = [col for col in aggregates.columns if col not in LGA_COLUMNS]
+
+    # Copy the counts into each feature so the tooltip can show them
+    features = []
+    for feature in geojson["features"]:
+        props = dict(feature["properties"])
+        code = str(props.get("lgacode"))
+        for col in count_columns:
+            props[col] = int(by_code.at[code, col]) if code in by_code.index else 0
+        features.append(dict(feature, properties=props))
+    geojson = dict(geojson, features=features)
+
+    data = pd.DataFrame({
+        "lgacode": [f["properties"]["lgacode"] for f in features],
+        column: [f["properties"][column] for f in features],
+    })
+    choropleth = folium.Choropleth(
+        geo_data=geojson,
+        data=data,
+        columns=["lgacode", column],
+        key_on="feature.properties.lgacode",
+        fill_color=fill_color,
+        fill_opacity=0.6,
+        line_opacity=0.4,
+        name=name,
+        legend_name=f"{column} per LGA",
+    ).add_to(m)
+    folium.GeoJsonTooltip(
+        fields=["lganame"] + count_columns,
+        aliases=["LGA"] + count_columns,
+    ).add_to(choropleth.geojson)
+    return choropleth
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign stakeholders to LGAs and print per-LGA counts.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--by", default="Category", choices=["Category", "Commodity"])
+    parser.add_argument("--out", help="write the per-LGA table to this CSV")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    joined = assign_lgas(df, read_boundaries("lga_boundaries.geojson"), read_boundaries("kaduna.geojson"))
+    outside = joined.loc[~joined["in_state"], "Company Name"].tolist()
+    table = lga_aggregates(joined, args.by)
+
+    print(table.to_string(index=False))
+    if outside:
+        print(f"\nOutside Kaduna or without coordinates: {', '.join(map(str, outside))}")
+    if args.out:
+        table.to_csv(args.out, index=False)
@@ -0,0 +1,282 @@
+import argparse
+import base64
+import json
+import os
+import re
+import struct
+import zlib
+
+import folium
+import numpy as np
+from jinja2 import Template
+
+from cache import file_hash, options_key, stats, write_atomic
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; the built-in reader handles 8-bit PNGs
+    Image = None
+
+SPRITES_PATH = "img/sprites.png"
+ICON_SIZE = 30
+# Atlas pixels per CSS pixel, so icons stay sharp on high-DPI screens
+PIXEL_RATIO = 2
+CLASS_PREFIX = "stakeholder-icon"
+# Bump when the atlas layout or resampling changes
+SPRITES_VERSION = 1
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _unfilter_sequential(kind, row, up, channels):
+    # The left neighbour of the first pixel is 0, so that pixel is plain Up (Paeth)
+    # or half of Up (Average)
+    for x in range(channels):
+        row[x] = (row[x] + (up[x] if kind == 4 else up[x] >> 1)) & 0xFF
+    if kind == 3:
+        for x in range(channels, len(row)):
+            row[x] = (row[x] + ((row[x - channels] + up[x]) >> 1)) & 0xFF
+    else:
+        for x in range(channels, len(row)):
+            a, b, c = row[x - channels], up[x], up[x - channels]
+            pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - c - c)
+            row[x] = (row[x] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    return np.array(row, dtype=np.uint8)
+
+
+def read_png(path):
+    """RGBA uint8 array (height, width, 4) of an image file.
+
+    Uses Pillow when installed; otherwise reads non-interlaced 8-bit PNGs
+    (grey, RGB, palette, grey+alpha, RGBA) with zlib and numpy.
+    """
+    if Image is not None:
+        with Image.open(path) as image:
+            return np.asarray(image.convert("RGBA"))
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{path}: not a PNG file")
+
+    pos, idat, palette, transparency = 8, [], None, None
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b"IHDR":
+            width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, 3)
+        elif kind == b"tRNS":
+            transparency = np.frombuffer(chunk, dtype=np.uint8)
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color)
+    if depth != 8 or interlace or channels is None:
+        raise ValueError(f"{path}: only 8-bit non-interlaced PNGs are supported without Pillow")
+
+    stride = width * channels
+    raw = zlib.decompress(b"".join(idat))
+    rows = np.zeros((height, stride), dtype=np.uint8)
+    previous = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        start = y * (stride + 1)
+        kind, line = raw[start], np.frombuffer(raw, dtype=np.uint8, count=stride, offset=start + 1)
+        if kind == 0:
+            row = line.copy()
+        elif kind == 1:
+            row = (np.cumsum(line.reshape(width, channels), axis=0, dtype=np.uint64) % 256).ravel()
+            row = row.astype(np.uint8)
+        elif kind == 2:
+            row = line + previous
+        else:
+            # Average and Paeth depend on the byte just decoded, so they run per byte
+            row = _unfilter_sequential(kind, line.tolist(), previous.tolist(), channels)
+        rows[y] = previous = row
+
+    pixels = rows.reshape(height, width, channels)
+    if color == 3:
+        alpha = np.full(len(palette), 255, dtype=np.uint8)
+        if transparency is not None:
+            alpha[:len(transparency)] = transparency
+        return np.dstack([palette[pixels[..., 0]], alpha[pixels[..., 0]]])
+    if color in (0, 4):
+        grey = pixels[..., :1].repeat(3, axis=2)
+        alpha = pixels[..., 1:] if color == 4 else np.full_like(pixels[..., :1], 255)
+        return np.dstack([grey, alpha])
+    if color == 2:
+        return np.dstack([pixels, np.full_like(pixels[..., :1], 255)])
+    return pixels
+
+
+def encode_png(rgba):
+    """PNG bytes of an RGBA uint8 array."""
+    height, width, _ = rgba.shape
+    # Up filter: icon rows repeat a lot, so row differences compress well
+    data = np.ascontiguousarray(rgba, dtype=np.uint8).reshape(height, width * 4)
+    filtered = np.vstack([data[:1], data[1:] - data[:-1]])
+    raw = np.hstack([np.full((height, 1), 2, dtype=np.uint8), filtered]).tobytes()
+
+    def chunk(kind, payload):
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+
+def _area_weights(n_in, n_out):
+    # Row i averages the input pixels overlapping [i, i + 1) * n_in / n_out
+    edges = np.linspace(0, n_in, n_out + 1)
+    j = np.arange(n_in)
+    overlap = np.minimum(j + 1, edges[1:, None]) - np.maximum(j, edges[:-1, None])
+    return np.clip(overlap, 0, None) / np.diff(edges)[:, None]
+
+
+def resize(rgba, width, height):
+    """Area-averaged downscale (alpha-premultiplied so edges do not darken)."""
+    pixels = rgba.astype(np.float64) / 255
+    pixels[..., :3] *= pixels[..., 3:]
+    out = np.einsum("ij,jkc,lk->ilc", _area_weights(rgba.shape[0], height), pixels,
+                    _area_weights(rgba.shape[1], width), optimize=True)
+    alpha = out[..., 3:]
+    out[..., :3] = np.divide(out[..., :3], alpha, out=np.zeros_like(out[..., :3]), where=alpha > 0)
+    return np.clip(np.rint(out * 255), 0, 255).astype(np.uint8)
+
+
+def fit(rgba, size):
+    """Scale an icon to fit a ``size`` square, centered on transparency."""
+    height, width, _ = rgba.shape
+    scale = size / max(height, width)
+    w, h = max(1, round(width * scale)), max(1, round(height * scale))
+    cell = np.zeros((size, size, 4), dtype=np.uint8)
+    top, left = (size - h) // 2, (size - w) // 2
+    cell[top:top + h, left:left + w] = resize(rgba, w, h)
+    return cell
+
+
+def default_glyph(size, fill=(51, 136, 255), border=(255, 255, 255)):
+    """Round marker for categories without an icon file (replaces the CDN default)."""
+    y, x = np.mgrid[:size, :size] + 0.5
+    distance = np.hypot(x - size / 2, y - size / 2)
+    outer, inner = size * 0.42, size * 0.32
+    alpha = np.clip(outer - distance + 0.5, 0, 1)
+    core = np.clip(inner - distance + 0.5, 0, 1)[..., None]
+    rgb = core * np.array(fill) + (1 - core) * np.array(border)
+    return np.dstack([rgb, alpha * 255]).round().astype(np.uint8)
+
+
+def slugify(text):
+    return re.sub(r"[^0-9a-z]+", "-", str(text).lower()).strip("-") or "icon"
+
+
+def build_sprites(icon_mapping, out_path=SPRITES_PATH, size=ICON_SIZE, pixel_ratio=PIXEL_RATIO):
+    """Pack the category icons into one PNG strip; returns the atlas description.
+
+    Icons are downscaled to ``size`` CSS pixels (times ``pixel_ratio``).
+    Categories whose icon is not a local file (e.g. a CDN URL) use the
+    default glyph. The atlas is rebuilt only when an icon or option
+    changes; its description is kept next to it as JSON.
+    """
+    files = {category: path for category, path in icon_mapping.items() if os.path.isfile(path)}
+    key = options_key(files={category: file_hash(path) for category, path in files.items()},
+                      size=size, pixel_ratio=pixel_ratio, version=SPRITES_VERSION)
+    meta_path = os.path.splitext(out_path)[0] + ".json"
+    if os.path.exists(out_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            atlas = json.load(f)
+        if atlas.get("key") == key:
+            stats["sprites:hit"] += 1
+            return atlas
+    stats["sprites:miss"] += 1
+
+    cell = size * pixel_ratio
+    # One cell per distinct file, so categories sharing an icon share pixels
+    paths = sorted(set(files.values()))
+    cells = [default_glyph(cell)] + [fit(read_png(path), cell) for path in paths]
+    offsets = {path: (i + 1) * size for i, path in enumerate(paths)}
+    write_atomic(out_path, encode_png(np.hstack(cells)))
+
+    atlas = {
+        "key": key,
+        "url": out_path.replace(os.sep, "/"),
+        "size": size,
+        "width": size * len(cells),
+        "height": size,
+        "offsets": {category: offsets.get(files.get(category), 0) for category in icon_mapping},
+        "classes": {category: f"{CLASS_PREFIX} {CLASS_PREFIX}-{slugify(category)}" for category in icon_mapping},
+        "default": f"{CLASS_PREFIX} {CLASS_PREFIX}-default",
+    }
+    write_atomic(meta_path, json.dumps(atlas, indent=1).encode("utf-8"))
+    return atlas
+
+
+def sprite_css(atlas, inline=False, url=None):
+    """CSS rules for the atlas classes; ``inline`` embeds the PNG as a data URI."""
+    if inline:
+        with open(atlas["url"], "rb") as f:
+            url = "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+    rules = [
+        f".{CLASS_PREFIX}{{background:url({url or atlas['url']}) no-repeat;"
+        f"background-size:{atlas['width']}px {atlas['height']}px;}}",
+        f".{CLASS_PREFIX}-default{{background-position:0 0;}}",
+    ]
+    for category, offset in atlas["offsets"].items():
+        rules.append(f".{CLASS_PREFIX}-{slugify(category)}{{background-position:-{offset}px 0;}}")
+    return "\n".join(rules)
+
+
+def sprite_classes(atlas):
+    """The part of the atlas marker layers need: class names per category and the icon size."""
+    return {"classes": atlas["classes"], "default": atlas["default"], "size": atlas["size"]}
+
+
+class SpriteStyles(folium.MacroElement):
+    """Adds the atlas CSS to the page header once."""
+
+    _template = Template("""
+        {% macro header(this, kwargs) %}
+        <style>
+        {{ this.css }}
+        </style>
+        {% endmacro %}
+    """)
+
+    def __init__(self, css):
+        super().__init__()
+        self._name = "SpriteStyles"
+        self.css = css
+
+
+def add_sprite_icons(m, icon_mapping, inline=False, out_path=SPRITES_PATH, url=None, **kwargs):
+    """Build the atlas and add its CSS to the map; returns ``sprite_classes`` for marker layers.
+
+    ``url`` overrides the atlas URL in the CSS (for pages saved in another
+    directory); ``inline`` makes the page self-contained instead.
+    """
+    atlas = build_sprites(icon_mapping, out_path, **kwargs)
+    SpriteStyles(sprite_css(atlas, inline, url)).add_to(m)
+    return sprite_classes(atlas)
+
+
+def sprite_icon(sprites, category):
+    """A folium icon drawn from the atlas, for per-row ``folium.Marker`` loops."""
+    size = sprites["size"]
+    return folium.DivIcon(class_name=sprites["classes"].get(category, sprites["default"]),
+                          icon_size=(size, size), html="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the category icons into a sprite atlas.")
+    parser.add_argument("--out", default=SPRITES_PATH)
+    parser.add_argument("--size", type=int, default=ICON_SIZE, help="icon size in CSS pixels")
+    parser.add_argument("--pixel-ratio", type=int, default=PIXEL_RATIO)
+    args = parser.parse_args()
+
+    from pipeline import ICON_MAPPING
+
+    build_sprites(ICON_MAPPING, args.out, args.size, args.pixel_ratio)
+    before = sum(os.path.getsize(path) for path in set(ICON_MAPPING.values()) if os.path.isfile(path))
+    print(f"{args.out}: {len(ICON_MAPPING)} icons, {os.path.getsize(args.out) / 1024:.1f} KB "
+          f"(sources {before / 1024:.1f} KB)")
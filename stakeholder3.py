@@ -1,27 +1,53 @@
 import folium
 import pandas as pd
-import geopandas as gpd
 from folium.plugins import MousePosition
+from loader import ENTITY_COLUMN, load_stakeholders
+from dedupe import merge_entities, resolve_entities
+from geocode import geocode_missing
+from boundary_store import read_boundaries
+from canvas_layer import add_canvas_markers, resolve_marker_mode
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Marker mode: "folium" builds one Marker per row, "canvas" draws every point
+# as a circle on one canvas (colored by category, popups hit-tested on click),
+# "auto" switches to "canvas" above CANVAS_THRESHOLD rows
+MARKER_MODE = "auto"
+CANVAS_THRESHOLD = 5000
+
+# Popup fields for the canvas layer (same as the marker popups)
+CANVAS_FIELDS = [
+    ("Company", "Company Name"),
+    ("Category", "Category"),
+    ("Commodity", "Commodity"),
+    ("Address", "Office Address"),
+    ("Contact", "Contact Person"),
+    ("Designation", "Designation"),
+    ("Phone", "Phone number"),
+    ("Email", "Email/Website"),
+]
+
 # Load Stakeholders Data
-df = pd.read_csv("stakeholders.csv")
+df = load_stakeholders("stakeholders.csv", drop_invalid=False)
+
+# One row per company: rows that are the same company under variant names,
+# phones or emails are merged and keyed by their canonical entity_id
+df = merge_entities(resolve_entities(df))
+
+# Rows without coordinates are placed from their Office Address when it names
+# an LGA (marked in the "Geocoded" column); the rest stay off the map
+df = geocode_missing(df, drop_unresolved=False)
+marker_mode = resolve_marker_mode(MARKER_MODE, df["Latitude"].notna().sum(), "folium", CANVAS_THRESHOLD)
 
 # Initialize the map centered in Nigeria
-m = folium.Map(location=[10.5, 7.5], zoom_start=6, tiles="cartodb positron")
+m = folium.Map(location=[10.5, 7.5], zoom_start=6, tiles="cartodb positron", prefer_canvas=marker_mode == "canvas")
 
-# Load GeoJSON for States and LGAs
+# Load State and LGA boundaries (binary store, attributes already JSON-safe)
 try:
-    states_gdf = gpd.read_file("kaduna.geojson")
-    lgas_gdf = gpd.read_file("lga_boundaries.geojson")
-
-    # Convert any Timestamp columns to string to avoid JSON errors
-    for col in lgas_gdf.columns:
-        if lgas_gdf[col].dtype == "datetime64[ns]":
-            lgas_gdf[col] = lgas_gdf[col].astype(str)
+    states_gdf = read_boundaries("kaduna.geojson")
+    lgas_gdf = read_boundaries("lga_boundaries.geojson")
 
     # Add State Boundaries
     folium.GeoJson(
@@ -48,33 +74,44 @@ try:
 except Exception as e:
     logging.error(f"Error loading boundaries: {e}")
 
-# Feature Group for Stakeholder Locations
-stakeholder_layer = folium.FeatureGroup(name="Stakeholders").add_to(m)
-
 # Add Markers for Companies
-company_locations = {}  # Store locations for JavaScript zoom function
-
-for _, row in df.iterrows():
-    if pd.notnull(row["Latitude"]) and pd.notnull(row["Longitude"]):
-        popup_content = f"""
-        <b>{row['Company Name']}</b><br>
-        <b>Category:</b> {row['Category']}<br>
-        <b>Commodity:</b> {row['Commodity']}<br>
-        <b>Address:</b> {row['Office Address']}<br>
-        <b>Contact:</b> {row['Contact Person']} ({row['Designation']})<br>
-        <b>Phone:</b> {row['Phone number']}<br>
-        <b>Email:</b> {row['Email/Website']}<br>
-        """
-
-        location = [row["Latitude"], row["Longitude"]]
-        company_locations[row["Company Name"]] = location  # Store for search dropdown
-
-        folium.Marker(
-            location=location,
-            popup=folium.Popup(popup_content, max_width=300),
-            tooltip=row["Company Name"],
-            icon=folium.Icon(color="blue", icon="info-sign"),
-        ).add_to(stakeholder_layer)
+company_locations = {}  # Store locations for JavaScript zoom function, by entity_id
+company_names = {}  # Dropdown labels, by entity_id
+
+if marker_mode == "canvas":
+    # One canvas layer (named "Stakeholders") instead of a DOM marker per row
+    located = df[df["Latitude"].notnull() & df["Longitude"].notnull()]
+    fields = [(label, col) for label, col in CANVAS_FIELDS if col in located.columns]
+    add_canvas_markers(m, located, name="Stakeholders", fields=fields)
+    company_locations = dict(zip(located[ENTITY_COLUMN],
+                                 located[["Latitude", "Longitude"]].astype(float).values.tolist()))
+    company_names = dict(zip(located[ENTITY_COLUMN], located["Company Name"]))
+else:
+    # Feature Group for Stakeholder Locations
+    stakeholder_layer = folium.FeatureGroup(name="Stakeholders").add_to(m)
+
+    for _, row in df.iterrows():
+        if pd.notnull(row["Latitude"]) and pd.notnull(row["Longitude"]):
+            popup_content = f"""
+            <b>{row['Company Name']}</b><br>
+            <b>Category:</b> {row['Category']}<br>
+            <b>Commodity:</b> {row['Commodity']}<br>
+            <b>Address:</b> {row['Office Address']}<br>
+            <b>Contact:</b> {row['Contact Person']} ({row['Designation']})<br>
+            <b>Phone:</b> {row['Phone number']}<br>
+            <b>Email:</b> {row['Email/Website']}<br>
+            """
+
+            location = [row["Latitude"], row["Longitude"]]
+            company_locations[row[ENTITY_COLUMN]] = location  # Store for search dropdown
+            company_names[row[ENTITY_COLUMN]] = row["Company Name"]
+
+            folium.Marker(
+                location=location,
+                popup=folium.Popup(popup_content, max_width=300),
+                tooltip=row["Company Name"],
+                icon=folium.Icon(color="blue", icon="info-sign"),
+            ).add_to(stakeholder_layer)
 
 # JavaScript for Dropdown Search and Zoom
 search_script = f"""
@@ -100,8 +137,8 @@ search_dropdown_html = """
         <option value="">-- Select Company --</option>
 """
 
-for company in company_locations.keys():
-    search_dropdown_html += f'<option value="{company}">{company}</option>'
+for entity, company in company_names.items():
+    search_dropdown_html += f'<option value="{entity}">{company}</option>'
 
 search_dropdown_html += """
     </select>
@@ -1,21 +1,67 @@
-import pandas as pd
 import folium
 from folium.plugins import MarkerCluster, HeatMap
-import json
-
-# Load dataset
-df = pd.read_csv("stakeholders.csv").fillna("")
-
-# Convert Latitude & Longitude to numeric
-df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
-df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
-
-# Drop rows with missing coordinates
-df = df.dropna(subset=["Latitude", "Longitude"])
+from marker_layer import add_columnar_markers, dump_payload
+from heat_raster import add_heat_raster
+from search_index import add_search_box
+from clustering import add_server_clusters
+from boundaries import load_boundaries
+from loader import load_stakeholders
+from dedupe import merge_entities, resolve_entities
+from geocode import geocode_missing
+from cache import stats_summary as cache_stats_summary
+from sprites import add_sprite_icons, sprite_icon
+from canvas_layer import add_canvas_markers, resolve_marker_mode
+from snapshots import SnapshotStore, add_timeline_layer
+from publish import ASSETS_DIR, save_map
+
+# Marker mode: "folium" builds one Marker per row, "columnar" ships a single
+# columnar payload and templates popups in the browser (use for large registries),
+# "clusters" ships clusters precomputed per zoom instead of using MarkerCluster,
+# "canvas" draws every point as a circle on one canvas (colored by category),
+# "auto" uses "columnar" up to CANVAS_THRESHOLD rows and "canvas" above
+MARKER_MODE = "auto"
+CANVAS_THRESHOLD = 5000
+
+# Popup details (columnar/canvas modes): "inline" embeds every field in the page,
+# "sidecar" keeps only name and category and loads the rest from details/
+# when a popup is first opened
+DETAILS_MODE = "sidecar"
+
+# Heat mode: "points" ships every coordinate to Leaflet.heat, "raster" ships
+# density images precomputed per zoom band (fixed cost whatever the row count)
+HEAT_MODE = "raster"
+
+# Search mode: "index" or "inline" (see the search section below)
+SEARCH_MODE = "index"
+
+# Icon mode: "sprites" packs the category icons into one small atlas
+# (img/sprites.png) and markers share one CSS class per category, "files"
+# points every marker at the full-size PNG
+ICON_MODE = "sprites"
+
+# Snapshots: record each new version of the registry in snapshots/ (only the
+# rows that changed) and add a time slider of stakeholders per LGA
+SNAPSHOTS = True
+
+# Output mode: "inline" saves one self-contained page, "external" saves a small
+# HTML shell plus content-hashed, precompressed data files in assets/ that
+# browsers keep across rebuilds (only changed payloads get new names)
+OUTPUT_MODE = "external"
+
+# Load dataset (typed, cleaned and cached; rows without coordinates are kept for geocoding)
+df = load_stakeholders("stakeholders.csv", drop_invalid=False)
+
+# One row per company (variant names, phones and emails merged under entity_id)
+df = merge_entities(resolve_entities(df))
+
+# Rows still without coordinates are placed from their Office Address (LGA
+# gazetteer, cached in .cache/geocode); rows that cannot be placed are dropped
+df = geocode_missing(df)
 
 # Center map on dataset average location
 map_center = [df["Latitude"].mean(), df["Longitude"].mean()]
-m = folium.Map(location=map_center, zoom_start=6)
+marker_mode = resolve_marker_mode(MARKER_MODE, len(df), "columnar", CANVAS_THRESHOLD)
+m = folium.Map(location=map_center, zoom_start=6, prefer_canvas=marker_mode == "canvas")
 
 # Category Icons
 icon_mapping = {
@@ -25,185 +71,163 @@ icon_mapping = {
     "Processors": "img/proces.png",
     "Fertilizer Company": "img/fert.png",
 }
+sprites = add_sprite_icons(m, icon_mapping) if ICON_MODE == "sprites" else None
 
-# Marker Cluster
-marker_cluster = MarkerCluster().add_to(m)
+# Marker Cluster (clustered in the browser unless precomputed in Python)
+if marker_mode not in ("clusters", "canvas"):
+    marker_cluster = MarkerCluster().add_to(m)
 
 # Store marker details for JavaScript
 marker_data = []
 
 # Add markers
-for _, row in df.iterrows():
-    icon_url = icon_mapping.get(row["Category"], "https://cdn-icons-png.flaticon.com/512/684/684908.png")
-
-    popup_content = f"""
-    <b>Company:</b> {row['Company Name']}<br>
-    <b>Category:</b> {row['Category']}<br>
-    <b>Commodity:</b> {row['Commodity']}<br>
-    <b>Office Address:</b> {row['Office Address']}<br>
-    <b>Contact Person:</b> {row['Contact Person']}<br>
-    <b>Phone:</b> {row['Phone number']}<br>
-    <b>Designation:</b> {row['Designation']}<br>
-    <b>Email/Website:</b> {row['Email/Website']}
-    """
-
-    marker = folium.Marker(
-        location=[row["Latitude"], row["Longitude"]],
-        icon=folium.CustomIcon(icon_url, icon_size=(30, 30)),
-        popup=folium.Popup(popup_content, max_width=300),
-        tooltip=row["Company Name"]
-    )
-    marker_cluster.add_child(marker)
-
-    # Store marker details
-    marker_data.append({
-        "name": row["Company Name"],
-        "lat": row["Latitude"],
-        "lng": row["Longitude"],
-        "popup": popup_content
-    })
+if marker_mode == "clusters":
+    marker_layer = add_server_clusters(m, df, icon_mapping=icon_mapping, sprites=sprites)
+    marker_source = f"{marker_layer.get_name()}.records()"
+elif marker_mode == "columnar":
+    details_dir = "details" if DETAILS_MODE == "sidecar" else None
+    marker_layer = add_columnar_markers(m, df, target=marker_cluster, icon_mapping=icon_mapping,
+                                        details_dir=details_dir, sprites=sprites)
+    marker_source = f"{marker_layer.get_name()}.records()"
+elif marker_mode == "canvas":
+    details_dir = "details" if DETAILS_MODE == "sidecar" else None
+    marker_layer = add_canvas_markers(m, df, details_dir=details_dir)
+    marker_source = f"{marker_layer.get_name()}.records()"
+else:
+    for _, row in df.iterrows():
+        icon_url = icon_mapping.get(row["Category"], "https://cdn-icons-png.flaticon.com/512/684/684908.png")
+
+        popup_content = f"""
+        <b>Company:</b> {row['Company Name']}<br>
+        <b>Category:</b> {row['Category']}<br>
+        <b>Commodity:</b> {row['Commodity']}<br>
+        <b>Office Address:</b> {row['Office Address']}<br>
+        <b>Contact Person:</b> {row['Contact Person']}<br>
+        <b>Phone:</b> {row['Phone number']}<br>
+        <b>Designation:</b> {row['Designation']}<br>
+        <b>Email/Website:</b> {row['Email/Website']}
+        """
+
+        marker = folium.Marker(
+            location=[row["Latitude"], row["Longitude"]],
+            icon=sprite_icon(sprites, row["Category"]) if sprites else folium.CustomIcon(icon_url, icon_size=(30, 30)),
+            popup=folium.Popup(popup_content, max_width=300),
+            tooltip=row["Company Name"]
+        )
+        marker_cluster.add_child(marker)
+
+        # Store marker details
+        marker_data.append({
+            "name": row["Company Name"],
+            "lat": row["Latitude"],
+            "lng": row["Longitude"],
+            "popup": popup_content
+        })
 
 # Add Heatmap
-heat_data = df[["Latitude", "Longitude"]].values.tolist()
-HeatMap(heat_data, radius=10).add_to(m)
+if HEAT_MODE == "raster":
+    add_heat_raster(m, df, radius=10)
+else:
+    heat_data = df[["Latitude", "Longitude"]].values.tolist()
+    HeatMap(heat_data, radius=10).add_to(m)
 
-# Load and add Kaduna State boundary
-with open("kaduna.geojson") as f:
-    folium.GeoJson(json.load(f), name="Kaduna State Boundary").add_to(m)
+# Load and add Kaduna State boundary (simplified + quantized, cached in .cache/)
+folium.GeoJson(load_boundaries("kaduna.geojson"), name="Kaduna State Boundary").add_to(m)
 
 # Load and add LGA boundaries
-with open("lga_boundaries.geojson") as f:
-    folium.GeoJson(json.load(f), name="LGA Boundaries").add_to(m)
+folium.GeoJson(
+    load_boundaries("lga_boundaries.geojson", properties=["lganame", "lgacode", "statename"]),
+    name="LGA Boundaries",
+).add_to(m)
+
+# Registry growth per LGA across the recorded versions (toggle in the layer control)
+if SNAPSHOTS:
+    snapshots = SnapshotStore()
+    snapshots.ingest(df, source="stakeholders.csv")
+    add_timeline_layer(m, snapshots, show=False)
 
 # Layer Control
 folium.LayerControl().add_to(m)
 
-# Convert marker data to JSON for JavaScript
-marker_json = json.dumps(marker_data)
-
-# JavaScript for Search & Zoom
-search_html = f"""
-<input type="text" id="search-box" placeholder="Search for a company..." 
-       style="position: fixed; top: 10px; left: 10px; z-index: 1000; width: 300px; padding: 5px;">
-
-<ul id="suggestions" 
-    style="position: fixed; top: 40px; left: 10px; z-index: 1000; width: 300px; background: white; 
-           list-style-type: none; padding: 0; margin: 0; border: 1px solid #ccc;"></ul>
-
-<script>
-    var markerData = {marker_json};  
-    var searchBox = document.getElementById('search-box');
-    var suggestions = document.getElementById('suggestions');
+# Search: "index" ships a prebuilt, sharded prefix/trigram index (search/),
+# "inline" embeds every record and filters it on each keystroke
+if SEARCH_MODE == "index":
+    add_search_box(m, df)
+else:
+    # Convert marker data to JSON for JavaScript
+    if marker_mode == "folium":
+        marker_source = dump_payload(marker_data)
+
+    # JavaScript for Search & Zoom
+    search_html = f"""
+    <input type="text" id="search-box" placeholder="Search for a company..." 
+           style="position: fixed; top: 10px; left: 10px; z-index: 1000; width: 300px; padding: 5px;">
+
+    <ul id="suggestions" 
+        style="position: fixed; top: 40px; left: 10px; z-index: 1000; width: 300px; background: white; 
+               list-style-type: none; padding: 0; margin: 0; border: 1px solid #ccc;"></ul>
+
+    <script>
+        var markerData = null;
+        function getMarkerData() {{
+            // Resolved lazily: the columnar layer is built after this script runs
+            if (markerData === null) {{
+                markerData = {marker_source};
+            }}
+            return markerData;
+        }}
+        var searchBox = document.getElementById('search-box');
+        var suggestions = document.getElementById('suggestions');
     
-    // Ensure we have access to the Leaflet map
-    var mapInstance = null;
-    function initializeMap() {{
-        mapInstance = window.L.map(document.getElementsByClassName('folium-map')[0]);
-    }}
+        // Ensure we have access to the Leaflet map
+        var mapInstance = null;
+        function initializeMap() {{
+            mapInstance = window.L.map(document.getElementsByClassName('folium-map')[0]);
+        }}
     
-    document.addEventListener("DOMContentLoaded", initializeMap);
-
-    searchBox.addEventListener('input', function() {{
-        var input = searchBox.value.toLowerCase();
-        suggestions.innerHTML = '';
-
-        if (input.length > 0) {{
-            var filtered = markerData.filter(m => m.name.toLowerCase().includes(input));
-            filtered.forEach(company => {{
-                var li = document.createElement('li');
-                li.textContent = company.name;
-                li.style.padding = '5px';
-                li.style.cursor = 'pointer';
+        document.addEventListener("DOMContentLoaded", initializeMap);
+
+        searchBox.addEventListener('input', function() {{
+            var input = searchBox.value.toLowerCase();
+            suggestions.innerHTML = '';
+
+            if (input.length > 0) {{
+                var filtered = getMarkerData().filter(m => m.name.toLowerCase().includes(input));
+                filtered.forEach(company => {{
+                    var li = document.createElement('li');
+                    li.textContent = company.name;
+                    li.style.padding = '5px';
+                    li.style.cursor = 'pointer';
                 
-                li.addEventListener('click', function() {{
-                    searchBox.value = company.name;
-                    suggestions.innerHTML = '';
-
-                    if (mapInstance) {{
-                        mapInstance.flyTo([company.lat, company.lng], 13);  
-
-                        L.popup()
-                            .setLatLng([company.lat, company.lng])
-                            .setContent(company.popup)
-                            .openOn(mapInstance);
-                    }} else {{
-                        console.error("Map instance not initialized!");
-                    }}
+                    li.addEventListener('click', function() {{
+                        searchBox.value = company.name;
+                        suggestions.innerHTML = '';
+
+                        if (mapInstance) {{
+                            mapInstance.flyTo([company.lat, company.lng], 13);  
+
+                            L.popup()
+                                .setLatLng([company.lat, company.lng])
+                                .setContent(company.popup)
+                                .openOn(mapInstance);
+                        }} else {{
+                            console.error("Map instance not initialized!");
+                        }}
+                    }});
+
+                    suggestions.appendChild(li);
                 }});
-
-                suggestions.appendChild(li);
-            }});
-        }}
-    }});
-</script>
-"""
-
-m.get_root().html.add_child(folium.Element(search_html))
-
-# Save map
-m.save("stakeholders_map.html")
-print("Map saved successfully! Open 'stakeholders_map.html' in your browser.")
-
-# Create a dictionary mapping company names to their coordinates
-company_coordinates = df.set_index('Company Name')[['Latitude', 'Longitude']].T.to_dict('list')
-
-# Convert the dictionary to a JavaScript object
-company_coordinates_js = str(company_coordinates).replace("'", '"')
-
-# Add the search functionality
-search_html = f"""
-<script>
-    document.addEventListener('DOMContentLoaded', function() {{
-        var searchInput = document.getElementById('search-input');
-        var searchButton = document.getElementById('search-button');
-        var map = L.map('map').setView([51.505, -0.09], 13);
-
-        // Add a tile layer
-        L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-            attribution: 'Map data &copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
-            maxZoom: 18
-        }}).addTo(map);
-
-        // Add a marker
-        var marker = L.marker([51.5, -0.09]).addTo(map)
-            .bindPopup('<b>Hello world!</b><br />I am a popup.').openPopup();
-
-        // Add a circle
-        var circle = L.circle([51.508, -0.11], {{
-            color: 'red',
-            fillColor: '#f03',
-            fillOpacity: 0.5,
-            radius: 500
-        }}).addTo(map).bindPopup('I am a circle.');
-
-        // Add a polygon
-        var polygon = L.polygon([
-            [51.509, -0.08],
-            [51.503, -0.06],
-            [51.51, -0.047]
-        ]).addTo(map).bindPopup('I am a polygon.');
-
-        // Company coordinates
-        var companyCoordinates = {company_coordinates_js};
-
-        searchButton.addEventListener('click', function() {{
-            var companyName = searchInput.value;
-            console.log('Searching for company:', companyName); // Debugging log
-
-            var coordinates = companyCoordinates[companyName];
-            if (coordinates) {{
-                console.log('Company coordinates:', coordinates); // Debugging log
-                map.setView(coordinates, 15); // Zoom to the company's location
-            }} else {{
-                console.log('Company not found'); // Debugging log
             }}
         }});
-    }});
-</script>
-"""
+    </script>
+    """
 
-m.get_root().html.add_child(folium.Element(search_html))
+    m.get_root().html.add_child(folium.Element(search_html))
 
-# Save the map to an HTML file
-m.save("stakeholders_map.html")
+# Save the map to an HTML file (once, after every layer and script is attached)
+published = save_map(m, "stakeholders_map.html", OUTPUT_MODE)
 print("Map saved successfully! Open 'stakeholders_map.html' in your browser.")
+if published:
+    print(f"Shell {published['shell_bytes']:,} bytes, {published['assets']} data files in {ASSETS_DIR}/ "
+          f"({published['written']} written, {published['reused']} unchanged)")
+print(f"Build cache: {cache_stats_summary()}")
@@ -1,19 +1,33 @@
-import pandas as pd
 import folium
 from folium.plugins import MarkerCluster, HeatMap, Search
+from marker_layer import add_columnar_markers
+from heat_raster import add_heat_raster
+from loader import load_stakeholders
+from dedupe import merge_entities, resolve_entities
+from geocode import geocode_missing
+from sprites import add_sprite_icons, sprite_icon
 
-# Load dataset
-df = pd.read_csv("stakeholders.csv")
+# Marker mode: "folium" builds one Marker per row, "columnar" ships a single
+# columnar payload and templates popups in the browser (use for large registries)
+MARKER_MODE = "columnar"
 
-# Fill NaN values with empty strings to avoid errors
-df = df.fillna("")
+# Heat mode: "points" ships every coordinate to Leaflet.heat, "raster" ships
+# density images precomputed per zoom band (fixed cost whatever the row count)
+HEAT_MODE = "raster"
 
-# Ensure Latitude and Longitude are numeric
-df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
-df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+# Icon mode: "sprites" packs the category icons into one small atlas and
+# markers share one CSS class per category, "files" uses the full-size PNGs
+ICON_MODE = "sprites"
 
-# Drop rows with missing coordinates
-df = df.dropna(subset=["Latitude", "Longitude"])
+# Load dataset (typed, cleaned and cached; rows without coordinates are kept for geocoding)
+df = load_stakeholders("stakeholders.csv", drop_invalid=False)
+
+# One row per company (variant names, phones and emails merged under entity_id)
+df = merge_entities(resolve_entities(df))
+
+# Rows without coordinates are placed from their Office Address (LGA
+# gazetteer); rows that cannot be placed are dropped
+df = geocode_missing(df)
 
 # Define map center
 map_center = [df["Latitude"].mean(), df["Longitude"].mean()]
@@ -27,6 +41,7 @@ icon_mapping = {
     "Processors": "img/proces.png",
     "Fertilizer Company": "img/fert.png",
 }
+sprites = add_sprite_icons(m, icon_mapping) if ICON_MODE == "sprites" else None
 
 # Create marker cluster
 marker_cluster = MarkerCluster().add_to(m)
@@ -35,32 +50,36 @@ marker_cluster = MarkerCluster().add_to(m)
 marker_dict = {}
 
 # Add markers for each stakeholder
-for _, row in df.iterrows():
-    icon_url = icon_mapping.get(row["Category"], "https://cdn-icons-png.flaticon.com/512/684/684908.png")
-
-    # Create the popup content
-    popup_text = f"""
-    <b>Company:</b> {row['Company Name']}<br>
-    <b>Category:</b> {row['Category']}<br>
-    <b>Commodity:</b> {row['Commodity']}<br>
-    <b>Office Address:</b> {row['Office Address']}<br>
-    <b>Contact Person:</b> {row['Contact Person']}<br>
-    <b>Phone:</b> {row['Phone number']}<br>
-    <b>Designation:</b> {row['Designation']}<br>
-    <b>Email/Website:</b> {row['Email/Website']}
-    """
-
-    # Add marker to map with hover effect (tooltip)
-    marker = folium.Marker(
-        location=[row["Latitude"], row["Longitude"]],
-        icon=folium.CustomIcon(icon_url, icon_size=(30, 30)),
-        popup=folium.Popup(popup_text, max_width=300),
-        tooltip=row["Company Name"]  # Tooltip for hover effect
-    )
-    marker_cluster.add_child(marker)
-
-    # Store marker for search
-    marker_dict[row["Company Name"]] = marker
+if MARKER_MODE == "columnar":
+    add_columnar_markers(m, df, target=marker_cluster, icon_mapping=icon_mapping, search_key="Company Name",
+                         sprites=sprites)
+else:
+    for _, row in df.iterrows():
+        icon_url = icon_mapping.get(row["Category"], "https://cdn-icons-png.flaticon.com/512/684/684908.png")
+
+        # Create the popup content
+        popup_text = f"""
+        <b>Company:</b> {row['Company Name']}<br>
+        <b>Category:</b> {row['Category']}<br>
+        <b>Commodity:</b> {row['Commodity']}<br>
+        <b>Office Address:</b> {row['Office Address']}<br>
+        <b>Contact Person:</b> {row['Contact Person']}<br>
+        <b>Phone:</b> {row['Phone number']}<br>
+        <b>Designation:</b> {row['Designation']}<br>
+        <b>Email/Website:</b> {row['Email/Website']}
+        """
+
+        # Add marker to map with hover effect (tooltip)
+        marker = folium.Marker(
+            location=[row["Latitude"], row["Longitude"]],
+            icon=sprite_icon(sprites, row["Category"]) if sprites else folium.CustomIcon(icon_url, icon_size=(30, 30)),
+            popup=folium.Popup(popup_text, max_width=300),
+            tooltip=row["Company Name"]  # Tooltip for hover effect
+        )
+        marker_cluster.add_child(marker)
+
+        # Store marker for search
+        marker_dict[row["Company Name"]] = marker
 
 # Add search functionality using company names
 search = Search(
@@ -72,8 +91,11 @@ search = Search(
 ).add_to(m)
 
 # Add heatmap layer to show density
-heat_data = df[["Latitude", "Longitude"]].values.tolist()
-HeatMap(heat_data, radius=10).add_to(m)
+if HEAT_MODE == "raster":
+    add_heat_raster(m, df, radius=10)
+else:
+    heat_data = df[["Latitude", "Longitude"]].values.tolist()
+    HeatMap(heat_data, radius=10).add_to(m)
 
 # Save the map to an HTML file
 m.save("stakeholders_map.html")
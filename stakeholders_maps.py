@@ -1,62 +1,72 @@
-import pandas as pd
 import folium
 from folium.plugins import MarkerCluster, Search, HeatMap
-import openrouteservice
+from loader import load_stakeholders
+from dedupe import merge_entities, resolve_entities
+from geocode import geocode_missing
+from marker_layer import add_columnar_markers
+from facets import FacetStore, add_facet_layers, normalize_categories
+from sprites import add_sprite_icons
+from routing import HaversineBackend, OpenRouteServiceBackend, add_routes, logistics_matrix, nearest_by_road
+
+# Routing backend: "haversine" estimates road distance offline, "ors" calls
+# openrouteservice (key in ORS_API_KEY), a URL points at a compatible server
+# such as the local stand-in (python routing.py serve)
+ROUTING_BACKEND = "haversine"
 
 # Load dataset
-df = pd.read_csv("stakeholders.csv")  # Ensure your file has correct headers
+df = load_stakeholders("stakeholders.csv", drop_invalid=False)  # Validates headers
+
+# One row per company (variant names, phones and emails merged under entity_id)
+df = merge_entities(resolve_entities(df))
+
+# Rows without coordinates are placed from their Office Address (LGA gazetteer);
+# rows that cannot be placed are dropped
+df = geocode_missing(df)
+
+# One spelling per category ("Aggregators" and "Aggregator" are the same)
+df["Category"] = normalize_categories(df["Category"])
 
 # Define map center (average coordinates)
 map_center = [df['Latitude'].mean(), df['Longitude'].mean()]
 m = folium.Map(location=map_center, zoom_start=6, control_scale=True)
 
-# Define icon mapping for categories (Custom Icons)
+# Define icon mapping for categories (local icons packed into one sprite
+# atlas, so the page needs no icon CDN; other categories get a default dot)
 icon_mapping = {
-    "Contract Farming": "https://cdn-icons-png.flaticon.com/512/1995/1995617.png",
-    "Seeds Company": "https://cdn-icons-png.flaticon.com/512/1673/1673122.png",
-    "Aggregators": "https://cdn-icons-png.flaticon.com/512/3063/3063818.png",
-    "Processors": "https://cdn-icons-png.flaticon.com/512/2912/2912106.png",
-    "Fertilizer Company": "https://cdn-icons-png.flaticon.com/512/1903/1903162.png",
+    "Contract Farming": "img/contract.png",
+    "Seeds Company": "img/seeds.png",
+    "Aggregator": "img/aggreg.png",
+    "Processors": "img/proces.png",
+    "Fertilizer Company": "img/fert.png",
 }
+sprites = add_sprite_icons(m, icon_mapping)
 
-# Create Feature Groups for each category
-categories = df["Category"].unique()
-category_layers = {cat: folium.FeatureGroup(name=cat) for cat in categories}
+# Faceted store: categories, commodities ("Maize, Rice & Ginger" counts for
+# each) and LGAs dictionary encoded, with one bitset per value
+store = FacetStore(df)
 
 # Initialize Marker Cluster
-marker_cluster = MarkerCluster()
-
-# Add markers to the map
-for _, row in df.iterrows():
-    icon_url = icon_mapping.get(row['Category'], 'https://cdn-icons-png.flaticon.com/512/684/684908.png')
-    icon = folium.CustomIcon(icon_url, icon_size=(30, 30))
-
-    popup_text = f"""
-    <b>Company:</b> {row['Company Name']}<br>
-    <b>Category:</b> {row['Category']}<br>
-    <b>Commodity:</b> {row['Commodity']}<br>
-    <b>Office Address:</b> {row['Office Address']}<br>
-    <b>Contact Person:</b> {row['Contact Person']}<br>
-    <b>Phone:</b> {row['Phone number']}<br>
-    <b>Designation:</b> {row['Designation']}<br>
-    <b>Email/Website:</b> {row['Email/Website']}
-    """
-
-    marker = folium.Marker(
-        location=[row['Latitude'], row['Longitude']],
-        icon=icon,
-        popup=folium.Popup(popup_text, max_width=300)
-    )
-    
-    marker_cluster.add_child(marker)
-    category_layers[row['Category']].add_child(marker)
-
-# Add Clustered Markers to the Map
-m.add_child(marker_cluster)
-
-# Add category layers to the map
-for layer in category_layers.values():
-    m.add_child(layer)
+marker_cluster = MarkerCluster().add_to(m)
+
+# Every marker is built once in the browser from one columnar payload
+marker_layer = add_columnar_markers(m, df, target=marker_cluster, icon_mapping=icon_mapping, sprites=sprites,
+                                    search_key="Company Name")
+
+# One layer-control toggle per category and per commodity; toggles only show
+# or hide the shared markers instead of holding their own copies
+add_facet_layers(m, store, marker_layer, marker_cluster)
+
+# Logistics routes: nearest processor per aggregator and nearest fertilizer
+# supplier per contract farm (road distances are cached in .cache/routes)
+if ROUTING_BACKEND == "haversine":
+    routing_backend = HaversineBackend()
+elif ROUTING_BACKEND == "ors":
+    routing_backend = OpenRouteServiceBackend()
+else:
+    routing_backend = OpenRouteServiceBackend(base_url=ROUTING_BACKEND)
+logistics = logistics_matrix(df, backend=routing_backend)
+if not logistics.empty:
+    add_routes(m, nearest_by_road(logistics), backend=routing_backend, name="Logistics Routes")
 
 # Add Layer Control
 folium.LayerControl(collapsed=False).add_to(m)
@@ -81,16 +91,3 @@ df.to_csv("filtered_stakeholders.csv", index=False)
 # Save and display the map
 m.save("stakeholders_map.html")
 print("Map has been saved as stakeholders_map.html")
-
-# OPTIONAL: Route Calculation (Example: Between First 2 Locations)
-client = openrouteservice.Client(key='YOUR_API_KEY')  # Get API key from openrouteservice.org
-if len(df) >= 2:
-    coords = [(df.iloc[0]['Longitude'], df.iloc[0]['Latitude']), (df.iloc[1]['Longitude'], df.iloc[1]['Latitude'])]
-    route = client.directions(coords, profile='driving-car', format='geojson')
-
-    folium.PolyLine(
-        locations=[(pt[1], pt[0]) for pt in route['routes'][0]['geometry']['coordinates']],
-        color="blue",
-        weight=5,
-        opacity=0.7
-    ).add_to(m)
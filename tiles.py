@@ -0,0 +1,359 @@
+import argparse
+import json
+import math
+import os
+import shutil
+from collections import defaultdict
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+from jinja2 import Template
+from shapely.geometry import mapping, shape
+
+from boundaries import load_boundaries
+from marker_layer import POPUP_FIELDS
+
+TILES_DIR = "tiles"
+
+# "js" tiles wrap the GeoJSON in a callback so pages opened from file:// can
+# load them with <script> tags (browsers block fetch() on file:// URLs)
+TILE_FORMATS = ("js", "geojson")
+
+
+def tile_xy(lat, lng, z):
+    """Vectorized slippy-map tile indices for arrays of coordinates."""
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511))
+    n = 2 ** z
+    x = np.floor((np.asarray(lng, dtype=float) + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def tile_bounds(x, y, z):
+    """(west, south, east, north) of a tile in degrees."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def pixel_degrees(z, tile_size=256):
+    # Width of one screen pixel in degrees of longitude at zoom z
+    return 360.0 / (tile_size * 2 ** z)
+
+
+def tile_range(xs, ys):
+    """[x0, y0, x1, y1]: the tile index range spanned by arrays of tile indices."""
+    return [int(np.min(xs)), int(np.min(ys)), int(np.max(xs)), int(np.max(ys))]
+
+
+def write_tile(out_dir, layer, z, x, y, collection, fmt="js"):
+    if fmt not in TILE_FORMATS:
+        raise ValueError(f"Unknown tile format: {fmt}")
+    directory = os.path.join(out_dir, layer, str(z), str(x))
+    os.makedirs(directory, exist_ok=True)
+    body = json.dumps(collection, separators=(",", ":"), ensure_ascii=False)
+    if fmt == "js":
+        body = f'stakeholderTile("{layer}/{z}/{x}/{y}",{body});'
+    with open(os.path.join(directory, f"{y}.{fmt}"), "w", encoding="utf-8") as f:
+        f.write(body)
+
+
+def write_point_tiles(df, out_dir=TILES_DIR, zooms=range(8, 15), layer="stakeholders",
+                      columns=None, fmt="js"):
+    """Bucket stakeholder points into per-zoom tiles.
+
+    Returns the tile range written per zoom, ``{z: [x0, y0, x1, y1]}``
+    (``TiledGeoJson(bounds=...)``); zooms without points are left out.
+    """
+    shutil.rmtree(os.path.join(out_dir, layer), ignore_errors=True)
+    if columns is None:
+        columns = [col for _, col in POPUP_FIELDS if col in df.columns]
+
+    lat = df["Latitude"].to_numpy(dtype=float)
+    lng = df["Longitude"].to_numpy(dtype=float)
+    props = df[columns].fillna("").astype(str).to_dict("records")
+    bounds = {}
+
+    for z in zooms:
+        precision = max(5, int(math.ceil(math.log10(2 ** z))) + 1)
+        xs, ys = tile_xy(lat, lng, z)
+        order = np.lexsort((ys, xs))
+        keys = np.stack([xs[order], ys[order]], axis=1)
+        # Split the sorted rows wherever the tile changes
+        starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        groups = np.split(order, starts)
+        for rows in groups:
+            if len(rows) == 0:
+                continue
+            features = [{
+                "type": "Feature",
+                "id": int(i),
+                "properties": props[i],
+                "geometry": {"type": "Point", "coordinates": [round(lng[i], precision), round(lat[i], precision)]},
+            } for i in rows]
+            write_tile(out_dir, layer, z, int(xs[rows[0]]), int(ys[rows[0]]),
+                       {"type": "FeatureCollection", "features": features}, fmt)
+        if len(lat):
+            bounds[z] = tile_range(xs, ys)
+
+    return bounds
+
+
+def clip_to_tile(geometry, x, y, z, buffer=1 / 64):
+    """Clip a geometry to tile x/y/z, padded by ``buffer`` of the tile size."""
+    west, south, east, north = tile_bounds(x, y, z)
+    pad_x, pad_y = (east - west) * buffer, (north - south) * buffer
+    return shapely.clip_by_rect(geometry, west - pad_x, south - pad_y, east + pad_x, north + pad_y)
+
+
+def write_boundary_tiles(path, out_dir=TILES_DIR, zooms=range(6, 13), layer=None,
+                         properties=None, fmt="js", buffer=1 / 64):
+    """Cut boundary outlines into per-zoom tiles.
+
+    Each zoom uses boundaries simplified to about one pixel at that zoom, and
+    outlines are clipped as lines so tile edges never show up as borders.
+    Returns the tile range written per zoom, as ``write_point_tiles`` does.
+    """
+    if layer is None:
+        layer = os.path.splitext(os.path.basename(path))[0]
+    shutil.rmtree(os.path.join(out_dir, layer), ignore_errors=True)
+    bounds = {}
+
+    for z in zooms:
+        collection = load_boundaries(path, tolerance=pixel_degrees(z), properties=properties)
+        tiles = defaultdict(list)
+        for feature in collection["features"]:
+            if feature["geometry"] is None:
+                continue
+            outline = shape(feature["geometry"]).boundary
+            west, south, east, north = outline.bounds
+            x0, y1 = tile_xy(south, west, z)
+            x1, y0 = tile_xy(north, east, z)
+            for x in range(int(x0), int(x1) + 1):
+                for y in range(int(y0), int(y1) + 1):
+                    clipped = clip_to_tile(outline, x, y, z, buffer)
+                    if clipped.is_empty:
+                        continue
+                    tiles[(x, y)].append({
+                        "type": "Feature",
+                        "properties": feature["properties"],
+                        "geometry": mapping(clipped),
+                    })
+        for (x, y), features in tiles.items():
+            write_tile(out_dir, layer, z, x, y, {"type": "FeatureCollection", "features": features}, fmt)
+        if tiles:
+            bounds[z] = tile_range(*np.array(list(tiles)).T)
+
+    return bounds
+
+
+class TiledGeoJson(folium.map.Layer):
+    """Overlay that loads only the z/x/y GeoJSON tiles covering the viewport.
+
+    With ``bounds`` (the per-zoom tile ranges returned by the tile writers)
+    only tiles inside the written range are requested, and none at zooms
+    that have no tiles, so a zoomed-out view costs a handful of requests
+    rather than one per tile on screen.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var map = {{ this._parent.get_name() }};
+            var options = {{ this.options }};
+            var group = L.featureGroup();
+            var loaded = {};
+            var visible = {};
+            var generation = 0;
+
+            // Shared JSONP registry for "js" tiles
+            window.stakeholderTileCallbacks = window.stakeholderTileCallbacks || {};
+            window.stakeholderTile = window.stakeholderTile || function(key, data) {
+                var callback = window.stakeholderTileCallbacks[key];
+                delete window.stakeholderTileCallbacks[key];
+                if (callback) { callback(data); }
+            };
+
+            function escapeHtml(s) {
+                return String(s).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            function popupHtml(props) {
+                return options.popupFields.map(function(f) {
+                    return "<b>" + f[0] + ":</b> " + escapeHtml(props[f[1]] || "");
+                }).join("<br>");
+            }
+
+            function toLayer(data) {
+                return L.geoJSON(data, {
+                    style: function() { return options.style; },
+                    pointToLayer: function(feature, latlng) {
+                        var color = options.colors[feature.properties[options.colorBy]] || options.style.color;
+                        return L.circleMarker(latlng, {radius: 6, color: color, fillColor: color, fillOpacity: 0.8, weight: 1});
+                    },
+                    onEachFeature: function(feature, layer) {
+                        if (options.popupFields.length) {
+                            layer.bindPopup(function() { return popupHtml(feature.properties); }, {maxWidth: 300});
+                        }
+                        if (options.tooltip && feature.properties[options.tooltip]) {
+                            layer.bindTooltip(String(feature.properties[options.tooltip]));
+                        }
+                    }
+                });
+            }
+
+            function load(key, done) {
+                var url = options.url + key + "." + options.format;
+                if (options.format === "js") {
+                    window.stakeholderTileCallbacks[options.layer + "/" + key] = done;
+                    var script = document.createElement("script");
+                    script.src = url;
+                    script.onerror = function() { done(null); };
+                    document.head.appendChild(script);
+                } else {
+                    fetch(url).then(function(r) { return r.ok ? r.json() : null; })
+                        .then(done, function() { done(null); });
+                }
+            }
+
+            function update() {
+                if (!map.hasLayer(group)) { return; }
+                var z = Math.max(options.minZoom, Math.min(options.maxZoom, Math.round(map.getZoom())));
+                if (map.getZoom() < options.minZoom - options.zoomSlack) { z = null; }
+                var wanted = {};
+                // Tile range written at this zoom, if known
+                var range = z !== null && options.bounds ? options.bounds[z] : null;
+                if (options.bounds && !range) { z = null; }
+                if (z !== null) {
+                    var bounds = map.getBounds();
+                    var nw = map.project(bounds.getNorthWest(), z).divideBy(256).floor();
+                    var se = map.project(bounds.getSouthEast(), z).divideBy(256).floor();
+                    if (range) {
+                        nw.x = Math.max(nw.x, range[0]); nw.y = Math.max(nw.y, range[1]);
+                        se.x = Math.min(se.x, range[2]); se.y = Math.min(se.y, range[3]);
+                    }
+                    for (var x = nw.x; x <= se.x; x++) {
+                        for (var y = nw.y; y <= se.y; y++) {
+                            wanted[z + "/" + x + "/" + y] = true;
+                        }
+                    }
+                }
+                Object.keys(visible).forEach(function(key) {
+                    if (!wanted[key]) { group.removeLayer(visible[key]); delete visible[key]; }
+                });
+                Object.keys(wanted).forEach(function(key) {
+                    if (visible[key]) { return; }
+                    if (key in loaded) {
+                        if (loaded[key]) { visible[key] = loaded[key]; group.addLayer(loaded[key]); }
+                        return;
+                    }
+                    loaded[key] = null;
+                    var requested = generation;
+                    load(key, function(data) {
+                        if (requested !== generation) { return; }
+                        loaded[key] = data ? toLayer(data) : false;
+                        update();
+                    });
+                });
+            }
+
+            // Drop every loaded tile and fetch the visible ones again
+            group.reload = function() {
+                Object.keys(visible).forEach(function(key) { group.removeLayer(visible[key]); });
+                visible = {};
+                loaded = {};
+                generation++;
+                update();
+            };
+
+            map.on("moveend", update);
+            group.on("add", update);
+            {%- if this.show %}
+            group.addTo(map);
+            {%- endif %}
+            return group;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, name=None, tiles_url=TILES_DIR, min_zoom=6, max_zoom=12, fmt="js",
+                 style=None, colors=None, color_by="Category", popup_fields=None, tooltip=None,
+                 zoom_slack=0, show=True, bounds=None):
+        super().__init__(name=name or layer, overlay=True, control=True, show=show)
+        self._name = "TiledGeoJson"
+        self.options = json.dumps({
+            "layer": layer,
+            "url": f"{tiles_url.rstrip('/')}/{layer}/",
+            "format": fmt,
+            "minZoom": min_zoom,
+            "maxZoom": max_zoom,
+            "zoomSlack": zoom_slack,
+            "style": style or {"color": "green", "weight": 1, "fill": False},
+            "colors": colors or {},
+            "colorBy": color_by,
+            "popupFields": popup_fields or [],
+            "tooltip": tooltip,
+            "bounds": bounds,
+        })
+
+
+def use_local_leaflet(m, leaflet_dir="leaflet"):
+    """Point a folium map at the bundled Leaflet copy so it works offline."""
+    m.default_js = [("leaflet", f"{leaflet_dir}/leaflet.js")]
+    m.default_css = [("leaflet_css", f"{leaflet_dir}/leaflet.css")]
+    return m
+
+
+def build_offline_map(df, out_html="stakeholders_tiles.html", out_dir=TILES_DIR, fmt="js",
+                      basemap="leaflet/{z}/{x}/{y}.png", point_zooms=range(8, 15), boundary_zooms=range(6, 13)):
+    """Write stakeholder and boundary tiles plus an offline page that loads them."""
+    state = write_boundary_tiles("kaduna.geojson", out_dir, boundary_zooms, layer="state", fmt=fmt)
+    lga = write_boundary_tiles("lga_boundaries.geojson", out_dir, boundary_zooms, layer="lga",
+                               properties=["lganame", "lgacode"], fmt=fmt)
+    points = write_point_tiles(df, out_dir, point_zooms, fmt=fmt)
+
+    m = folium.Map(
+        location=[df["Latitude"].mean(), df["Longitude"].mean()],
+        zoom_start=8,
+        tiles=basemap,
+        attr="Map data &copy; OpenStreetMap contributors",
+    )
+    use_local_leaflet(m)
+
+    boundary_max = max(boundary_zooms)
+    point_max = max(point_zooms)
+    TiledGeoJson("state", "State Boundary", out_dir, min(boundary_zooms), boundary_max, fmt,
+                 style={"color": "blue", "weight": 2, "fill": False}, zoom_slack=6, bounds=state).add_to(m)
+    TiledGeoJson("lga", "LGA Boundaries", out_dir, min(boundary_zooms), boundary_max, fmt,
+                 style={"color": "green", "weight": 1, "fill": False}, tooltip="lganame", zoom_slack=6,
+                 bounds=lga).add_to(m)
+    TiledGeoJson("stakeholders", "Stakeholders", out_dir, min(point_zooms), point_max, fmt,
+                 popup_fields=POPUP_FIELDS, tooltip="Company Name", bounds=points).add_to(m)
+
+    folium.LayerControl().add_to(m)
+
+    m.save(out_html)
+    return out_html
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-tile boundaries and stakeholders for offline use.")
+    parser.add_argument("--csv", default="stakeholders.csv")
+    parser.add_argument("--out-dir", default=TILES_DIR)
+    parser.add_argument("--html", default="stakeholders_tiles.html")
+    parser.add_argument("--format", choices=TILE_FORMATS, default="js")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
+    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+    df = df.dropna(subset=["Latitude", "Longitude"])
+
+    build_offline_map(df, args.html, args.out_dir, args.format)
+    print(f"Tiles written to '{args.out_dir}/'. Open '{args.html}' in your browser.")